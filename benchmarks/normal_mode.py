@@ -0,0 +1,136 @@
+r"""Cost of normal-mode keystrokes, in µs and bytes allocated per key.
+
+1. Finding the command a key extends, with the command trie, compared with the previous lookup that built the name of
+   the command and caught the `ValueError` of `ActionEnum` when it did not exist (e.g. `d` then `w`).
+2. `EditorStateManger.normal_buffer` alone, for keys that only extend a command (`d`, `i`, counts) and for whole
+   commands (`x`, `diw`, `3x`).
+3. `IOFilter.filter_input` for the same commands, which also applies them to the line.
+
+Bytes allocated is the peak of memory traced by `tracemalloc` while handling a key, above what was in use before it,
+so it also counts objects that are freed before the key is handled. What `tracemalloc` reports for calling a function
+that does nothing is subtracted.
+
+Usage: python benchmarks/normal_mode.py [--keys N]
+"""
+import os
+import time
+import argparse
+import tracemalloc
+from iridescent.keys import KEY
+from iridescent.screen import screen
+from iridescent.editor import EditorStateManger
+from iridescent.filters import IOFilter, DebugLogger
+from iridescent.history import HistoryManager
+from iridescent.vim_actions import ActionEnum, COMMAND_TRIE
+
+LINE = b'set ^MyGlobal(12345,"name")="Some value with a bit of text in it"'
+
+
+def _exception_lookup(command, key):
+    try:
+        return ActionEnum(command.value + key)
+    except ValueError:
+        return None
+
+
+def _trie_lookup(node, key):
+    return node.children.get(key)
+
+
+def _allocated(feed, keys):
+    allocated = 0
+    tracemalloc.start()
+    for key in keys:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        feed(key)
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return allocated / len(keys)
+
+
+def _nothing(key):
+    return None
+
+
+def _measure(feed, keys):
+    r"""Return the µs and bytes allocated per key of feeding ``keys`` to ``feed``"""
+    start = time.perf_counter()
+    for key in keys:
+        feed(key)
+    elapsed = time.perf_counter() - start
+    return elapsed / len(keys) * 1e6, _allocated(feed, keys) - _allocated(_nothing, keys)
+
+
+def bench_lookup(n):
+    results = {}
+    command, node = ActionEnum.d, COMMAND_TRIE[b"d"]
+    for name, lookup in [("exception lookup", lambda key: _exception_lookup(command, key)),
+                         ("command trie", lambda key: _trie_lookup(node, key))]:
+        results[name] = _measure(lookup, [b"w"] * n)
+    return results
+
+
+class _Filter:
+    current_line = LINE
+    cursor_pos = 0
+
+
+def bench_normal_buffer(n):
+    esm = EditorStateManger(_Filter())
+    esm.set_normal()
+    results = {}
+    for name, keys in [("prefix keys (d, i, 3)", [b"d", b"i", b"3"]), ("x", [b"x"]), ("diw", [b"d", b"i", b"w"]),
+                       ("3x", [b"3", b"x"])]:
+        sequence = keys * (n // len(keys))
+
+        def feed(key):
+            esm.normal_buffer(key, LINE, 10)
+            if name.startswith("prefix") and key == b"3":  # start over, without a call that would be measured
+                esm._node, esm._count = None, 0
+
+        results[name] = _measure(feed, sequence)
+    return results
+
+
+def bench_filter_input(n):
+    screen.fd = os.open(os.devnull, os.O_WRONLY)  # cursor shapes drawn when switching modes
+    io_filter = IOFilter(None, DebugLogger(None), history_manager=HistoryManager(None))
+    io_filter.filter_output(b"\r\nUSER>")
+    results = {}
+    for name, keys in [("x", [b"x"]), ("diw", [b"d", b"i", b"w"]), ("3x", [b"3", b"x"])]:
+        sequence = keys * (n // len(keys))
+
+        def feed(key):
+            if len(io_filter.current_line) < 10:  # keep something to delete
+                io_filter.filter_input(KEY.ESCAPE)
+                io_filter.filter_input(b"A")
+                io_filter.filter_input(LINE)
+                io_filter.filter_input(KEY.ESCAPE)
+                io_filter.filter_input(b"0")
+            io_filter.filter_input(key)
+
+        results[name] = _measure(feed, sequence)
+    return results
+
+
+def _report(results):
+    for name, (us, allocated) in results.items():
+        print(f"  {name:<24} {us:6.2f} µs/key  {allocated:8.1f} bytes/key")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=30000, help="Number of keys per measurement")
+    opt = parser.parse_args()
+
+    print("Finding the command `w` extends after `d`:")
+    _report(bench_lookup(opt.keys))
+    print("EditorStateManger.normal_buffer:")
+    _report(bench_normal_buffer(opt.keys))
+    print("IOFilter.filter_input:")
+    _report(bench_filter_input(opt.keys // 10))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+r"""Throughput of the output path, in MB/s.
+
+1. `IOFilter.filter_output` alone, on chunks of bulk output, compared with passing the chunks through untouched.
+2. The whole output pump (read from the child's pty, filter, write to the terminal), compared with a raw pump that
+   reads 1000 bytes at a time without filtering, which is what `pexpect.interact()` does for a plain `iris terminal`.
+
+Usage: python benchmarks/output_throughput.py [--size-mb N]
+"""
+import os
+import sys
+import time
+import argparse
+from iridescent.filters import IOFilter, DebugLogger
+from iridescent.history import HistoryManager
+from iridescent.scrollback import ScrollbackStore
+from iridescent.spawn import IrisSpawn, READ_SIZE
+
+# a line of typical `zwrite ^Global` output
+LINE = b'^MyGlobal(12345,"name")="Some value with a bit of text in it"\r\n'
+
+
+def _chunks(total, chunk_size):
+    chunk = (LINE * (chunk_size // len(LINE) + 1))[:chunk_size]
+    return [chunk] * (total // chunk_size)
+
+
+def bench_filter(total, chunk_size):
+    io_filter = IOFilter(None, DebugLogger(None), history_manager=HistoryManager(None))
+    chunks = _chunks(total, chunk_size)
+    results = {}
+    with ScrollbackStore() as scrollback:
+        scrolled_filter = IOFilter(None, DebugLogger(None), history_manager=HistoryManager(None), scrollback=scrollback)
+        for name, f in [("passthrough", lambda c: c), ("filter_output", io_filter.filter_output),
+                        ("with --scrollback", scrolled_filter.filter_output)]:
+            start = time.perf_counter()
+            for chunk in chunks:
+                f(chunk)
+            results[name] = total / (time.perf_counter() - start) / 1e6
+    return results
+
+
+def bench_pump(total, read_size, output_filter):
+    child = IrisSpawn(sys.executable, ["-c", f"import sys; sys.stdout.buffer.write({LINE!r} * {total // len(LINE)})"],
+                      read_size=read_size)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    received = 0
+    start = time.perf_counter()
+    try:
+        while True:
+            try:
+                data = child._spawn__interact_read(child.child_fd)
+            except OSError:
+                break
+            if not data:
+                break
+            received += len(data)
+            if output_filter:
+                data = output_filter(data)
+            os.write(devnull, data)
+    finally:
+        elapsed = time.perf_counter() - start
+        os.close(devnull)
+        child.close()
+    return received / elapsed / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=64, help="Amount of output to push through, in MB")
+    opt = parser.parse_args()
+    total = opt.size_mb * 1000 * 1000
+
+    print("filter_output on in-memory chunks:")
+    for chunk_size in [1000, READ_SIZE]:
+        results = bench_filter(total, chunk_size)
+        print(f"  {chunk_size:>6}-byte chunks: "
+              + ", ".join(f"{name} {mbps:,.0f} MB/s" for name, mbps in results.items()))
+
+    print("Output pump from a child process:")
+    raw = bench_pump(total, 1000, None)
+    print(f"  raw pump, 1000-byte reads:       {raw:,.1f} MB/s")
+    io_filter = IOFilter(None, DebugLogger(None), history_manager=HistoryManager(None))
+    filtered = bench_pump(total, READ_SIZE, io_filter.filter_output)
+    print(f"  iridescent, {READ_SIZE}-byte reads:   {filtered:,.1f} MB/s ({filtered / raw - 1:+.1%} vs raw)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import re
+import sys
+import pexpect as pe
+from .spawn import IrisSpawn, login, READ_SIZE
+from .filters import PROMPT_REGEX
+
+# IRIS reports errors at the beginning of a line, e.g. `<UNDEFINED>zMain+1^MyRoutine *x` or `<SYNTAX>`
+ERROR_REGEX = re.compile(rb"^<[A-Z][A-Z0-9 ]*>", re.MULTILINE)
+
+
+class BatchError(Exception):
+    pass
+
+
+class BatchSession:
+    r"""Runs ObjectScript commands in `iris terminal` without a human, sending each command as soon as the prompt of
+    the previous one shows up.
+
+    Output is read in large chunks and streamed line by line to ``out`` (a binary file object), without the echo of the
+    command and the prompt. Only the last, incomplete line is held back, since it may turn out to be the prompt.
+    """
+
+    def __init__(self, instance, username=None, password=None, timeout=None):
+        self.instance = instance
+        try:
+            self.child = IrisSpawn(f"iris terminal {instance}", encoding=None, timeout=timeout)
+        except pe.ExceptionPexpect as e:  # e.g. `iris` is not on $PATH
+            raise BatchError(str(e))
+        try:
+            self.child.setecho(False)
+            login(self.child, username, password)
+            self._read_until_prompt(None, skip_echo=False)
+        except pe.EOF:  # e.g. the instance does not exist
+            self.child.close()
+            raise BatchError(f"iris terminal {instance} exited before its first prompt")
+        except pe.TIMEOUT:
+            self.child.close()
+            raise BatchError(f"Timed out logging in to {instance}")
+        except BatchError:
+            self.child.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.child.isalive():
+            try:
+                self.child.send("halt\r")
+                self.child.expect(pe.EOF, timeout=5)
+            except (pe.TIMEOUT, OSError):
+                pass
+        self.child.close()
+
+    def _read_until_prompt(self, out, skip_echo=True):
+        r"""Stream the output up to the next prompt into ``out``. Return whether an error was reported."""
+        pending, self.child.buffer = self.child.buffer, b""  # output already read by `expect` during login
+        failed = False
+        while True:
+            end = pending.rfind(b"\n")
+            if end == -1:
+                lines = b""
+            else:
+                lines, pending = pending[:end + 1], pending[end + 1:]
+            if skip_echo and lines:
+                skip_echo = False
+                lines = lines[lines.find(b"\n") + 1:]
+            if lines:
+                failed = failed or bool(ERROR_REGEX.search(lines.replace(b"\r", b"")))
+                if out is not None:
+                    out.write(lines.replace(b"\r\n", b"\n"))
+                    out.flush()
+            if not skip_echo and PROMPT_REGEX.fullmatch(pending):
+                return failed
+
+            try:
+                pending += self.child.read_nonblocking(READ_SIZE, self.child.timeout)
+            except pe.EOF:
+                raise BatchError(f"iris terminal {self.instance} exited unexpectedly")
+            except pe.TIMEOUT:
+                raise BatchError(f"Timed out waiting for a prompt from {self.instance}")
+
+    def run(self, command, out):
+        r"""Run one command, streaming its output to ``out``. Return whether IRIS reported an error."""
+        self.child.send(command + "\r")
+        return self._read_until_prompt(out)
+
+
+def read_commands(f):
+    r"""Commands of a script, one per line. Blank lines are skipped."""
+    for line in f:
+        command = line.rstrip("\r\n")
+        if command.strip():
+            yield command
+
+
+def run_commands(session, commands, out, keep_going=False):
+    r"""Run ``commands`` in ``session``. Stops at the first command that reports an error, unless ``keep_going``.
+    Returns 1 if any command reported an error, 0 otherwise."""
+    status = 0
+    for command in commands:
+        if session.run(command, out):
+            status = 1
+            if not keep_going:
+                break
+    return status
+
+
+def run_script(instance, commands, out, username=None, password=None, timeout=None, keep_going=False):
+    r"""Run ``commands`` on ``instance``.
+
+    Returns the exit status: 0 on success, 1 if any command reported an error, 2 if the session failed.
+    """
+    try:
+        with BatchSession(instance, username, password, timeout) as session:
+            return run_commands(session, commands, out, keep_going)
+    except BatchError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+
+def open_commands(opt):
+    r"""The commands given with `--command`, or else the lines of the `--run` script"""
+    if opt.command:
+        return opt.command
+    f = sys.stdin if opt.run == "-" else open(opt.run)
+    with f:
+        return list(read_commands(f))
+
+
+def main(opt, username=None, password=None):
+    commands = open_commands(opt)
+    out = open(opt.run_output, "ab") if opt.run_output else sys.stdout.buffer
+    try:
+        return run_script(opt.instance, commands, out, username, password, opt.timeout, opt.keep_going)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
@@ -18,9 +18,71 @@ _parser.add_argument("--log-path", "-l", type=str, help="Location of input and o
 _parser.add_argument("--debug-path", "-d", type=str, help="Location of debugging outputs")
 _parser.add_argument("--history-path", "-H", type=str, default=default_history,
                      help="Location of history file. Defaults to ~/.iris_history")
+_parser.add_argument("--ingest-rules", type=str, metavar="PATH", default=None,
+                     help="Location of the rules deciding what is stored in history. "
+                          "Defaults to ~/.iridescent/ingest.json")
+_parser.add_argument("--prefix-search", action="store_true",
+                     help="When the current line is not empty, <Up>/<Down> only recall history entries "
+                          "starting with it")
+_parser.add_argument("--autosuggest", action="store_true",
+                     help="Show the history entry that completes the current line after the cursor; "
+                          "accept it with <Right>")
+_parser.add_argument("--completion", action="store_true",
+                     help="Complete commands, functions, routines, classes and globals with <Tab>")
+_parser.add_argument("--frecency", action="store_true",
+                     help="Recall and search history by frecency (frequency and recency) rather than recency")
+_parser.add_argument("--history-scope", choices=["global", "namespace"], default="global",
+                     help="Recall and search the history of all namespaces (global), or only the entries typed in "
+                          "the namespace of the prompt. Toggle with <Ctrl>n in normal mode. Defaults to global")
+_parser.add_argument("--local-edit", action="store_true",
+                     help="Edit the line locally and only send it to IRIS on <Enter>, so that typing does not wait "
+                          "for IRIS to echo each key")
+_parser.add_argument("--predict", choices=["auto", "always", "never"], default="never",
+                     help="Draw typed characters and cursor motions before IRIS echoes them: always, or (auto) only "
+                          "when the echo takes over 30 ms. Defaults to never")
+_parser.add_argument("--escape-timeout", type=float, default=25, metavar="MS",
+                     help="Time to wait for the rest of a key after a lone <Esc>, in milliseconds. Defaults to 25")
+_parser.add_argument("--scrollback", action="store_true",
+                     help="Keep a searchable copy of the session output; search it with <Ctrl>f in normal mode")
+_parser.add_argument("--scrollback-size", type=int, default=64, metavar="MIB",
+                     help="Amount of output kept by --scrollback, in MiB. Defaults to 64")
+_parser.add_argument("--metrics", type=str, metavar="PATH",
+                     help="Record latency histograms and byte counts, and write them to PATH in the Prometheus text "
+                          "format on SIGUSR1 and at exit")
+_parser.add_argument("--metrics-interval", type=float, default=0, metavar="SECONDS",
+                     help="Also write the metrics every SECONDS seconds")
+_parser.add_argument("--profile", type=str, metavar="OUT",
+                     help="Profile the handling of keys, output and history, and write OUT.pstats and OUT.collapsed "
+                          "at exit")
+_parser.add_argument("--profile-mode", choices=["sample", "cprofile"], default="sample",
+                     help="Use a sampling profiler (default), or cProfile scoped to the profiled calls")
+_parser.add_argument("--trace", type=str, metavar="PATH",
+                     help="Append timestamped events (keys, handlers, output, prompts, history searches) to PATH "
+                          "as JSON lines")
+_parser.add_argument("--run", type=str, metavar="SCRIPT",
+                     help="Run the commands in SCRIPT (one per line, `-` for stdin) without interaction and exit. "
+                          "Exits with status 1 if IRIS reports an error")
+_parser.add_argument("--command", "-c", type=str, action="append", metavar="COMMAND",
+                     help="Like --run, with COMMAND as the script. Can be given several times")
+_parser.add_argument("--run-output", type=str, metavar="PATH", help="Append the output of --run to PATH, not stdout")
+_parser.add_argument("--keep-going", action="store_true",
+                     help="With --run, run the remaining commands after a command reports an error")
+_parser.add_argument("--timeout", type=float, default=None, metavar="SECONDS",
+                     help="With --run, seconds to wait for output from IRIS before giving up. Defaults to no limit")
+_parser.add_argument("--fanout", type=str, metavar="INSTANCES",
+                     help="Run the --run script or --command on each of the comma-separated INSTANCES concurrently, "
+                          "and print the output of each")
+_parser.add_argument("--jobs", "-j", type=int, default=8, help="With --fanout, number of concurrent sessions")
+_parser.add_argument("--report", type=str, metavar="PATH",
+                     help="With --fanout, write the output, exit status and duration of each instance to PATH as JSON")
 opt = _parser.parse_args()
 
-if opt.instance is None:
+if opt.fanout and not (opt.run or opt.command):
+    _parser.error("--fanout requires --run or --command")
+if opt.jobs < 1:
+    _parser.error("--jobs must be at least 1")
+
+if opt.instance is None and not opt.fanout:
     print(
         "Please specify instance name using\n"
         f"\t{sys.argv[0]} <instance>\n"
@@ -29,7 +91,7 @@ if opt.instance is None:
     sys.exit(1)
 
 username, password = _fetch_credentials()
-if (not username or not password) and (opt.log_path or opt.debug_path):
+if (not username or not password) and (opt.log_path or opt.debug_path or opt.trace):
     yn = input(
         "Credentials are not specified in environment variables $IRIS_USERNAME and $IRIS_PASSWORD.\n"
         "Consider specifying those or turn off logging. Otherwise, your credentials might be logged.\n"
@@ -1,4 +1,5 @@
 from enum import Enum
+from .screen import screen
 
 
 class FgColor(Enum):
@@ -17,11 +18,11 @@ class FgColor(Enum):
         return self.value.encode()
 
     def set(self):
-        print(self.value, end="", flush=True)
+        screen.queue(self.bvalue)
 
     @staticmethod
     def reset():
-        print(FgColor.RESET.value, end="", flush=True)
+        screen.queue(FgColor.RESET.bvalue)
 
 
 class BgColor(Enum):
@@ -40,17 +41,20 @@ class BgColor(Enum):
         return self.value.encode()
 
     def set(self):
-        print(self.value, end="", flush=True)
+        screen.queue(self.bvalue)
 
     @staticmethod
     def reset():
-        print(BgColor.RESET.value, end="", flush=True)
+        screen.queue(BgColor.RESET.bvalue)
 
 
 class TextStyle(Enum):
     RESET = "\033[0m"
     BOLD = "\033[1m"
+    DIM = "\033[2m"
+    NORMAL_INTENSITY = "\033[22m"
     UNDERLINE = "\033[4m"
+    NO_UNDERLINE = "\033[24m"
     INVERSE = "\033[7m"
 
     @property
@@ -58,8 +62,8 @@ class TextStyle(Enum):
         return self.value.encode()
 
     def set(self):
-        print(self.value, end="", flush=True)
+        screen.queue(self.bvalue)
 
     @staticmethod
     def reset():
-        print(TextStyle.RESET.value, end="", flush=True)
+        screen.queue(TextStyle.RESET.bvalue)
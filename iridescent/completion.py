@@ -0,0 +1,224 @@
+import os
+import re
+import json
+import time
+import threading
+from pathlib import Path
+
+cache_dir = Path(os.path.expanduser("~")) / ".iridescent" / "completion"
+
+DEFAULT_TTL = 3600  # seconds before cached namespace metadata is fetched again
+
+COMMANDS = (
+    "break", "catch", "close", "continue", "do", "else", "elseif", "for", "goto", "halt", "hang", "if", "job", "kill",
+    "lock", "merge", "new", "open", "print", "quit", "read", "return", "set", "tcommit", "throw", "trollback", "try",
+    "tstart", "use", "view", "while", "write", "xecute", "zbreak", "zkill", "znspace", "zwrite", "zzdump", "zzwrite",
+)
+
+FUNCTIONS = (
+    "$ascii", "$bit", "$bitcount", "$bitfind", "$bitlogic", "$case", "$char", "$classmethod", "$classname", "$data",
+    "$decimal", "$double", "$extract", "$factor", "$find", "$fnumber", "$get", "$increment", "$inumber", "$isobject",
+    "$isvalidnum", "$justify", "$length", "$list", "$listbuild", "$listdata", "$listfind", "$listfromstring",
+    "$listget", "$listlength", "$listnext", "$listsame", "$listtostring", "$listvalid", "$method", "$name",
+    "$normalize", "$now", "$number", "$order", "$parameter", "$piece", "$property", "$qlength", "$qsubscript",
+    "$query", "$random", "$replace", "$reverse", "$select", "$sequence", "$sortbegin", "$sortend", "$stack", "$text",
+    "$translate", "$view",
+    "$zabs", "$zconvert", "$zdate", "$zdateh", "$zdatetime", "$zdatetimeh", "$zstrip", "$ztime", "$ztimeh",
+    # special variables
+    "$horolog", "$io", "$job", "$namespace", "$principal", "$roles", "$system", "$test", "$tlevel", "$username",
+    "$zhorolog", "$zname", "$zparent", "$zpi", "$ztimestamp", "$ztimezone", "$zversion",
+)
+
+# Each query writes one name per line between two markers. The markers are concatenated at runtime so that the echo of
+# the query itself never contains them.
+_BEGIN, _END = "<<<IRIDESCENT:BEGIN>>>", "<<<IRIDESCENT:END>>>"
+_QUERY_TEMPLATE = 'write "<<<IRIDESCENT"_":BEGIN>>>",!  set x="" for {{ set x=$order({}(x)) quit:x=""  write x,! }}  ' \
+                  'write "<<<IRIDESCENT"_":END>>>",!'
+METADATA_QUERIES = {
+    "routines": _QUERY_TEMPLATE.format("^rINDEX"),
+    "classes": _QUERY_TEMPLATE.format("^oddDEF"),
+    "globals": _QUERY_TEMPLATE.format("^$GLOBAL"),
+}
+PROMPT_PATTERN = r"[%\w.\-]+>"
+
+# characters that can be part of a completable token, e.g. `^My.Routine`, `$ZDATETIME`, `%Library.String`
+_TOKEN_REGEX = re.compile(rb"[\w%^$.#]*$")
+_TOKEN_END_REGEX = re.compile(rb"[\w%^$.#]*")
+_CLASS_CONTEXT_REGEX = re.compile(rb"##class\($", re.IGNORECASE)
+
+
+class CompletionTrie:
+    r"""A character trie of words. Matching can be made case-insensitive by storing lowercase keys."""
+    _WORD = ""  # key under which a node stores the word ending there, never a valid single character
+
+    def __init__(self, words=(), case_sensitive=True):
+        self.root = {}
+        self.case_sensitive = case_sensitive
+        for word in words:
+            self.add(word)
+
+    def _key(self, word):
+        return word if self.case_sensitive else word.lower()
+
+    def add(self, word):
+        node = self.root
+        for ch in self._key(word):
+            node = node.setdefault(ch, {})
+        node[self._WORD] = word
+
+    def _node(self, prefix):
+        node = self.root
+        for ch in self._key(prefix):
+            node = node.get(ch)
+            if node is None:
+                return None
+        return node
+
+    def complete(self, prefix, limit=100):
+        r"""Return up to ``limit`` words starting with ``prefix``, in lexicographic order."""
+        node = self._node(prefix)
+        if node is None:
+            return []
+        output, stack = [], [node]
+        while stack and len(output) < limit:
+            node = stack.pop()
+            if self._WORD in node:
+                output.append(node[self._WORD])
+            stack.extend(node[ch] for ch in sorted(node, reverse=True) if ch != self._WORD)
+        return output
+
+    def common_extension(self, prefix):
+        r"""Return the longest string ``s`` such that every word starting with ``prefix`` starts with ``prefix + s``."""
+        node = self._node(prefix)
+        if node is None:
+            return ""
+        extension = ""
+        while len(node) == 1 and self._WORD not in node:
+            (ch, node), = node.items()
+            extension += ch
+        return extension
+
+
+def fetch_metadata(instance, namespace, username=None, password=None, timeout=30):
+    r"""Fetch routine, class and global names of ``namespace`` over a separate ``iris terminal`` session."""
+    import pexpect as pe
+    from .spawn import login
+
+    metadata = {}
+    with pe.spawnu(f"iris terminal {instance} -U {namespace}", timeout=timeout) as c:
+        c.setecho(False)
+        login(c, username, password)
+        c.expect(PROMPT_PATTERN)
+        for kind, query in METADATA_QUERIES.items():
+            c.send(query + "\r")
+            c.expect_exact(_BEGIN)
+            c.expect_exact(_END)
+            metadata[kind] = [line.strip() for line in c.before.splitlines() if line.strip()]
+            c.expect(PROMPT_PATTERN)
+        c.send("halt\r")
+    return metadata
+
+
+class Completer:
+    r"""ObjectScript tab completion for commands, ``$`` functions, routines, classes and globals.
+
+    Commands and functions are built in. Routines, classes and globals of the current namespace are fetched in a
+    background thread and cached on disk per instance and namespace, so completions never wait on IRIS.
+    """
+
+    def __init__(self, instance, username=None, password=None, ttl=DEFAULT_TTL, cache_dir=cache_dir):
+        self.instance = instance
+        self.username = username
+        self.password = password
+        self.ttl = ttl
+        self.cache_dir = Path(cache_dir)
+        self.namespace = None
+        self.commands = CompletionTrie(COMMANDS, case_sensitive=False)
+        self.functions = CompletionTrie(FUNCTIONS, case_sensitive=False)
+        self.routines = self.classes = self.globals = CompletionTrie()
+        self._fetching = set()
+
+    def _cache_file(self, namespace):
+        return self.cache_dir / self.instance / f"{namespace}.json"
+
+    def _load(self, metadata):
+        self.routines = CompletionTrie("^" + name for name in metadata.get("routines", []))
+        self.classes = CompletionTrie(metadata.get("classes", []))
+        self.globals = CompletionTrie(name if name.startswith("^") else "^" + name
+                                      for name in metadata.get("globals", []))
+
+    def _fetch(self, namespace):
+        try:
+            metadata = fetch_metadata(self.instance, namespace, self.username, self.password)
+        except Exception:  # IRIS unreachable or unexpected output, keep whatever completions we have
+            return
+        finally:
+            self._fetching.discard(namespace)
+
+        cache_file = self._cache_file(namespace)
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_file.with_suffix(".tmp"), "w") as f:
+            json.dump({"fetched": time.time(), **metadata}, f)
+        os.replace(cache_file.with_suffix(".tmp"), cache_file)
+        if namespace == self.namespace:
+            self._load(metadata)
+
+    def refresh(self, namespace, block=False):
+        r"""Fetch the metadata of ``namespace`` again, in a background thread unless ``block`` is set."""
+        if namespace in self._fetching:
+            return
+        self._fetching.add(namespace)
+        if block:
+            self._fetch(namespace)
+        else:
+            threading.Thread(target=self._fetch, args=(namespace,), daemon=True).start()
+
+    def set_namespace(self, namespace):
+        if namespace == self.namespace:
+            return
+        self.namespace = namespace
+        self._load({})
+
+        try:
+            with open(self._cache_file(namespace)) as f:
+                metadata = json.load(f)
+        except (OSError, json.JSONDecodeError):  # not cached yet, or a corrupted cache, which is fetched again
+            metadata = None
+        if isinstance(metadata, dict):
+            self._load(metadata)
+            if time.time() - metadata.get("fetched", 0) < self.ttl:
+                return
+        self.refresh(namespace)
+
+    def _tries(self, line, start, token):
+        if token.startswith(b"$"):
+            return [self.functions]
+        if token.startswith(b"^"):
+            return [self.routines, self.globals]
+        if _CLASS_CONTEXT_REGEX.search(line, 0, start):
+            return [self.classes]
+        return [self.commands]
+
+    def complete(self, line: bytes, pos: int, limit=100):
+        r"""Complete the token around ``pos`` in ``line`` from its part before ``pos``.
+
+        Returns ``(insertion, candidates, end)``, where ``insertion`` is the text all candidates have in common after
+        the part before ``pos``, which replaces the rest of the token, ``line[pos:end]``, and ``candidates`` are the
+        matching words.
+        """
+        token = _TOKEN_REGEX.search(line, 0, pos).group()
+        start = pos - len(token)
+        end = _TOKEN_END_REGEX.match(line, pos).end()
+        if not token and not _CLASS_CONTEXT_REGEX.search(line, 0, start):
+            return b"", [], end
+
+        prefix = token.decode(errors="replace")
+        tries = self._tries(line, start, token)
+        candidates = sorted({word for trie in tries for word in trie.complete(prefix, limit)})
+        if len(tries) == 1:
+            insertion = tries[0].common_extension(prefix)
+        else:
+            insertion = os.path.commonprefix(candidates)[len(prefix):] if candidates else ""
+        if token.isupper() and not tries[0].case_sensitive:  # follow the casing of the user, e.g. `SE` -> `SET`
+            insertion, candidates = insertion.upper(), [word.upper() for word in candidates]
+        return insertion.encode(), candidates, end
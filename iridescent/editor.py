@@ -1,17 +1,23 @@
 from enum import Enum
-from .vim_actions import ActionEnum, get_action, _redo_stack
+from .keys import KEY
+from .vim_actions import ActionEnum, COMMAND_TRIE, get_command, _redo_stack
+from .screen import screen
 
 
 def _set_cursor_vertical():
-    print("\x1B[5 q", end="", flush=True)
+    screen.queue(b"\x1B[5 q")
 
 
 def _set_cursor_block():
-    print("\x1B[2 q", end="", flush=True)
+    screen.queue(b"\x1B[2 q")
 
 
 def _set_cursor_underline():
-    print("\x1B[3 q", end="", flush=True)
+    screen.queue(b"\x1B[3 q")
+
+
+# operators that take a motion, which may have its own count, e.g. `d3w`
+_OPERATORS = (ActionEnum.d, ActionEnum.c, ActionEnum.y)
 
 
 class EditorState(Enum):
@@ -23,13 +29,21 @@ class EditorState(Enum):
 class EditorStateManger:
     def __init__(self, filter_obj):
         self._state = EditorState.INSERT
-        self._action_buffer = None
+        self._node = None  # node of COMMAND_TRIE of the command being typed, e.g. `di`; None when there is none
         self._arg_buffer = None
+        self._count = 0  # count typed before the command, e.g. 3 in `3dw`; 0 when there is none
+        self._motion_count = 0  # count typed after an operator, e.g. 3 in `d3w`
+        self.registers = {}  # macro register -> recorded keys
+        self.recording = None  # register being recorded into, if any
+        self._last_register = None  # register replayed last, for `@@`
+        self._replay = None  # keys of a macro to be replayed after the current key
         self.filter_obj = filter_obj
 
     def _reset_buffers(self):
-        self._action_buffer = b""
+        self._node = None
         self._arg_buffer = b""
+        self._count = 0
+        self._motion_count = 0
 
     def set_normal(self):  # set to normal mode
         if self._state != EditorState.NORMAL:
@@ -52,6 +66,57 @@ class EditorStateManger:
     def state(self):
         return self._state
 
+    @property
+    def command_pending(self):
+        r"""Whether a command is partially typed, e.g. `d` waiting for a motion"""
+        return self._node is not None
+
+    @property
+    def collecting_variadic_arg(self):
+        r"""Whether the pending action takes a variadic argument, e.g. the pattern after `/`"""
+        return self._node is not None and self._node.command is not None and self._node.command.N_ARGS == -1
+
+    @property
+    def count(self):
+        r"""Count of the pending command, 1 if none was typed.
+        As in vim, counts before and after an operator multiply."""
+        return max(1, self._count) * max(1, self._motion_count)
+
+    @property
+    def count_pending(self):
+        return bool(self._count)
+
+    def take_count(self):
+        r"""Return the count of the pending command, for commands that are not actions, e.g. motions"""
+        count = self.count
+        self._count = self._motion_count = 0
+        return count
+
+    def start_recording(self, register):
+        self.recording = register
+        self.registers[register] = []
+
+    def record(self, key):
+        self.registers[self.recording].append(key)
+
+    def request_replay(self, register, count=1):
+        r"""Replay the keys recorded in ``register`` (the last replayed register for `@`) ``count`` times"""
+        if register == b"@":
+            register = self._last_register
+        keys = self.registers.get(register)
+        if keys:
+            self._last_register = register
+            self._replay = keys * count
+
+    def take_replay(self):
+        keys, self._replay = self._replay, None
+        return keys
+
+    def _command(self):
+        node = self._node
+        count = self.count
+        return node.command if count == 1 else get_command(node.action, count)
+
     def normal_buffer(self, key, current_line, cursor_pos):
         # a list of operations/keystrokes
         # if the operation is not completed, return None
@@ -59,34 +124,53 @@ class EditorStateManger:
             self._reset_buffers()
             return None
 
-        if not self._action_buffer:
-            try:
-                self._action_buffer = ActionEnum(key)
-            except ValueError:
+        node = self._node
+        if node is None:
+            if key == b"q" and self.recording is not None:  # stop recording
+                self.recording = None
                 self._reset_buffers()
+                return []
+            if key.isdigit() and (key != b"0" or self._count):  # a leading `0` is a motion
+                self._count = self._count * 10 + key[0] - 0x30  # without parsing the bytes
                 return None
-
-            action = get_action(self._action_buffer)
-            return self.post_process(action().act(None, current_line, cursor_pos)) if action.N_ARGS == 0 else None
+            node = COMMAND_TRIE.get(key)
+            if node is None:
+                self._reset_buffers()
+                return None
+            self._node = node
+            if node.command is None or node.command.N_ARGS != 0:
+                return None
+            return self.post_process(self._command().act(None, current_line, cursor_pos))
 
         # Variadic arguments
-        action = get_action(self._action_buffer)
-        if action.N_ARGS == -1:
-            self._arg_buffer += key
-            if key in action.VARIADIC_ARG_TERMINATORS:
-                return self.post_process(action().act(self._arg_buffer, current_line, cursor_pos))
+        if node.command is not None and node.command.N_ARGS == -1:
+            if key == KEY.DELETE:
+                self._arg_buffer = self._arg_buffer[:-1]
+            else:
+                self._arg_buffer += key
+            if key in node.command.VARIADIC_ARG_TERMINATORS:
+                return self.post_process(self._command().act(self._arg_buffer, current_line, cursor_pos))
+            for sop in node.command.on_partial_arg(self._arg_buffer):  # e.g. incremental search
+                sop.control(self, [])
             return None
 
-        try:
-            action = ActionEnum(self._action_buffer.value + key)
-            self._action_buffer = action
+        if node.action in _OPERATORS and key.isdigit() and (key != b"0" or self._motion_count):
+            self._motion_count = self._motion_count * 10 + key[0] - 0x30
+            return None
+
+        child = node.children.get(key)
+        if child is not None:  # a longer command, e.g. `di` after `d`
+            self._node = child
+            if child.command is None or child.command.N_ARGS != 0:
+                return None
+            return self.post_process(self._command().act(None, current_line, cursor_pos))
+        if node.command is None:
+            self._reset_buffers()
             return None
-        except ValueError:
-            action = get_action(self._action_buffer)()
-            return self.post_process(action.act(key, current_line, cursor_pos))
+        return self.post_process(self._command().act(key, current_line, cursor_pos))
 
     def post_process(self, action_output):
-        if isinstance(action_output, tuple) and len(action_output) == 2 and isinstance(action_output[0], list):
+        if isinstance(action_output, tuple) and len(action_output) == 2 and isinstance(action_output[1], list):
             ops, sops = action_output
             for sop in sops:
                 sop.control(self, ops)
@@ -0,0 +1,85 @@
+import io
+import sys
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .batch import BatchSession, BatchError, run_commands, open_commands
+
+
+class InstanceResult:
+    def __init__(self, instance):
+        self.instance = instance
+        self.status = 0  # as in `batch.run_script`
+        self.output = b""
+        self.error = None
+        self.elapsed = 0.0
+
+    def to_dict(self):
+        return {
+            "instance": self.instance,
+            "status": self.status,
+            "elapsed": round(self.elapsed, 3),
+            "error": self.error,
+            "output": self.output.decode(errors="replace"),
+        }
+
+
+def run_instance(instance, commands, username=None, password=None, timeout=None, keep_going=False):
+    r"""Run ``commands`` on ``instance``, collecting the output in memory."""
+    result = InstanceResult(instance)
+    out = io.BytesIO()
+    start = time.perf_counter()
+    try:
+        with BatchSession(instance, username, password, timeout) as session:
+            result.status = run_commands(session, commands, out, keep_going)
+    except (BatchError, OSError) as e:  # OSError, e.g. when `iris` cannot be spawned
+        result.status, result.error = 2, str(e)
+    result.elapsed = time.perf_counter() - start
+    result.output = out.getvalue()
+    return result
+
+
+def fan_out(instances, commands, jobs, username=None, password=None, timeout=None, keep_going=False, on_result=None):
+    r"""Run the same ``commands`` on every instance, with at most ``jobs`` sessions open at a time.
+
+    ``on_result`` is called with each `InstanceResult` as soon as it is available. Returns the results in the order of
+    ``instances``.
+    """
+    commands = list(commands)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(run_instance, instance, commands, username, password, timeout, keep_going): i
+            for i, instance in enumerate(instances)
+        }
+        results = [None] * len(instances)
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            if on_result:
+                on_result(result)
+    return results
+
+
+def _print_result(result):
+    status = "ok" if result.status == 0 else "error" if result.status == 1 else "failed"
+    header = f"=== {result.instance}: {status} in {result.elapsed:.2f}s ===\n"
+    sys.stdout.buffer.write(header.encode() + result.output)
+    if result.error:
+        sys.stdout.buffer.write(result.error.encode() + b"\n")
+    sys.stdout.buffer.flush()
+
+
+def main(opt, username=None, password=None):
+    instances = [instance for instance in opt.fanout.split(",") if instance]
+    start = time.perf_counter()
+    results = fan_out(instances, open_commands(opt), opt.jobs, username, password, opt.timeout, opt.keep_going,
+                      on_result=_print_result)
+    elapsed = time.perf_counter() - start
+
+    n_ok = sum(result.status == 0 for result in results)
+    print(f"{n_ok} of {len(results)} instances succeeded in {elapsed:.2f}s")
+    if opt.report:
+        with open(opt.report, "w") as f:
+            json.dump({"elapsed": round(elapsed, 3), "results": [result.to_dict() for result in results]}, f,
+                      indent=2)
+    return max((result.status for result in results), default=0)
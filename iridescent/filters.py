@@ -1,7 +1,22 @@
+import re
+from collections import deque
 from .utils import nonwhitespace_printable, _chunk_rightmost, _chunk_leftmost
+from .utils import row_col, vertical_position, open_blocks, join_block, repeat_motion
 from .editor import EditorStateManger
+from .suggest import Autosuggester
+from .tracing import tracer
+from .latency import EchoTracker
+from .predict import Predictor
+from .screen import screen
+from .tokenizer import KeyTokenizer, ESCAPE_TIMEOUT
+from .keys import keymap
 from .input_handlers import *
 
+MAX_REPLAY_KEYS = 100000  # stops a macro that replays itself
+
+# e.g. b"USER>", b"%SYS>", b"TL1:USER>"
+PROMPT_REGEX = re.compile(rb"(?:TL\d+:)?([%\w.\-]+)>")
+
 HANDLER_CLASSES = [
     EscapeSequenceHandler,
     SwitchToNormalHandler,
@@ -10,6 +25,7 @@ HANDLER_CLASSES = [
     OptionDeleteHandler,
     HistoryNavigationHandler,
     SigBellHandler,
+    TabHandler,
     LeftHandler,
     RightHandler,
     OptionLeftHandler,
@@ -23,6 +39,13 @@ HANDLER_CLASSES = [
 ]
 
 
+def _is_typed(key):
+    try:
+        return key.decode().isprintable()
+    except UnicodeDecodeError:
+        return False
+
+
 class DebugLogger:
     def __init__(self, file):
         self.file = file
@@ -39,15 +62,33 @@ class DebugLogger:
 
 
 class IOFilter:
-    def __init__(self, file, dlogger, history_manager=None):
+    def __init__(self, file, dlogger, history_manager=None, autosuggest=False, completer=None, scrollback=None,
+                 local_edit=False, predict="never", input_fd=None, escape_timeout=ESCAPE_TIMEOUT):
         self.file = file
         self.dlogger = dlogger
         self.current_line = None
         self.cursor_pos = 0
+        self.prompt = b""
+        self.at_prompt = False  # whether the line is typed at a namespace prompt, rather than e.g. `Password:`
+        self.autosuggester = Autosuggester(history_manager) if autosuggest else None
+        self.completer = completer
+        self.scrollback = scrollback
+        self.echo_tracker = EchoTracker()
+        self.predictor = Predictor(self.echo_tracker, "never" if local_edit else predict)
+        self.local_edit = local_edit  # edit the line locally, and only send it to IRIS once it is complete
+        self._drawn_row, self._drawn_pos = 0, 0  # with `local_edit`, position of the cursor in the buffer on screen
+        self._drawn_rows = 1  # with `local_edit`, number of lines of the buffer on screen
+        self.suggestion = b""  # suffix suggested after the cursor, accepted with <Right> at the end of line
+        self._ghost_shown = False  # whether a suggestion is currently drawn on screen
+        self._ghost_pending = False  # whether the drawn suggestion is outdated
+        self._message_shown = False  # whether the last message is still right above the prompt, nothing drawn since
         self.state_manager = EditorStateManger(filter_obj=self)
         self.history_manager = history_manager
         self.handlers = [H(self) for H in HANDLER_CLASSES]
+        self.tokenizer = KeyTokenizer(keymap(), fd=input_fd, timeout=escape_timeout)
+        self._submitted = []  # lines completed by the current key (several when a macro is replayed)
         self.reset_line()
+        self._submitted.clear()
 
     def debug(self, *args, **kwargs):
         if not self.dlogger:
@@ -63,6 +104,10 @@ class IOFilter:
     def reset_line(self):
         from .color_utils import FgColor
         FgColor.RED.set()
+        if self.scrollback is not None and self.current_line:
+            self.scrollback.mark_command(self.current_line)
+        self._submitted.append(self.current_line)
+        self.at_prompt = False
         self.current_line = b""
         self.cursor_pos = 0
         self.history_manager.ingest()
@@ -79,9 +124,98 @@ class IOFilter:
         return any(k in nonwhitespace_printable for k in key)
 
     def debug_cursor(self):
+        if not (self.dlogger and self.dlogger.file):
+            return
         repr = self.current_line[:self.cursor_pos] + b"|" + self.current_line[self.cursor_pos:]
         self.debug(repr.decode())
 
+    def show_message(self, message: bytes, replace=False):
+        r"""Show ``message`` below the line being edited, then redraw the prompt and the line locally. With ``replace``,
+        the last message is overwritten in place if nothing was drawn since, e.g. for a status updated on every key."""
+        self.predictor.clear()
+        if replace and self._message_shown:
+            move = b"\x1b[%dA\r" % (self._drawn_row + 1)
+            message += b"\x1b[K"
+        else:
+            move = b"\r\n"
+            self._drawn_rows = 0
+        screen.queue(move + message + b"\r\n" + self.prompt + self._draw_buffer())
+        self._message_shown = True
+
+    def _draw_buffer(self, suggestion=b""):
+        r"""Draw the line being edited from where the cursor is, and leave the cursor at `cursor_pos`. Lines after the
+        first one (in a multi-line buffer) are indented to line up with the first one, which follows the prompt."""
+        from .color_utils import TextStyle
+
+        line = self.current_line
+        rows = line.count(b"\n") + 1
+        drawn = line.replace(b"\n", b"\x1b[K\r\n" + b" " * len(self.prompt))
+        drawn += b"\x1b[J" if rows < self._drawn_rows else b"\x1b[K"
+        if suggestion:
+            drawn += TextStyle.DIM.bvalue + suggestion + TextStyle.NORMAL_INTENSITY.bvalue
+        row, col = row_col(line, self.cursor_pos)
+        end_col = len(line) - line.rfind(b"\n") - 1 + len(suggestion)
+        if row < rows - 1:
+            drawn += b"\x1b[%dA" % (rows - 1 - row)
+        if col < end_col:
+            drawn += b"\x1b[%dD" % (end_col - col)
+        self._drawn_row, self._drawn_pos, self._drawn_rows = row, col, rows
+        return drawn
+
+    def _to_buffer_start(self):
+        r"""Move from the cursor to the beginning of the line drawn by `_draw_buffer`"""
+        return (b"\x1b[%dA" % self._drawn_row if self._drawn_row else b"") \
+            + (b"\x1b[%dD" % self._drawn_pos if self._drawn_pos else b"")
+
+    def redraw_line(self):
+        r"""Redraw the line being edited (and the suggestion, if any) in place, without help from IRIS."""
+        self._ghost_pending = False
+        self._message_shown = False
+        screen.queue(self._to_buffer_start() + self._draw_buffer(self.suggestion))
+
+    def continues_block(self):
+        r"""Whether <Enter> starts a new line in the buffer, rather than sending it, i.e. a `{` is still open"""
+        return self.local_edit and self.at_prompt and open_blocks(self.current_line) > 0
+
+    def recall(self, entry):
+        r"""A history entry, as it can be put in the line. Multi-line entries are joined unless `local_edit`."""
+        return entry if self.local_edit else join_block(entry)
+
+    def move_cursor_vertically(self, rows):
+        r"""Move the cursor ``rows`` lines down (or up) in a multi-line buffer. Return None if there is no such line."""
+        new_pos = vertical_position(self.current_line, self.cursor_pos, rows)
+        if new_pos == -1:
+            return None
+        if new_pos > self.cursor_pos:
+            return self.move_cursor_right(new_pos - self.cursor_pos)
+        return self.move_cursor_left(self.cursor_pos - new_pos)
+
+    def edit_locally(self, output):
+        r"""Replace the keys that would be sent to IRIS by a local redraw, unless the line is complete, in which case
+        it is sent as a whole. IRIS echoes it, so the local copy is erased first."""
+        if output == ESCAPE_SEQUENCE:  # pexpect ends the session when it sees it
+            return output
+        if not self._submitted:
+            self.redraw_line()
+            return b""
+
+        screen.queue(self._to_buffer_start() + b"\x1b[J")
+        self._drawn_row, self._drawn_pos, self._drawn_rows = 0, 0, 1
+        return b"".join(join_block(line) + KEY.ENTER for line in self._submitted)
+
+    def predict(self, line, pos, output):
+        r"""Tell the predictor what the key did, given the line and the cursor position before it"""
+        if not output:
+            return
+        if self.current_line == line and output in (KEY.LEFT * (pos - self.cursor_pos),
+                                                    KEY.RIGHT * (self.cursor_pos - pos)):
+            self.predictor.moved(self.cursor_pos - pos)
+        elif self.current_line == line + output and self.cursor_pos == len(self.current_line) \
+                and output.isascii() and output.decode().isprintable():
+            self.predictor.typed(output)
+        else:
+            self.predictor.unpredicted(line_end=bool(self._submitted))
+
     def log_key(self, key, is_old=True):
         if not self.file:
             return
@@ -149,52 +283,166 @@ class IOFilter:
         self.move_cursor_right(count)
         return KEY.RIGHT * count
 
-    def move_cursor_vim(self, vf, capital):
+    def move_cursor_vim(self, vf, capital, count=1):
         assert self.state_manager.state == EditorState.NORMAL
-        new_npos = vf(self.current_line, self.cursor_pos, capital)
+        new_npos = repeat_motion(vf, self.current_line, self.cursor_pos, capital, count)
         right = new_npos - self.cursor_pos
         if right > 0:
             return self.move_cursor_right(right)
         else:
             return self.move_cursor_left(-right)
 
-    def filter_input(self, key):
-        if not isinstance(key, bytes):
+    def filter_input(self, data):
+        r"""Split a chunk of input into keys and apply them in order, returning what they send to IRIS together.
+        In *Insert* mode, runs of typed characters are applied at once, as a paste would be."""
+        if not isinstance(data, bytes):
             raise TypeError("InputFilter only accepts bytes as input")
 
+        keys = deque(self.tokenizer.feed(data))
+        output = b""
+        while keys:
+            key = keys.popleft()
+            if self.state_manager.state == EditorState.INSERT and _is_typed(key):
+                while keys and _is_typed(keys[0]):
+                    key += keys.popleft()
+            output += self.filter_key(key)
+        return output
+
+    def filter_key(self, key):
+        at_prompt = self.at_prompt
+        if tracer.enabled:  # only lengths away from prompts, where passwords may be typed
+            tracer.record("key", key if at_prompt else len(key))
         self.log_key(key, is_old=True)
 
+        self._submitted = []
+        line, pos = self.current_line, self.cursor_pos
+        recording = self.state_manager.recording
+        output = self.handle_key(key)
+        if recording is not None and self.state_manager.recording is not None:  # not the `q` that stops recording
+            self.state_manager.record(key)
+        keys = self.state_manager.take_replay()
+        if keys:
+            output += self.replay(keys)
+
+        if self.autosuggester:
+            self.update_suggestion()
+        if self.local_edit and at_prompt:  # e.g. `Password:` is not echoed, so nothing is drawn there either
+            output = self.edit_locally(output)
+        elif self.predictor.mode != "never":
+            self.predict(line, pos, output)
+
+        self.log_key(output, is_old=False)
+        self.debug_cursor()
+        if tracer.enabled:
+            tracer.record("send", output if at_prompt else len(output))
+        self.echo_tracker.sent(output)
+        if output:
+            self._message_shown = False
+        else:  # no echo to merge local escape sequences into
+            screen.flush()
+        return output
+
+    def handle_key(self, key):
+        r"""Apply ``key`` to the line, and return what it sends to IRIS"""
         state = self.state_manager.state
         output = b''
         for handler in self.handlers:
             if handler.accepts_mode(state) and handler.accepts_key(key):
-                self.log(f"Using handler: {handler.__class__.__name__}")
+                if tracer.enabled:
+                    tracer.record("handler", handler.__class__.__name__)
+                if self.file:
+                    self.log(f"Using handler: {handler.__class__.__name__}")
                 output = handler.handle(key, state)
                 break
 
-        if self.state_manager.state == EditorState.NORMAL and self.cursor_pos == len(self.current_line):
+        if self.state_manager.state == EditorState.NORMAL and 0 < self.cursor_pos == len(self.current_line):
             self.move_cursor_left()
             output += KEY.LEFT
 
         self.history_manager.set_buffer(self.current_line)
+        return output
 
-        self.log_key(output, is_old=False)
-        self.debug_cursor()
+    def replay(self, keys):
+        r"""Apply the keys of a macro to the line in memory, and return what they send to IRIS as a single chunk.
+        Macros replayed by the macro are expanded in place."""
+        pending = deque(keys)
+        output = b""
+        for _ in range(MAX_REPLAY_KEYS):
+            if not pending:
+                break
+            output += self.handle_key(pending.popleft())
+            nested = self.state_manager.take_replay()
+            if nested:
+                pending.extendleft(reversed(nested))
         return output
 
-    def filter_output(self, content):
+    def update_suggestion(self):
+        suggestion = b""
+        if self.state_manager.state == EditorState.INSERT and self.cursor_pos == len(self.current_line):
+            suggestion = self.autosuggester.suggest(self.current_line).split(b"\n", 1)[0]
+        if suggestion or self._ghost_shown:
+            self._ghost_pending = True
+        self.suggestion = suggestion
+
+    def _draw_suggestion(self, content):
+        r"""Erase the suggestion drawn for the previous key, and draw the current one after the echo in `content`."""
         from .color_utils import TextStyle
 
+        self._ghost_pending = False
+        if self._ghost_shown:
+            content = b"\x1b[K" + content
+        self._ghost_shown = bool(self.suggestion)
+        if self.suggestion:
+            content += (
+                    b"\x1b[K" + TextStyle.DIM.bvalue + self.suggestion + TextStyle.NORMAL_INTENSITY.bvalue
+                    + b"\x1b[%dD" % len(self.suggestion)
+            )
+        return content
+
+    def filter_output(self, content):
+        self._message_shown = False
+        if tracer.enabled:
+            tracer.record("output", len(content))
+        if self.echo_tracker.pending:
+            self.echo_tracker.received(content)
+        if self.scrollback is not None:
+            self.scrollback.append(content)
+        if self.predictor.expecting_echo:
+            content = self.predictor.received(content)
+
+        if screen.pending:
+            content = screen.take() + content
+
+        # Fast path: the chunk is passed through as is, without any copies, unless a prompt may end in it,
+        # or something needs to be logged or drawn after it.
+        if not (self.file or self._ghost_pending or content.endswith(b">")):
+            return content
+
         if self.file:
             with open(self.file, 'a') as f:
                 f.write("Output = " + repr(content) + "\n")
 
         if content.endswith(b">"):
-            try:
-                last_index = content.rindex(b"\r\n")
-            except ValueError:
-                return content
-            if b"<" not in content[last_index:]:
-                content = content[:last_index] + TextStyle.RESET.value.encode() + content[last_index:]
+            last_index = content.rfind(b"\r\n")
+            if last_index != -1 and content.find(b"<", last_index) == -1:
+                from .color_utils import TextStyle
+                self.on_prompt(content[last_index + 2:])
+                content = content[:last_index] + TextStyle.RESET.bvalue + content[last_index:]
+
+        if self._ghost_pending:
+            content = self._draw_suggestion(content)
 
         return content
+
+    def on_prompt(self, prompt):
+        match = PROMPT_REGEX.fullmatch(prompt)
+        if not match:
+            return
+        self.prompt = prompt
+        self.at_prompt = True
+        namespace = match.group(1).decode()
+        if tracer.enabled:
+            tracer.record("prompt", namespace)
+        self.history_manager.set_namespace(namespace)
+        if self.completer:
+            self.completer.set_namespace(namespace)
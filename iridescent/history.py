@@ -1,31 +1,284 @@
 import os
 import re
+import json
+import math
+import time
 import bisect
+from array import array
+from contextlib import contextmanager
+from .tracing import tracer
+from .ingest import DEFAULT_RULES
 
-DEFAULT_REJECT_REGEXES = (
-    re.compile(r"h\s*", re.IGNORECASE),
-    re.compile(r"halt\s*", re.IGNORECASE),
-)
+try:
+    import fcntl
+except ModuleNotFoundError:  # not available on Windows
+    fcntl = None
+
+
+@contextmanager
+def history_lock(file):
+    r"""Hold an exclusive advisory lock on ``file`` (via a sibling ``.lock`` file) for the duration of the block."""
+    if fcntl is None:
+        yield
+        return
+    with open(file + ".lock", "a") as lock:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+
+def text_record(entry: bytes) -> bytes:
+    r"""Return ``entry`` as stored in a text history file: ``:`` and the entry, with each further line of a multi-line
+    entry on a continuation line starting with ``+``."""
+    return b":" + entry.replace(b"\n", b"\n+") + b"\n"
+
+
+def iter_text_entries(f):
+    r"""Yield the entries of a text history file opened in binary mode, oldest first."""
+    entry = None
+    for line in f:
+        line = line.rstrip(b"\r\n")
+        if line.startswith(b"+") and entry is not None:
+            entry += b"\n" + line[1:]
+            continue
+        if entry is not None:
+            yield entry
+        entry = line[1:] if line.startswith(b":") else None
+    if entry is not None:
+        yield entry
+
+
+def _logaddexp(a, b):
+    hi, lo = (a, b) if a > b else (b, a)
+    return hi + math.log1p(math.exp(lo - hi))
+
+
+class HistoryMetadata:
+    r"""Per-entry usage metadata kept in parallel arrays, indexed by one slot per distinct entry.
+
+    Frecency is the use count with exponential decay. Scores are kept in log space relative to a fixed epoch, so time
+    passing decays every entry by the same amount and never changes their relative order. Only the entry being used
+    moves, which keeps `ranked` sorted with one bisect per ingest. Entries are also ranked per namespace they were last
+    used in, for namespace-scoped recall.
+    """
+    HALF_LIFE = 3 * 24 * 3600  # seconds
+
+    def __init__(self):
+        self.slots = {}  # entry -> slot
+        self.entries = []  # slot -> entry
+        self.last_used = array("d")
+        self.counts = array("L")
+        self.namespace_ids = array("H")
+        self.last_index = array("l")  # most recent position of the entry in HistoryManager.history
+        self.scores = array("d")
+        self.namespaces = [None]  # interned namespace names, id 0 means unknown
+        self._namespace_lookup = {None: 0}
+        self.ranked = []  # list of (-score, slot), most frecent first
+        self.ranked_by_namespace = {}  # namespace id -> the part of `ranked` last used in that namespace
+        self._rate = math.log(2) / self.HALF_LIFE
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _namespace_id(self, namespace):
+        if namespace not in self._namespace_lookup:
+            self._namespace_lookup[namespace] = len(self.namespaces)
+            self.namespaces.append(namespace)
+        return self._namespace_lookup[namespace]
+
+    def _rank(self, slot):
+        key = (-self.scores[slot], slot)
+        bisect.insort(self.ranked, key)
+        bisect.insort(self.ranked_by_namespace.setdefault(self.namespace_ids[slot], []), key)
+
+    def _unrank(self, slot):
+        key = (-self.scores[slot], slot)
+        del self.ranked[bisect.bisect_left(self.ranked, key)]
+        ranked = self.ranked_by_namespace[self.namespace_ids[slot]]
+        del ranked[bisect.bisect_left(ranked, key)]
+
+    def touch(self, entry, timestamp=None, namespace=None, index=-1, count=1, rank=True):
+        timestamp = time.time() if timestamp is None else timestamp
+        slot = self.slots.get(entry)
+        if slot is None:
+            slot = self.slots[entry] = len(self.entries)
+            self.entries.append(entry)
+            self.last_used.append(timestamp)
+            self.counts.append(count)
+            self.namespace_ids.append(self._namespace_id(namespace))
+            self.last_index.append(index)
+            self.scores.append(self._rate * timestamp + math.log(count))
+        else:
+            if rank:
+                self._unrank(slot)
+            self.last_used[slot] = max(self.last_used[slot], timestamp)
+            self.counts[slot] += count
+            if namespace is not None:
+                self.namespace_ids[slot] = self._namespace_id(namespace)
+            if index >= 0:
+                self.last_index[slot] = index
+            self.scores[slot] = _logaddexp(self.scores[slot], self._rate * timestamp + math.log(count))
+        if rank:
+            self._rank(slot)
+        return slot
+
+    def load(self, file):
+        r"""Restore metadata saved by `save` for the entries that are already known.
+        Call `rebuild_ranking` afterwards."""
+        if not os.path.isfile(file):
+            return
+        try:
+            with open(file) as f:
+                saved = json.load(f)
+        except ValueError:  # ignore corrupted metadata, it is rebuilt from the history file
+            return
+        for entry, (timestamp, count, namespace) in saved.items():
+            slot = self.slots.get(entry)
+            if slot is None:
+                continue
+            self.last_used[slot] = timestamp
+            self.counts[slot] = count
+            self.namespace_ids[slot] = self._namespace_id(namespace)
+            self.scores[slot] = self._rate * timestamp + math.log(count)
+
+    def save(self, file):
+        saved = {
+            entry: [self.last_used[slot], self.counts[slot], self.namespaces[self.namespace_ids[slot]]]
+            for slot, entry in enumerate(self.entries)
+        }
+        with open(file + ".tmp", "w") as f:
+            json.dump(saved, f)
+        os.replace(file + ".tmp", file)
+
+    def rebuild_ranking(self):
+        self.ranked = sorted((-score, slot) for slot, score in enumerate(self.scores))
+        self.ranked_by_namespace = {}
+        for key in self.ranked:
+            self.ranked_by_namespace.setdefault(self.namespace_ids[key[1]], []).append(key)
+
+    def ranking(self, namespace=None):
+        r"""Return the ranking of the entries last used in ``namespace``, or of all entries if it is None."""
+        if namespace is None:
+            return self.ranked
+        return self.ranked_by_namespace.get(self._namespace_lookup.get(namespace), [])
+
+    def namespace(self, entry):
+        slot = self.slots.get(entry)
+        return None if slot is None else self.namespaces[self.namespace_ids[slot]]
+
+    def ranked_indices(self, namespace=None):
+        r"""Yield the history indices of entries from the most to the least frecent."""
+        for _, slot in self.ranking(namespace):
+            yield self.last_index[slot]
+
+
+class PrefixIndex:
+    r"""Trie over the leading characters of history entries.
+
+    Every node keeps the ascending history indices of the entries that pass through it, so the nearest entry starting
+    with a prefix before or after a given index is found with a walk of O(len(prefix)) and one bisect. Nodes are only
+    created for the first `MAX_DEPTH` characters; longer prefixes are checked against the candidates of the deepest
+    node.
+    """
+    MAX_DEPTH = 16
+
+    def __init__(self):
+        self.root = [{}, array("l")]  # [children, indices]
+
+    def add(self, entry, index):
+        node = self.root
+        node[1].append(index)
+        for ch in entry[:self.MAX_DEPTH]:
+            children = node[0]
+            node = children.get(ch)
+            if node is None:
+                node = children[ch] = [{}, array("l")]
+            node[1].append(index)
+
+    def indices(self, prefix):
+        r"""Return the ascending history indices of entries that start with the first `MAX_DEPTH` chars of `prefix`."""
+        node = self.root
+        for ch in prefix[:self.MAX_DEPTH]:
+            node = node[0].get(ch)
+            if node is None:
+                return ()
+        return node[1]
+
+    def prev(self, prefix, index, history, skip=None):
+        r"""Return the largest history index below `index` whose entry starts with `prefix` and isn't `skip`, or -1"""
+        indices = self.indices(prefix)
+        pos = bisect.bisect_left(indices, index)
+        while pos > 0:
+            pos -= 1
+            entry = history[indices[pos]]
+            if entry != skip and (len(prefix) <= self.MAX_DEPTH or entry.startswith(prefix)):
+                return indices[pos]
+        return -1
+
+    def next(self, prefix, index, history, skip=None):
+        r"""Return the smallest history index above `index` whose entry starts with `prefix` and isn't `skip`, or -1"""
+        indices = self.indices(prefix)
+        pos = bisect.bisect_right(indices, index)
+        while pos < len(indices):
+            entry = history[indices[pos]]
+            if entry != skip and (len(prefix) <= self.MAX_DEPTH or entry.startswith(prefix)):
+                return indices[pos]
+            pos += 1
+        return -1
 
 
 class HistoryManager:
-    def __init__(self, file, init_max_size=5000, reject_regexes=DEFAULT_REJECT_REGEXES):
+    def __init__(self, file, init_max_size=5000, rules=DEFAULT_RULES, ranking="recency", prefix_search=False,
+                 scope="global"):
         self.file = file
 
-        if file and os.path.exists(file) and os.path.isfile(file):
-            with open(file) as f:
-                self.history = [line[1:] for line in f.read().split('\n') if line.startswith(":")]
+        from .history_binary import is_binary_history, BinaryHistoryReader
+
+        self.binary = is_binary_history(file)
+        if self.binary:
+            with BinaryHistoryReader(file) as reader:
+                self.history = [entry.decode("utf-8", "replace") for entry in reader.tail(init_max_size)]
+        elif file and os.path.exists(file) and os.path.isfile(file):
+            with open(file, "rb") as f:
+                self.history = [entry.decode() for entry in iter_text_entries(f)]
         else:
             self.history = []
 
         if len(self.history) > init_max_size:
             self.history = self.history[-init_max_size:]
         self.init_size = len(self.history)
+
+        self.namespace = None
+        self.scope = scope  # "global", or "namespace" to only recall entries typed in the namespace of the prompt
+        self.ranking = ranking  # "recency" or "frecency", the order used by go_prev/go_next and searches
+        self.prefix_search = prefix_search  # when the buffer is not empty, only recall entries starting with it
+        self.prefix_index = PrefixIndex()
+        self.metadata = HistoryMetadata()
+        mtime = os.path.getmtime(file) if self.history else None
+        for i, entry in enumerate(self.history):
+            # without saved metadata, entries are taken as used a second apart, so later entries rank first
+            self.metadata.touch(entry, mtime - (len(self.history) - i), index=i, rank=False)
+            self.prefix_index.add(entry, i)
+        if file:
+            self.metadata.load(file + ".meta")
+        self.metadata.rebuild_ranking()
+        # per namespace, the ascending history indices of the entries typed in it, and their prefixes
+        self.namespace_indices = {}
+        self.namespace_prefix_indices = {}
+        self.entry_namespaces = []  # history index -> namespace the entry was typed in, the last one for loaded entries
+        for i, entry in enumerate(self.history):
+            self._add_to_namespace(entry, i, self.metadata.namespace(entry))
+        self._rank_pos = -1  # position in the frecency ranking, -1 stands for the buffer
+
         self.index = self.init_size - 1
         self._buffer = ""
-        self.reject_regexes = reject_regexes
+        self.rules = rules  # IngestRules deciding what is stored, see ingest.py
         self.search_pattern = None
         self.search_matches = []  # list of (history_index, match) pairs
+        self._ranked_matches = None  # search_matches in frecency order, computed lazily
+        self._search_rank_pos = -1
         self._skip_buffers = 0  # number of times to skip the .set_buffer() operations
         self._marks_lookup = {}  # mark -> history_index
 
@@ -35,40 +288,142 @@ class HistoryManager:
         assert isinstance(self.history[self.index], str)
         return self.history[self.index].encode()
 
+    @property
+    def _prefix(self):
+        return self._buffer if self.prefix_search else ""
+
+    @property
+    def _scope(self):
+        r"""The namespace recall is limited to, or None"""
+        return self.namespace if self.scope == "namespace" else None
+
+    @property
+    def _prefix_index(self):
+        if self._scope is None:
+            return self.prefix_index
+        return self.namespace_prefix_indices.get(self._scope) or PrefixIndex()
+
+    def _add_to_namespace(self, entry, index, namespace):
+        self.entry_namespaces.append(namespace)
+        self.namespace_indices.setdefault(namespace, array("l")).append(index)
+        self.namespace_prefix_indices.setdefault(namespace, PrefixIndex()).add(entry, index)
+
+    def toggle_scope(self):
+        self.scope = "global" if self.scope == "namespace" else "namespace"
+        if self.search_pattern is not None:
+            self.start_search(self.search_pattern.pattern)
+        return self.scope
+
+    def _go_scoped(self, step):
+        indices = self.namespace_indices.get(self._scope, ())
+        if step > 0:
+            pos = bisect.bisect_left(indices, self.index) - 1
+            self.index = indices[pos] if pos >= 0 else len(self.history)
+        else:
+            pos = bisect.bisect_right(indices, self.index) if self.index < len(self.history) else 0
+            self.index = indices[pos] if pos < len(indices) else len(self.history)
+        return self._emit()
+
+    def _go_ranked(self, step):
+        ranked, entries, prefix = self.metadata.ranking(self._scope), self.metadata.entries, self._prefix
+        for _ in range(len(ranked) + 1):
+            self._rank_pos = (self._rank_pos + 1 + step) % (len(ranked) + 1) - 1
+            if self._rank_pos == -1 or entries[ranked[self._rank_pos][1]].startswith(prefix):
+                break
+        if self._rank_pos == -1:
+            self.index = len(self.history)
+        else:
+            self.index = self.metadata.last_index[ranked[self._rank_pos][1]]
+        return self._emit()
+
+    def _current(self):
+        return self.history[self.index] if self.index < len(self.history) else None
+
     def go_prev(self):
+        if self.ranking == "frecency":
+            return self._go_ranked(1)
+        if self._prefix:
+            index = self._prefix_index.prev(self._prefix, self.index, self.history, skip=self._current())
+            if index >= 0:
+                self.index = index
+            return self._emit()
+        if self._scope is not None:
+            return self._go_scoped(1)
         self.index = (self.index - 1) % (len(self.history) + 1)
         return self._emit()
 
     def go_next(self):
+        if self.ranking == "frecency":
+            return self._go_ranked(-1)
+        if self._prefix:
+            index = self._prefix_index.next(self._prefix, self.index, self.history, skip=self._current())
+            self.index = index if index >= 0 else len(self.history)
+            return self._emit()
+        if self._scope is not None:
+            return self._go_scoped(-1)
         self.index = (self.index + 1) % (len(self.history) + 1)
         return self._emit()
 
-    def _ingestible(self, buf):
-        if not buf:
-            return False
-        for regex in self.reject_regexes:
-            if regex.fullmatch(buf):
-                return False
-        return len(self.history) == 0 or buf != self.history[-1]
+    def set_namespace(self, namespace):
+        self.namespace = namespace
+
+    def _duplicate(self, buf):
+        if self.rules.dedupe == "all":
+            return buf in self.metadata.slots
+        if self.rules.dedupe == "consecutive":
+            return bool(self.history) and buf == self.history[-1] and self.namespace == self.entry_namespaces[-1]
+        return False
 
     def ingest(self):
-        if self._ingestible(self._buffer):
-            self.history.append(self._buffer)
-            match = self.search_pattern and self.search_pattern.search(self._buffer)
+        buf = self._buffer and self.rules.apply(self._buffer)
+        if buf:
+            index = -1  # a duplicate keeps the index of its last occurrence
+            if not self._duplicate(buf):
+                index = len(self.history)
+                self.history.append(buf)
+                self.prefix_index.add(buf, len(self.history) - 1)
+                self._add_to_namespace(buf, len(self.history) - 1, self.namespace)
+                match = self.search_pattern and self.search_pattern.search(buf)
+                if match:
+                    self.search_matches.append((len(self.history) - 1, match))
+                    self._ranked_matches = None
+            self.metadata.touch(buf, namespace=self.namespace, index=index)
             self.index = len(self.history)
-            if match:
-                self.search_matches.append((self.index - 1, match))
+        self._rank_pos = -1
         self.set_buffer(b"")
 
     def start_search(self, pattern: str):
         self.search_pattern = re.compile(pattern)
         self.search_matches = []
-        for i, history in enumerate(self.history):
-            match = self.search_pattern.search(history)
+        scope = self._scope
+        indices = range(len(self.history)) if scope is None else self.namespace_indices.get(scope, ())
+        for i in indices:
+            match = self.search_pattern.search(self.history[i])
             if match:
                 self.search_matches.append((i, match))
+        self._ranked_matches = None
+        self._search_rank_pos = -1
+        if tracer.enabled:
+            tracer.record("history_search", {"pattern": pattern, "matches": len(self.search_matches)})
+
+    def ranked_search_matches(self):
+        r"""Return the (history_index, match) pairs of the current search, from the most to the least frecent."""
+        if self._ranked_matches is None:
+            matches = dict(self.search_matches)
+            self._ranked_matches = [(i, matches[i]) for i in self.metadata.ranked_indices(self._scope) if i in matches]
+        return self._ranked_matches
+
+    def _search_ranked(self, step):
+        matches = self.ranked_search_matches()
+        if not matches:
+            return None, None
+        self._search_rank_pos = (self._search_rank_pos + step) % len(matches)
+        self.index, match = matches[self._search_rank_pos]
+        return self._emit(), match
 
     def search_next(self):
+        if self.ranking == "frecency":
+            return self._search_ranked(1)
         if not self.search_matches:
             return None, None
 
@@ -77,6 +432,8 @@ class HistoryManager:
         return self._emit(), match
 
     def search_prev(self):
+        if self.ranking == "frecency":
+            return self._search_ranked(-1)
         if not self.search_matches:
             return None, None
         pos = bisect.bisect_left([key for key, match in self.search_matches], self.index) - 1
@@ -86,6 +443,7 @@ class HistoryManager:
 
     def retrieve_buffer(self):
         self.index = len(self.history)
+        self._rank_pos = -1
         return self._emit()
 
     def skip_buffers(self, n=1):
@@ -100,8 +458,12 @@ class HistoryManager:
     def write_to_disk(self):
         if not self.file:
             return
-        with open(self.file, "a") as f:
-            f.writelines(":" + line + "\n" for line in self.history[self.init_size:])
+        if self.binary:
+            from .history_binary import append_binary
+            append_binary(self.file, self.history[self.init_size:])
+            return
+        with history_lock(self.file), open(self.file, "ab") as f:
+            f.writelines(text_record(entry.encode()) for entry in self.history[self.init_size:])
 
     def set_mark(self, mark):
         self._marks_lookup[mark] = self.index
@@ -115,7 +477,12 @@ class HistoryManager:
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.file and os.path.samefile(self.file, os.path.expanduser("~/.iris_history")):
+        if not self.file:
+            return
+        # the metadata is ours even when IRIS keeps the entries of ~/.iris_history itself
+        self.metadata.save(self.file + ".meta")
+        default = os.path.expanduser("~/.iris_history")
+        if os.path.exists(self.file) and os.path.exists(default) and os.path.samefile(self.file, default):
             return
 
         self.write_to_disk()
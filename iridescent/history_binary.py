@@ -0,0 +1,271 @@
+r"""Versioned binary history format.
+
+Layout (all integers little-endian)::
+
+    header      MAGIC (4s) | version (H) | flags (H) | entries per block (I) | reserved (I)
+    records     length (I) | UTF-8 bytes            -- one per entry, in chronological order
+    offsets     offset (Q)                          -- absolute file offset of each record
+    checksums   crc32 (I)                           -- one per block of `entries per block` records
+    footer      number of entries (Q) | offsets table offset (Q) | reserved (I) | FOOTER_MAGIC (4s)
+
+The header and footer have fixed sizes, so the number of entries, any single entry and any range of entries can be
+located with a constant number of seeks. Checksums cover the raw record bytes of each block, so verifying a range of
+entries only reads the blocks that contain them.
+"""
+import os
+import struct
+import zlib
+from .history import history_lock, text_record, iter_text_entries
+
+MAGIC = b"IRHB"
+FOOTER_MAGIC = b"IRHE"
+VERSION = 1
+ENTRIES_PER_BLOCK = 256
+
+_HEADER = struct.Struct("<4sHHII")
+_FOOTER = struct.Struct("<QQI4s")
+_LENGTH = struct.Struct("<I")
+_OFFSET = struct.Struct("<Q")
+_CHECKSUM = struct.Struct("<I")
+
+
+class HistoryFormatError(ValueError):
+    pass
+
+
+def is_binary_history(file):
+    if not (file and os.path.isfile(file)):
+        return False
+    with open(file, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _encode(entry):
+    # with the error handler entries are decoded with by HistoryManager
+    return entry.encode("utf-8", "replace") if isinstance(entry, str) else entry
+
+
+class BinaryHistoryReader:
+    r"""Random-access reader for binary history files. Entries are returned as raw UTF-8 bytes."""
+
+    def __init__(self, file):
+        self.file = file
+        self._f = open(file, "rb")
+        header = self._f.read(_HEADER.size)
+        if len(header) < _HEADER.size or header[:len(MAGIC)] != MAGIC:
+            self._f.close()
+            raise HistoryFormatError(f"{file} is not a binary history file")
+        _, self.version, self.flags, self.entries_per_block, _ = _HEADER.unpack(header)
+        if self.version > VERSION:
+            self._f.close()
+            raise HistoryFormatError(f"{file} uses binary history version {self.version}, newer than {VERSION}")
+
+        if os.path.exists(file + ".tail"):  # an append was interrupted, or is in progress
+            with history_lock(file):
+                _restore(file)
+            self._f.close()
+            self._f = open(file, "rb")
+        footer = self._read_footer()
+        if footer is None:
+            self._f.close()
+            raise HistoryFormatError(f"{file} is truncated or was not closed properly")
+        self.n_entries, self.table_offset, _, _ = footer
+        self.n_blocks = -(-self.n_entries // self.entries_per_block)
+        self.checksum_offset = self.table_offset + _OFFSET.size * self.n_entries
+
+    def _read_footer(self):
+        if self._f.seek(0, os.SEEK_END) < _HEADER.size + _FOOTER.size:
+            return None
+        self._f.seek(-_FOOTER.size, os.SEEK_END)
+        footer = _FOOTER.unpack(self._f.read(_FOOTER.size))
+        return footer if footer[3] == FOOTER_MAGIC else None
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self.n_entries
+
+    def _offsets(self, start, stop):
+        r"""Return the record offsets of entries [start, stop), plus the offset right after the last of them."""
+        count = stop - start if stop == self.n_entries else stop - start + 1
+        self._f.seek(self.table_offset + _OFFSET.size * start)
+        offsets = [o for o, in _OFFSET.iter_unpack(self._f.read(_OFFSET.size * count))]
+        if stop == self.n_entries:
+            offsets.append(self.table_offset)
+        return offsets
+
+    def _read_records(self, start, stop):
+        offsets = self._offsets(start, stop)
+        self._f.seek(offsets[0])
+        data = self._f.read(offsets[-1] - offsets[0])
+        return offsets, data
+
+    def __getitem__(self, k):
+        if k < 0:
+            k += self.n_entries
+        if not 0 <= k < self.n_entries:
+            raise IndexError(f"history entry {k} out of range")
+        return self.entries(k, k + 1)[0]
+
+    def entries(self, start=0, stop=None):
+        r"""Return entries [start, stop) with one read of the offset table and one read of the records."""
+        stop = self.n_entries if stop is None else min(stop, self.n_entries)
+        if start >= stop:
+            return []
+        offsets, data = self._read_records(start, stop)
+        base = offsets[0]
+        output = []
+        for offset in offsets[:-1]:
+            pos = offset - base
+            length, = _LENGTH.unpack_from(data, pos)
+            output.append(data[pos + _LENGTH.size: pos + _LENGTH.size + length])
+        return output
+
+    def tail(self, n):
+        return self.entries(max(0, self.n_entries - n))
+
+    def _checksums(self, first_block, last_block):
+        self._f.seek(self.checksum_offset + _CHECKSUM.size * first_block)
+        raw = self._f.read(_CHECKSUM.size * (last_block - first_block))
+        return [c for c, in _CHECKSUM.iter_unpack(raw)]
+
+    def verify(self, start=0, stop=None):
+        r"""Verify the checksums of the blocks holding entries [start, stop).
+        Return a list of corrupted block indices."""
+        stop = self.n_entries if stop is None else min(stop, self.n_entries)
+        if start >= stop:
+            return []
+        first_block = start // self.entries_per_block
+        last_block = -(-stop // self.entries_per_block)
+        start = first_block * self.entries_per_block
+        stop = min(last_block * self.entries_per_block, self.n_entries)
+
+        offsets, data = self._read_records(start, stop)
+        expected = self._checksums(first_block, last_block)
+        base = offsets[0]
+        corrupted = []
+        for i, block in enumerate(range(first_block, last_block)):
+            lo = offsets[(block - first_block) * self.entries_per_block] - base
+            hi_idx = min((block - first_block + 1) * self.entries_per_block, len(offsets) - 1)
+            hi = offsets[hi_idx] - base
+            if zlib.crc32(data[lo:hi]) != expected[i]:
+                corrupted.append(block)
+        return corrupted
+
+
+def _write_tables(f, offsets, checksums, n_entries):
+    table_offset = f.tell()
+    f.write(b"".join(_OFFSET.pack(o) for o in offsets))
+    f.write(b"".join(_CHECKSUM.pack(c) for c in checksums))
+    f.write(_FOOTER.pack(n_entries, table_offset, 0, FOOTER_MAGIC))
+    f.truncate()
+
+
+def _write_records(f, entries, offsets, checksums, entries_per_block, pending=b""):
+    r"""Write records at the current position, extending ``offsets`` and ``checksums`` in place.
+    ``pending`` holds the record bytes already written for the last, incomplete block.
+    """
+    block = [pending] if pending else []
+    for entry in entries:
+        entry = _encode(entry)
+        offsets.append(f.tell())
+        record = _LENGTH.pack(len(entry)) + entry
+        f.write(record)
+        block.append(record)
+        if len(offsets) % entries_per_block == 0:
+            checksums.append(zlib.crc32(b"".join(block)))
+            block = []
+    if block:
+        checksums.append(zlib.crc32(b"".join(block)))
+
+
+def write_binary(file, entries, entries_per_block=ENTRIES_PER_BLOCK):
+    r"""Write ``entries`` (str or bytes) into a new binary history file, replacing ``file`` atomically."""
+    tmp = file + ".tmp"
+    offsets, checksums = [], []
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, 0, entries_per_block, 0))
+        _write_records(f, entries, offsets, checksums, entries_per_block)
+        _write_tables(f, offsets, checksums, len(offsets))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, file)
+
+
+def append_binary(file, entries):
+    r"""Append ``entries`` to an existing binary history file, in place.
+    The new records are written over the tables, which are then written again after them, so only the tables and the
+    last (incomplete) block are read, whatever the size of the file. The previous tables are first saved to a sibling
+    ``.tail`` file, from which `_restore` puts them back if the append is interrupted.
+    """
+    tail = file + ".tail"
+    with history_lock(file):
+        _restore(file)
+        with BinaryHistoryReader(file) as reader:
+            n, epb = reader.n_entries, reader.entries_per_block
+            offsets = reader._offsets(0, n)[:-1] if n else []
+            checksums = reader._checksums(0, reader.n_blocks)
+            table_offset = reader.table_offset
+            pending = b""
+            if n % epb:
+                checksums.pop()
+                pending = reader._read_records(n - n % epb, n)[1]
+            reader._f.seek(table_offset)
+            saved = reader._f.read()
+
+        with open(tail, "wb") as f:
+            f.write(saved)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            with open(file, "r+b") as f:
+                f.seek(table_offset)
+                _write_records(f, entries, offsets, checksums, epb, pending)
+                _write_tables(f, offsets, checksums, len(offsets))
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            _restore(file)
+            raise
+        os.remove(tail)
+
+
+def _restore(file):
+    r"""Undo an interrupted `append_binary` to ``file``, if any, by putting back the tables saved in its ``.tail``
+    file. The caller holds the lock of ``file``."""
+    tail = file + ".tail"
+    if not os.path.exists(tail):
+        return
+    with open(tail, "rb") as f:
+        saved = f.read()
+    # an incomplete .tail means the append was interrupted before ``file`` was modified
+    if len(saved) >= _FOOTER.size and saved.endswith(FOOTER_MAGIC):
+        _, table_offset, _, _ = _FOOTER.unpack(saved[-_FOOTER.size:])
+        with open(file, "r+b") as f:
+            f.seek(table_offset)
+            f.write(saved)
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+    os.remove(tail)
+
+
+def text_to_binary(src, dst, entries_per_block=ENTRIES_PER_BLOCK):
+    with open(src, "rb") as f:
+        write_binary(dst, iter_text_entries(f), entries_per_block)
+
+
+def binary_to_text(src, dst):
+    with BinaryHistoryReader(src) as reader:
+        entries = reader.entries()
+    tmp = dst + ".tmp"
+    with open(tmp, "wb") as f:
+        f.writelines(text_record(entry) for entry in entries)
+    os.replace(tmp, dst)
@@ -0,0 +1,175 @@
+import os
+import sys
+import shutil
+import hashlib
+import argparse
+import tempfile
+from .history import history_lock, text_record
+from .ingest import DEFAULT_RULES, IngestRulesError, load_rules
+from .history_binary import BinaryHistoryReader, is_binary_history, text_to_binary, binary_to_text
+
+BLOCK_SIZE = 1 << 20  # bytes read per seek when scanning a file backwards
+
+
+def iter_lines_reversed(f, block_size=BLOCK_SIZE):
+    r"""Yield the lines (without line terminators) of a binary file object from last to first.
+    Memory usage is bounded by ``block_size`` plus the length of the longest line.
+    """
+    f.seek(0, os.SEEK_END)
+    end = f.tell()
+    tail = b""
+    while end > 0:
+        start = max(0, end - block_size)
+        f.seek(start)
+        block = f.read(end - start) + tail
+        end = start
+        lines = block.split(b"\n")
+        # the first piece may be an incomplete line, carry it over to the next (earlier) block
+        tail = lines[0]
+        for line in reversed(lines[1:]):
+            yield line.rstrip(b"\r")
+    yield tail.rstrip(b"\r")
+
+
+def iter_entries_reversed(f, block_size=BLOCK_SIZE):
+    r"""Yield the raw history entries (without the leading ``:``) of a text history file, most recent first."""
+    continuation = []  # the continuation lines of a multi-line entry come before its first line
+    for line in iter_lines_reversed(f, block_size):
+        if line.startswith(b"+"):
+            continuation.append(line[1:])
+            continue
+        if line.startswith(b":"):
+            yield b"\n".join([line[1:]] + continuation[::-1])
+        continuation = []
+
+
+def compact(file, max_size=5000, rules=DEFAULT_RULES, block_size=BLOCK_SIZE):
+    r"""Rewrite a text history file in place, removing duplicates and the entries rejected by ``rules``, and applying
+    its rewrites, e.g. to mask passwords typed before the rule was added.
+
+    Only the most recent occurrence of each entry is kept, and at most ``max_size`` entries are kept (``None`` or ``0``
+    means no limit). The file is scanned backwards, so with a size cap only the tail of the file is read. Surviving
+    entries are spooled to disk rather than kept in memory; the only state that grows is a set of 16-byte digests.
+    The file is locked for the whole operation and atomically replaced at the end.
+
+    Returns a tuple ``(entries_read, entries_kept)``.
+    """
+    directory = os.path.dirname(os.path.abspath(file))
+    n_read, n_kept = 0, 0
+    seen = set()
+
+    with history_lock(file):
+        with tempfile.TemporaryFile(dir=directory) as spool:
+            with open(file, "rb") as f:
+                for entry in iter_entries_reversed(f, block_size):
+                    n_read += 1
+                    text = entry and rules.apply(entry.decode("utf-8", "surrogateescape"))
+                    if not text:
+                        continue
+                    entry = text.encode("utf-8", "surrogateescape")
+                    digest = hashlib.blake2b(entry, digest_size=16).digest()
+                    if digest in seen:
+                        continue
+                    seen.add(digest)
+                    spool.write(text_record(entry))
+                    n_kept += 1
+                    if max_size and n_kept >= max_size:
+                        break
+
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".iris_history.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as out:
+                    # the spool holds the kept entries newest-first; restore chronological order
+                    for entry in iter_entries_reversed(spool, block_size):
+                        out.write(text_record(entry))
+                    out.flush()
+                    os.fsync(out.fileno())
+                shutil.copymode(file, tmp_path)
+                os.replace(tmp_path, file)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    return n_read, n_kept
+
+
+def _compact_command(opt):
+    if not os.path.isfile(opt.history_path):
+        print(f"History file {opt.history_path} does not exist.")
+        return 1
+    if is_binary_history(opt.history_path):
+        print(f"{opt.history_path} is a binary history file. Convert it to text before compacting.")
+        return 1
+    try:
+        rules = load_rules(opt.rules, reject=not opt.no_reject)
+    except IngestRulesError as e:
+        print(e)
+        return 1
+    size_before = os.path.getsize(opt.history_path)
+    n_read, n_kept = compact(opt.history_path, max_size=opt.max_size, rules=rules)
+    size_after = os.path.getsize(opt.history_path)
+    print(
+        f"Compacted {opt.history_path}: kept {n_kept} of {n_read} entries scanned, "
+        f"{size_before} -> {size_after} bytes"
+    )
+    return 0
+
+
+def _convert_command(opt):
+    to_binary = not is_binary_history(opt.src)
+    if to_binary:
+        text_to_binary(opt.src, opt.dst)
+    else:
+        binary_to_text(opt.src, opt.dst)
+    print(f"Converted {opt.src} to {'binary' if to_binary else 'text'} history file {opt.dst}")
+    return 0
+
+
+def _verify_command(opt):
+    with BinaryHistoryReader(opt.history_path) as reader:
+        start = max(0, len(reader) - opt.last) if opt.last else 0
+        corrupted = reader.verify(start)
+        if corrupted:
+            print(f"{opt.history_path}: corrupted blocks {corrupted}")
+            return 1
+        print(f"{opt.history_path}: {len(reader) - start} of {len(reader)} entries verified")
+    return 0
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(prog="iridescent-history", description="Maintenance tools for iridescent history")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    compact_parser = subparsers.add_parser("compact", help="Deduplicate and trim a history file in place")
+    compact_parser.add_argument("--history-path", "-H", type=str, default=os.path.expanduser("~/.iris_history"),
+                                help="Location of history file. Defaults to ~/.iris_history")
+    compact_parser.add_argument("--max-size", "-n", type=int, default=5000,
+                                help="Maximum number of entries to keep (0 for no limit). Defaults to 5000")
+    compact_parser.add_argument("--no-reject", action="store_true",
+                                help="Keep entries that would normally be rejected from history (e.g. `h`, `halt`)")
+    compact_parser.add_argument("--rules", type=str, default=None,
+                                help="Location of the ingest rules to apply. Defaults to ~/.iridescent/ingest.json")
+    compact_parser.set_defaults(func=_compact_command)
+
+    convert_parser = subparsers.add_parser("convert", help="Convert between the text and binary history formats")
+    convert_parser.add_argument("src", type=str, help="History file to convert. Its format is detected automatically")
+    convert_parser.add_argument("dst", type=str, help="Location of the converted history file")
+    convert_parser.set_defaults(func=_convert_command)
+
+    verify_parser = subparsers.add_parser("verify", help="Verify the checksums of a binary history file")
+    verify_parser.add_argument("history_path", type=str, help="Location of the binary history file")
+    verify_parser.add_argument("--last", "-n", type=int, default=0,
+                               help="Only verify the blocks holding the last LAST entries (0 for all)")
+    verify_parser.set_defaults(func=_verify_command)
+
+    return parser
+
+
+def main(argv=None):
+    opt = _build_parser().parse_args(argv)
+    sys.exit(opt.func(opt))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import os
+import re
+import json
+from pathlib import Path
+
+ingest_config_file = Path(os.path.expanduser("~")) / ".iridescent" / "ingest.json"
+
+DEDUPE_MODES = (
+    "consecutive",  # an entry repeating the previous one is not stored again
+    "all",  # an entry already in the history is not stored again
+    "none",
+)
+
+DEFAULT_CONFIG = {
+    "reject": [
+        {"pattern": r"h\s*", "ignore_case": True},
+        {"pattern": r"halt\s*", "ignore_case": True},
+    ],
+    "rewrite": [],
+    "dedupe": "consecutive",
+}
+
+
+class IngestRulesError(ValueError):
+    pass
+
+
+def _scoped(rule, kind):
+    r"""Return the pattern of ``rule`` as a group that can be combined with others, with its own flags"""
+    if isinstance(rule, str):
+        rule = {"pattern": rule}
+    try:
+        re.compile(rule["pattern"])  # report an invalid pattern on its own rather than within the combined one
+    except re.error as e:
+        raise IngestRulesError(f"Invalid pattern in {kind} rule {rule!r}: {e}")
+    except (KeyError, TypeError):
+        raise IngestRulesError(f"The {kind} rule {rule!r} has no pattern")
+    return "(?%s:%s)" % ("i" if rule.get("ignore_case") else "", rule["pattern"])
+
+
+def _replacement(rule):
+    try:
+        return rule["replace"]
+    except (KeyError, TypeError):
+        raise IngestRulesError(f"The rewrite rule {rule!r} has no replace")
+
+
+def _combine(patterns, kind):
+    try:
+        return re.compile("|".join(patterns))
+    except re.error as e:  # e.g. a group name used by two rules
+        raise IngestRulesError(f"The {kind} patterns cannot be combined: {e}")
+
+
+class IngestRules:
+    r"""Rules deciding what is stored in the history, compiled once.
+
+    - ``reject``: entries fully matching any of these patterns are not stored, e.g. `halt`.
+    - ``rewrite``: each match of a pattern is replaced with its ``replace`` template (which may refer to groups of the
+      pattern, e.g. `\1`), e.g. to mask passwords.
+    - ``dedupe``: one of `DEDUPE_MODES`.
+
+    Patterns are strings, or ``{"pattern": ..., "ignore_case": true}``. All reject patterns are combined into a single
+    regular expression, as are the rewrite patterns, so a line is scanned once for each kind of rule, whatever the
+    number of rules. Patterns should not use backreferences, as their groups are renumbered once combined.
+    """
+
+    def __init__(self, reject=(), rewrite=(), dedupe="consecutive"):
+        if dedupe not in DEDUPE_MODES:
+            raise IngestRulesError(f"Invalid dedupe mode {dedupe!r}, expected one of {', '.join(DEDUPE_MODES)}")
+        self.dedupe = dedupe
+        self._reject = _combine([_scoped(rule, "reject") for rule in reject], "reject") if reject else None
+        self._rewrites = [(re.compile(_scoped(rule, "rewrite")), _replacement(rule)) for rule in rewrite]
+        self._rewrite = None
+        if rewrite:
+            self._rewrite = _combine([f"(?P<_{i}>{_scoped(rule, 'rewrite')})" for i, rule in enumerate(rewrite)],
+                                     "rewrite")
+
+    @classmethod
+    def from_config(cls, config):
+        r"""Compile the rules of a config, falling back to the default rules for the kinds it leaves out"""
+        unknown = config.keys() - DEFAULT_CONFIG.keys()
+        if unknown:
+            raise IngestRulesError(f"Unknown keys {', '.join(map(repr, sorted(unknown)))}, expected "
+                                   f"{', '.join(DEFAULT_CONFIG)}")
+        config = {**DEFAULT_CONFIG, **config}
+        return cls(config["reject"], config["rewrite"], config["dedupe"])
+
+    def _replace(self, match):
+        # the rule that matched is the outermost, hence last closed, named group
+        regex, template = self._rewrites[int(match.lastgroup[1:])]
+        return regex.match(match.string, match.start()).expand(template)
+
+    def apply(self, line: str):
+        r"""Return ``line`` as it should be stored in the history, or None if it is rejected"""
+        if self._reject is not None and self._reject.fullmatch(line):
+            return None
+        if self._rewrite is not None:
+            line = self._rewrite.sub(self._replace, line)
+        return line
+
+
+DEFAULT_RULES = IngestRules.from_config({})
+
+
+def load_rules(file=None, reject=True):
+    r"""Return the rules configured in ``file``, or by default in ~/.iridescent/ingest.json, falling back to the
+    default rules if that does not exist. Without ``reject``, no entry is rejected, but the other rules still apply.
+
+    Raises `IngestRulesError`, naming the file and the rule, if the file is not valid, or if ``file`` is given but
+    does not exist.
+    """
+    if file is not None and not Path(file).exists():
+        raise IngestRulesError(f"{file} does not exist")
+    file = ingest_config_file if file is None else Path(file)
+    config = {}
+    if file.exists():
+        try:
+            with open(file) as f:
+                config = json.load(f)
+        except json.JSONDecodeError as e:
+            raise IngestRulesError(f"{file} is not valid JSON: {e}")
+        if not isinstance(config, dict):
+            raise IngestRulesError(f"{file} should hold a JSON object")
+    if not reject:
+        config = {**config, "reject": []}
+    if not config:
+        return DEFAULT_RULES
+    try:
+        return IngestRules.from_config(config)
+    except IngestRulesError as e:
+        raise IngestRulesError(f"{file}: {e}")
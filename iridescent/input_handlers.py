@@ -1,8 +1,9 @@
 from abc import ABC, abstractmethod
+from itertools import groupby
 from .editor import EditorState
 from .keys import KEY, OPTION, SIG, ESCAPE_SEQUENCE, CTRL
 from .vim_actions import Op
-from .utils import printable, vim_word, vim_word_begin, vim_word_end, vim_pair
+from .utils import printable, vim_word, vim_word_begin, vim_word_end, vim_pair, row_col
 
 
 class AbstractKeyStrokeHandler(ABC):
@@ -94,12 +95,27 @@ class HistoryNavigationHandler(AbstractKeyStrokeHandler):
         line = self.filter_obj.current_line
         pos = self.filter_obj.cursor_pos
         # self.filter_obj.debug(line=line, pos=pos)
+        new = self.filter_obj.recall(new)
         self.filter_obj.current_line = new
         self.filter_obj.cursor_pos = len(new)
         return KEY.RIGHT * (len(line) - pos) + KEY.DELETE * len(line) + new
 
+    def _move_vertically(self, up, count=1):
+        r"""Move up to ``count`` lines up or down in a multi-line buffer. Return None if there is no such line."""
+        line = self.filter_obj.current_line
+        if b"\n" not in line:
+            return None
+        row, _ = row_col(line, self.filter_obj.cursor_pos)
+        count = min(count, row if up else line.count(b"\n") - row)
+        if count == 0:
+            return None
+        return self.filter_obj.move_cursor_vertically(-count if up else count)
+
     def handle(self, key, mode):
         self.filter_obj.history_manager.skip_buffers()
+        output = self._move_vertically(key == KEY.UP)
+        if output is not None:
+            return output
         if key == KEY.UP:
             buffer = self.filter_obj.history_manager.go_prev()
         elif key == KEY.DOWN:
@@ -115,6 +131,22 @@ class SigBellHandler(InputModeHandler):
         return b''
 
 
+class TabHandler(InputModeHandler):
+    def accepts_key(self, key):
+        return key == KEY.TAB and self.filter_obj.completer is not None
+
+    def handle(self, key, mode):
+        filter_obj = self.filter_obj
+        insertion, candidates, end = filter_obj.completer.complete(filter_obj.current_line, filter_obj.cursor_pos)
+        if insertion:  # replaces the rest of the token after the cursor
+            rest = end - filter_obj.cursor_pos
+            output = filter_obj.move_cursor_right(rest) + filter_obj.delete(rest) if rest else b""
+            return output + filter_obj.move_cursor_right(insertion)
+        if len(candidates) > 1:
+            filter_obj.show_message(b"  ".join(word.encode() for word in candidates))
+        return b""
+
+
 class LeftHandler(AbstractKeyStrokeHandler):
     def accepts_mode(self, mode):
         return mode in [EditorState.INSERT, EditorState.NORMAL, EditorState.REPLACE]
@@ -135,6 +167,10 @@ class RightHandler(AbstractKeyStrokeHandler):
         return key == KEY.RIGHT
 
     def handle(self, key, mode):
+        filter_obj = self.filter_obj
+        at_line_end = filter_obj.cursor_pos == len(filter_obj.current_line)
+        if mode == EditorState.INSERT and at_line_end and filter_obj.suggestion:
+            return filter_obj.move_cursor_right(filter_obj.suggestion)
         self.filter_obj.history_manager.skip_buffers()
         return self.filter_obj.move_cursor_right()
 
@@ -162,6 +198,8 @@ class LineEndHandler(InputModeHandler):
         return self.filter_obj.is_line_end(key)
 
     def handle(self, key, mode):
+        if key != SIG.INT and mode == EditorState.INSERT and self.filter_obj.continues_block():
+            return self.filter_obj.move_cursor_right(b"\n")
         self.filter_obj.reset_line()
         return KEY.ENTER
 
@@ -189,9 +227,9 @@ class VimActionHandler(NormalModeHandler):
     def accepts_key(self, key):
         if key.decode().isprintable():
             return True
-        if self.filter_obj.state_manager._arg_buffer and key == b"\r":
+        if self.filter_obj.state_manager.collecting_variadic_arg and key in (b"\r", KEY.DELETE):
             return True
-        if (not self.filter_obj.state_manager._action_buffer) and key == CTRL.R:
+        if (not self.filter_obj.state_manager.command_pending) and key in (CTRL.R, CTRL.F, CTRL.T, CTRL.N):
             return True
 
     def handle(self, key, mode):
@@ -205,22 +243,25 @@ class VimActionHandler(NormalModeHandler):
             return b""
 
         output = b""
-        for op in ops:
-            if op == Op.LEFT:
-                self.filter_obj.move_cursor_left()
-                output += KEY.LEFT
-            elif op == Op.RIGHT:
-                self.filter_obj.move_cursor_right()
-                output += KEY.RIGHT
-            elif op == Op.DELETE:
-                self.filter_obj.delete()
-                output += KEY.DELETE
-            elif isinstance(op, (int, bytes)):
-                if isinstance(op, int):
-                    op = op.to_bytes((op.bit_length() + 7) // 8, "big")
-                if op.decode().isprintable():
-                    self.filter_obj.move_cursor_right(op)
-                    output += op
+        # runs of the same op, e.g. from `50x`, are applied at once
+        for kind, run in groupby(ops, key=lambda op: op if isinstance(op, Op) else None):
+            run = list(run)
+            if kind == Op.LEFT:
+                output += self.filter_obj.move_cursor_left(len(run))
+            elif kind == Op.RIGHT:
+                output += self.filter_obj.move_cursor_right(len(run))
+            elif kind == Op.DELETE:
+                output += self.filter_obj.delete(min(len(run), self.filter_obj.cursor_pos))
+            else:
+                for op in run:
+                    if not isinstance(op, (int, bytes)):
+                        continue
+                    if isinstance(op, int):
+                        op = op.to_bytes((op.bit_length() + 7) // 8, "big")
+                    op = self.filter_obj.recall(op)
+                    if op.replace(b"\n", b"").decode().isprintable():
+                        self.filter_obj.move_cursor_right(op)
+                        output += op
 
         return output
 
@@ -230,7 +271,7 @@ class VimEnterHandler(NormalModeHandler, LineEndHandler):
         return NormalModeHandler.accepts_mode(self, mode)
 
     def accepts_key(self, key):
-        return LineEndHandler.accepts_key(self, key) and not self.filter_obj.state_manager._arg_buffer
+        return LineEndHandler.accepts_key(self, key) and not self.filter_obj.state_manager.collecting_variadic_arg
 
 
 class VimNavigationHandler(NormalModeHandler, HistoryNavigationHandler):
@@ -238,7 +279,9 @@ class VimNavigationHandler(NormalModeHandler, HistoryNavigationHandler):
         return NormalModeHandler.accepts_mode(self, mode)
 
     def accepts_key(self, key):
-        if self.filter_obj.state_manager._action_buffer:
+        if self.filter_obj.state_manager.command_pending:
+            return False
+        if key == b"0" and self.filter_obj.state_manager.count_pending:  # as in `10x`
             return False
         return key in [
             KEY.UP, KEY.DOWN,
@@ -255,13 +298,17 @@ class VimNavigationHandler(NormalModeHandler, HistoryNavigationHandler):
 
     def handle(self, key, mode):
         self.filter_obj.history_manager.skip_buffers()
-
-        if key in [KEY.UP, b"k"]:
-            buffer = self.filter_obj.history_manager.go_prev()
-            return HistoryNavigationHandler._set_history(self, buffer)
-
-        if key in [KEY.DOWN, b"j"]:
-            buffer = self.filter_obj.history_manager.go_next()
+        count = self.filter_obj.state_manager.take_count()
+
+        if key in [KEY.UP, b"k", KEY.DOWN, b"j"]:
+            up = key in [KEY.UP, b"k"]
+            output = self._move_vertically(up, count)
+            if output is not None:
+                return output
+            # only the last entry is put in the line
+            hm = self.filter_obj.history_manager
+            for _ in range(min(count, len(hm.history) + 1)):
+                buffer = hm.go_prev() if up else hm.go_next()
             return HistoryNavigationHandler._set_history(self, buffer)
 
         if key == b"G":
@@ -269,19 +316,20 @@ class VimNavigationHandler(NormalModeHandler, HistoryNavigationHandler):
             return HistoryNavigationHandler._set_history(self, buffer)
 
         if key in [KEY.LEFT, b"h"]:
-            self.filter_obj.move_cursor_left()
-            return KEY.LEFT
+            return self.filter_obj.move_cursor_left(count)
 
         if key in [KEY.RIGHT, b"l"]:
-            return self.filter_obj.move_cursor_right()
+            return self.filter_obj.move_cursor_right(count)
 
+        line, pos = self.filter_obj.current_line, self.filter_obj.cursor_pos
         if key == b"0":
-            count = self.filter_obj.cursor_pos
+            count = pos - line.rfind(b"\n", 0, pos) - 1
             self.filter_obj.move_cursor_left(count)
             return count * KEY.LEFT
 
         if key == b"$":
-            count = len(self.filter_obj.current_line) - self.filter_obj.cursor_pos
+            end = line.find(b"\n", pos)
+            count = (len(line) if end == -1 else max(pos, end - 1)) - pos
             self.filter_obj.move_cursor_right(count)
             return count * KEY.RIGHT
 
@@ -296,7 +344,7 @@ class VimNavigationHandler(NormalModeHandler, HistoryNavigationHandler):
         }
         try:
             vf, capital = vf_lookup[key]
-            return self.filter_obj.move_cursor_vim(vf, capital)
+            return self.filter_obj.move_cursor_vim(vf, capital, count)
         except IndexError:
             return b""
 
@@ -1,6 +1,14 @@
-import pexpect as pe
+import sys
+from contextlib import nullcontext
+from .spawn import IrisSpawn, login
 from .filters import DebugLogger, IOFilter
 from .history import HistoryManager
+from .ingest import load_rules, IngestRulesError
+from .completion import Completer
+from .metrics import Metrics, instrument
+from .profiling import Profiler
+from .tracing import tracer
+from .scrollback import ScrollbackStore, N_SEGMENTS
 from .cursor import CursorManager
 from .cli import opt, username, password
 from .keyboard import detect_keys, key_config_file, ESCAPE_SEQUENCE
@@ -8,7 +16,22 @@ from .keys import set_keys
 
 
 def main():
-    with HistoryManager(opt.history_path) as hm, CursorManager():
+    if opt.fanout:
+        from .fanout import main as run_fanout
+        sys.exit(run_fanout(opt, username, password))
+    if opt.run or opt.command:
+        from .batch import main as run_batch
+        sys.exit(run_batch(opt, username, password))
+
+    try:
+        rules = load_rules(opt.ingest_rules)
+    except IngestRulesError as e:
+        sys.exit(f"Invalid ingest rules: {e}")
+    ranking = "frecency" if opt.frecency else "recency"
+    scrollback = ScrollbackStore((opt.scrollback_size << 20) // N_SEGMENTS) if opt.scrollback else nullcontext()
+    with HistoryManager(opt.history_path, rules=rules, ranking=ranking,
+                        prefix_search=opt.prefix_search, scope=opt.history_scope) as hm, CursorManager(), \
+            scrollback as scrollback:
         if not key_config_file.exists():
             print("Keyboard layout not found. Detecting keyboard layout...")
             detect_keys()
@@ -18,12 +41,28 @@ def main():
         set_keys()
 
         debug_logger = DebugLogger(opt.debug_path)
-        io_filter = IOFilter(opt.log_path, debug_logger, history_manager=hm)
+        completer = Completer(opt.instance, username, password) if opt.completion else None
+        io_filter = IOFilter(opt.log_path, debug_logger, history_manager=hm, autosuggest=opt.autosuggest,
+                             completer=completer, scrollback=scrollback, local_edit=opt.local_edit,
+                             predict=opt.predict, input_fd=sys.stdin.fileno(),
+                             escape_timeout=opt.escape_timeout / 1000)
+        metrics = None
+        if opt.metrics:
+            metrics = Metrics(opt.metrics)
+            instrument(io_filter, metrics)
+            metrics.start(opt.metrics_interval)
+        profiler = None
+        if opt.profile:
+            profiler = Profiler(opt.profile_mode)
+            profiler.instrument(io_filter)
+            profiler.start()
+        if opt.trace:
+            tracer.start(opt.trace)
 
-        with pe.spawnu(f"iris terminal {opt.instance}") as c:
+        with IrisSpawn(f"iris terminal {opt.instance}") as c:
 
             try:
-                import signal, fcntl, struct, termios, sys
+                import signal, fcntl, struct, termios
                 # See .interact() docs at https://pexpect.readthedocs.io/en/stable/api/pexpect.html#spawn-class
 
                 def sigwinch_passthrough(sig, data):
@@ -38,12 +77,7 @@ def main():
 
             c.setecho(False)
 
-            if username and password:
-                c.expect("Username:")
-                c.sendline(username)
-
-                c.expect("Password:")
-                c.send(f"{password}\r")
+            login(c, username, password)
 
             print(r"You are communicating with IRIS via pexpect. The escape character is ^]")
             c.interact(
@@ -52,6 +86,12 @@ def main():
                 output_filter=io_filter.filter_output
             )
 
+        if metrics:
+            metrics.stop()
+        if profiler:
+            profiler.stop(opt.profile)
+        tracer.stop()
+
 
 if __name__ == "__main__":
     main()
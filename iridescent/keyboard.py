@@ -57,6 +57,9 @@ def detect_keys():
         ("SIG.INT", "<Ctrl>c"),
         ("SIG.BELL", "<Ctrl>g"),
         ("CTRL.R", "<Ctrl>r"),
+        ("CTRL.F", "<Ctrl>f"),
+        ("CTRL.T", "<Ctrl>t"),
+        ("CTRL.N", "<Ctrl>n"),
 
         ("KEY.DELETE", "<BACKSPACE> on windows or <DELETE> on mac"),
         ("KEY.ESCAPE", "ESC"),
@@ -15,13 +15,17 @@ class SIG:
 
 
 class CTRL:
+    F = b'\x06'
     R = b'\x12'
+    T = b'\x14'
+    N = b'\x0e'
 
 
 class KEY:
     DELETE = b'\x7f'
     ESCAPE = b'\x1b'
     ENTER = b'\r'
+    TAB = b'\t'
 
     UP = b'\x1b[A'
     DOWN = b'\x1b[B'
@@ -41,3 +45,10 @@ def set_keys():
     d = load_strokes()
     for k, v in d.items():
         _attempt_set_key(k, v)
+
+
+def keymap():
+    r"""Return the byte sequences of the keys iridescent knows about, as currently loaded"""
+    return {
+        value for cls in (KEY, OPTION, SIG, CTRL) for value in vars(cls).values() if isinstance(value, bytes) and value
+    } | {ESCAPE_SEQUENCE}
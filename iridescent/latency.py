@@ -0,0 +1,55 @@
+import time
+from collections import deque
+
+WINDOW = 256  # round trips kept for percentiles
+MAX_PENDING = 64
+ECHO_TIMEOUT = 5 * 10 ** 9  # ns after which a send is no longer expected to be echoed, e.g. at a password prompt
+
+
+class EchoTracker:
+    r"""Passive round-trip time estimate between iridescent and IRIS.
+
+    Printable bytes sent to IRIS are echoed back by IRIS. The time between sending them and finding them in the output
+    is a round trip over the network and through IRIS, excluding iridescent's own processing. Sends that are not plain
+    printable text (cursor movements, deletions, line ends) are not tracked, since their echo is not predictable.
+    """
+
+    def __init__(self, window=WINDOW):
+        self.pending = deque()  # (time sent in ns, bytes expected in the echo)
+        self.samples = deque(maxlen=window)  # round-trip times in ns
+
+    def sent(self, data: bytes):
+        if not data or not data.isascii() or not data.decode().isprintable():
+            return
+        if len(self.pending) >= MAX_PENDING:
+            self.pending.popleft()
+        self.pending.append((time.monotonic_ns(), data))
+
+    def received(self, content: bytes):
+        now = time.monotonic_ns()
+        pos = 0
+        while self.pending:
+            sent_at, expected = self.pending[0]
+            found = content.find(expected, pos)
+            if found == -1:
+                if now - sent_at > ECHO_TIMEOUT:
+                    self.pending.popleft()
+                    continue
+                break
+            self.samples.append(now - sent_at)
+            self.pending.popleft()
+            pos = found + len(expected)
+
+    def percentile(self, q):
+        r"""The ``q``-quantile of the recent round-trip times in ns, or None without samples"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self) -> bytes:
+        if not self.samples:
+            return b"Echo round trip: no samples yet"
+        p50, p95, p99 = (self.percentile(q) / 1e6 for q in (0.5, 0.95, 0.99))
+        return f"Echo round trip: p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms " \
+               f"({len(self.samples)} samples)".encode()
@@ -0,0 +1,203 @@
+import os
+import time
+import signal
+import threading
+from array import array
+
+SUB_BUCKET_BITS = 4  # 16 sub-buckets per power of two, i.e. values are recorded within ~6% of their true value
+N_BUCKETS = 64 << SUB_BUCKET_BITS
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+HISTORY_SEARCH_METHODS = ("start_search", "search_next", "search_prev", "go_prev", "go_next")
+
+
+def _bucket_index(value):
+    shift = max(0, value.bit_length() - SUB_BUCKET_BITS - 1)
+    return min(N_BUCKETS - 1, (shift << SUB_BUCKET_BITS) + (value >> shift))
+
+
+def _bucket_value(index):
+    r"""The smallest value recorded into bucket ``index``"""
+    shift = max(0, (index >> SUB_BUCKET_BITS) - 1)
+    return (index - (shift << SUB_BUCKET_BITS)) << shift
+
+
+class Histogram:
+    r"""HDR-style histogram of non-negative integers (durations in ns) over log-linear buckets.
+
+    Buckets are a fixed array of counters, so recording is a couple of integer operations with no allocation. There is
+    a single writer (the thread running the session); readers may see a histogram in the middle of an update, which is
+    at most one sample off.
+    """
+
+    def __init__(self):
+        self.counts = array("Q", bytes(8 * N_BUCKETS))
+        self.count = 0
+        self.sum = 0
+
+    def record(self, value):
+        self.counts[_bucket_index(value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, q):
+        if not self.count:
+            return 0
+        rank, seen = q * self.count, 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return _bucket_value(index)
+        return _bucket_value(N_BUCKETS - 1)
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Metrics:
+    r"""Latency histograms and byte counters of a session, exported in the Prometheus text format."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.histograms = {}  # (name, labels) -> Histogram, where labels is a tuple of (key, value)
+        self.counters = {}  # (name, labels) -> Counter
+        self._stop = threading.Event()
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        if key not in self.histograms:
+            self.histograms[key] = Histogram()
+        return self.histograms[key]
+
+    def counter(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        if key not in self.counters:
+            self.counters[key] = Counter()
+        return self.counters[key]
+
+    def render(self):
+        lines, typed = [], set()
+        for (name, labels), h in sorted(self.histograms.items()):
+            if not h.count:
+                continue
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} summary")
+            for q in QUANTILES:
+                lines.append(f"{name}{_labels(labels + (('quantile', q),))} {h.percentile(q) / 1e9:.9f}")
+            lines.append(f"{name}_sum{_labels(labels)} {h.sum / 1e9:.9f}")
+            lines.append(f"{name}_count{_labels(labels)} {h.count}")
+        for (name, labels), counter in sorted(self.counters.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_labels(labels)} {counter.value}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path=None):
+        r"""Write the metrics to a Prometheus textfile, atomically so that a collector never reads a partial file."""
+        path = path or self.path
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def start(self, interval=0):
+        r"""Dump the metrics on SIGUSR1 and, if ``interval`` is positive, every ``interval`` seconds."""
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda sig, frame: self.dump())
+        if interval > 0:
+            threading.Thread(target=self._dump_periodically, args=(interval,), daemon=True).start()
+
+    def _dump_periodically(self, interval):
+        while not self._stop.wait(interval):
+            self.dump()
+
+    def stop(self):
+        self._stop.set()
+        self.dump()
+
+
+def patch_method(obj, name, decorator):
+    r"""Replace the method ``name`` of the instance ``obj`` with ``decorator(method)``, leaving its class untouched"""
+    setattr(obj, name, decorator(getattr(obj, name)))
+
+
+def instrument(io_filter, metrics):
+    r"""Record the latencies of ``io_filter`` and its history manager into ``metrics``.
+
+    Only the given instances are patched, so nothing is measured (or slowed down) unless metrics are enabled.
+    """
+    clock = time.perf_counter_ns
+    last_handler = ["None"]  # name of the handler that handled the current key
+
+    def tagged_handler(handle, handler_name):
+        def wrapper(key, mode):
+            last_handler[0] = handler_name
+            return handle(key, mode)
+
+        return wrapper
+
+    for handler in io_filter.handlers:
+        patch_method(handler, "handle", lambda f, n=handler.__class__.__name__: tagged_handler(f, n))
+
+    def timed_input(filter_input):
+        histograms = {
+            name: metrics.histogram("iridescent_filter_input_seconds", handler=name)
+            for name in ["None"] + [handler.__class__.__name__ for handler in io_filter.handlers]
+        }
+        input_bytes = metrics.counter("iridescent_input_bytes_total")
+        sent_bytes = metrics.counter("iridescent_sent_bytes_total")
+
+        def wrapper(key):
+            last_handler[0] = "None"
+            start = clock()
+            output = filter_input(key)
+            histograms[last_handler[0]].record(clock() - start)
+            input_bytes.inc(len(key))
+            sent_bytes.inc(len(output))
+            return output
+
+        return wrapper
+
+    def timed_output(filter_output):
+        histogram = metrics.histogram("iridescent_filter_output_seconds")
+        output_bytes = metrics.counter("iridescent_output_bytes_total")
+
+        def wrapper(content):
+            start = clock()
+            output = filter_output(content)
+            histogram.record(clock() - start)
+            output_bytes.inc(len(content))
+            return output
+
+        return wrapper
+
+    def timed_search(method, op):
+        histogram = metrics.histogram("iridescent_history_search_seconds", op=op)
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            output = method(*args, **kwargs)
+            histogram.record(clock() - start)
+            return output
+
+        return wrapper
+
+    patch_method(io_filter, "filter_input", timed_input)
+    patch_method(io_filter, "filter_output", timed_output)
+    for name in HISTORY_SEARCH_METHODS:
+        patch_method(io_filter.history_manager, name, lambda f, op=name: timed_search(f, op))
@@ -0,0 +1,120 @@
+import re
+import time
+from collections import deque
+from functools import lru_cache
+from .screen import screen
+from .color_utils import TextStyle
+
+ENABLE_RTT = 30 * 10 ** 6  # ns; with "auto", predictions are turned on when the median echo round trip exceeds this,
+DISABLE_RTT = 20 * 10 ** 6  # and off again when it drops below this
+PREDICTION_TIMEOUT = 2 * 10 ** 9  # ns after which an unconfirmed prediction is considered wrong
+
+
+@lru_cache(maxsize=1)
+def _echo_position():
+    r"""Regex matching what precedes the echo of a typed character in a chunk of output: the start of the chunk, or a
+    namespace prompt starting its last line, then CSI sequences such as cursor motions"""
+    from .filters import PROMPT_REGEX  # which imports this module
+    return re.compile(rb"(?:.*\r\n%s)?(?:\x1b\[[0-?]*[ -/]*[@-~])*" % PROMPT_REGEX.pattern, re.DOTALL)
+
+
+def _move(columns):
+    if columns > 0:
+        return b"\x1b[%dC" % columns
+    if columns < 0:
+        return b"\x1b[%dD" % -columns
+    return b""
+
+
+class Predictor:
+    r"""Predictive local echo, in the spirit of mosh.
+
+    Characters typed at the end of the line are drawn right away, underlined, and cursor motions are applied right
+    away, instead of waiting for IRIS to echo them. When output from IRIS arrives, the cursor is first put back where
+    IRIS left it, so that the echo overwrites the predictions with what IRIS actually shows, and the predictions that
+    are not echoed yet are drawn again after it.
+
+    Nothing is predicted after a line end until IRIS has echoed a typed character where the cursor is, so that nothing
+    shows up at a prompt that does not echo, e.g. a password prompt, even if the character happens to be in its text.
+    """
+
+    def __init__(self, echo_tracker, mode="auto"):
+        self.echo_tracker = echo_tracker
+        self.mode = mode  # "auto", "always" or "never"
+        self.enabled = mode == "always"
+        self.confirmed = False  # whether IRIS has echoed a typed character since the last line end
+        self._probe = None  # text typed while not confirmed, whose echo confirms
+        self.predictions = deque()  # (time sent in ns, expected echo or None for motions, drawn bytes, columns)
+        self.offset = 0  # columns the cursor on screen is to the right of the cursor of IRIS
+
+    @property
+    def active(self):
+        return self.enabled and self.confirmed
+
+    @property
+    def expecting_echo(self):
+        return bool(self.offset) or self._probe is not None
+
+    def update_enabled(self):
+        if self.mode != "auto":
+            return
+        rtt = self.echo_tracker.percentile(0.5)
+        if rtt is None:
+            return
+        if rtt > ENABLE_RTT:
+            self.enabled = True
+        elif rtt < DISABLE_RTT:
+            self.enabled = False
+
+    def _predict(self, expected, drawn, columns):
+        self.predictions.append((time.monotonic_ns(), expected, drawn, columns))
+        self.offset += columns
+        screen.queue(drawn)
+        screen.flush()
+
+    def typed(self, text):
+        if self.active:
+            self._predict(text, TextStyle.UNDERLINE.bvalue + text + TextStyle.NO_UNDERLINE.bvalue, len(text))
+        elif self.enabled and self._probe is None:
+            self._probe = text
+
+    def moved(self, columns):
+        if self.active:
+            self._predict(None, _move(columns), columns)
+
+    def unpredicted(self, line_end=False):
+        r"""Called for keys whose effect is not predicted. The cursor is still put back on the next output, but the
+        pending predictions are not drawn again, as the key may change what IRIS shows after them."""
+        self.predictions.clear()
+        if line_end:
+            self.confirmed = False
+            self._probe = None
+            self.update_enabled()
+
+    def clear(self):
+        r"""Forget the predictions, e.g. when the line is redrawn from scratch"""
+        self.predictions.clear()
+        self.offset = 0
+
+    def received(self, content):
+        if self._probe is not None and content.startswith(self._probe, _echo_position().match(content).end()):
+            self.confirmed, self._probe = True, None
+        if not self.offset:
+            return content
+
+        if self.predictions and time.monotonic_ns() - self.predictions[0][0] > PREDICTION_TIMEOUT:
+            self.predictions.clear()
+            self.confirmed = False
+        pos = 0
+        while self.predictions:
+            _, expected, _, _ = self.predictions[0]
+            if expected is not None:
+                found = content.find(expected, pos)
+                if found == -1:
+                    break
+                pos = found + len(expected)
+            self.predictions.popleft()
+
+        restore = _move(-self.offset)
+        self.offset = sum(columns for _, _, _, columns in self.predictions)
+        return restore + content + b"".join(drawn for _, _, drawn, _ in self.predictions)
@@ -0,0 +1,144 @@
+import signal
+import marshal
+import cProfile
+from collections import defaultdict
+from .metrics import patch_method
+
+SAMPLE_INTERVAL = 0.001  # seconds of CPU time between two samples of the sampling profiler
+MAX_COLLAPSED_DEPTH = 64
+
+
+def _func_label(func):
+    filename, line, name = func
+    return f"{name} ({filename}:{line})"
+
+
+def _code_key(code):
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+class Profiler:
+    r"""Profile iridescent itself, only while it handles a key, a chunk of output, or a history operation.
+
+    In ``sample`` mode, a `SIGPROF` timer samples the stack every `interval` seconds of CPU time, and samples taken
+    outside of those calls are dropped. The signal handler runs in the session thread between two bytecodes, so samples
+    are not biased towards points where the GIL is released, and no signals arrive while iridescent is idle.
+    In ``cprofile`` mode, `cProfile` is enabled around the outermost of those calls only, so time spent waiting for keys
+    or for IRIS is not profiled either way.
+
+    Both modes write a pstats file (``OUT.pstats``) and a collapsed-stack file (``OUT.collapsed``) for flame graphs.
+    With ``sample``, call counts in the pstats file are numbers of samples.
+    """
+
+    def __init__(self, mode="sample", interval=SAMPLE_INTERVAL):
+        assert mode in ("sample", "cprofile"), f"Unknown profiling mode {mode}"
+        if not hasattr(signal, "setitimer"):  # e.g. on Windows
+            mode = "cprofile"
+        self.mode = mode
+        self.interval = interval
+        self.depth = 0
+        self.samples = defaultdict(int)  # stack, as a tuple of code keys from the outermost frame -> number of samples
+        self._profile = cProfile.Profile() if mode == "cprofile" else None
+
+    def scope(self, method):
+        def wrapper(*args, **kwargs):
+            self.depth += 1
+            if self.depth == 1 and self._profile:
+                self._profile.enable()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.depth -= 1
+                if self.depth == 0 and self._profile:
+                    self._profile.disable()
+
+        return wrapper
+
+    def instrument(self, io_filter):
+        patch_method(io_filter, "filter_input", self.scope)
+        patch_method(io_filter, "filter_output", self.scope)
+        hm = io_filter.history_manager
+        for name in dir(hm):
+            if not name.startswith("_") and callable(getattr(hm, name)):
+                patch_method(hm, name, self.scope)
+
+    def start(self):
+        if self.mode == "sample":
+            signal.signal(signal.SIGPROF, self._sample)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def _sample(self, signum, frame):
+        if not self.depth:
+            return
+        stack = []
+        while frame is not None:
+            stack.append(_code_key(frame.f_code))
+            frame = frame.f_back
+        self.samples[tuple(reversed(stack))] += 1
+
+    def stop(self, out):
+        if self.mode == "sample":
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+            samples = dict(self.samples)
+            stats = self._stats_from_samples(samples)
+            collapsed = {tuple(map(_func_label, stack)): n for stack, n in samples.items()}
+        else:
+            self._profile.create_stats()
+            stats = self._profile.stats
+            collapsed = self._collapse_call_graph(stats)
+        with open(f"{out}.pstats", "wb") as f:  # the format of `pstats.Stats.dump_stats`, which rejects empty stats
+            marshal.dump(stats, f)
+        with open(f"{out}.collapsed", "w") as f:
+            for stack, n in sorted(collapsed.items()):
+                if n > 0:
+                    f.write(f"{';'.join(stack)} {n}\n")
+
+    def _stats_from_samples(self, samples):
+        r"""Convert samples to the `pstats` format: func -> (cc, nc, tt, ct, callers), where callers map to the same
+        tuple without callers for each edge of the call graph."""
+        own, total = defaultdict(int), defaultdict(int)
+        edges = defaultdict(lambda: defaultdict(lambda: [0, 0]))  # callee -> caller -> [own, total]
+        for stack, n in samples.items():
+            own[stack[-1]] += n
+            for func in set(stack):
+                total[func] += n
+            for caller, callee in set(zip(stack, stack[1:])):
+                edges[callee][caller][1] += n
+            if len(stack) > 1:
+                edges[stack[-1]][stack[-2]][0] += n
+
+        dt = self.interval
+        return {
+            func: (total[func], total[func], own[func] * dt, total[func] * dt, {
+                caller: (e_total, e_total, e_own * dt, e_total * dt)
+                for caller, (e_own, e_total) in edges[func].items()
+            })
+            for func in total
+        }
+
+    @staticmethod
+    def _collapse_call_graph(stats):
+        r"""Approximate collapsed stacks (in microseconds) from a call graph, where the time of a function called from
+        several places is attributed to each caller in proportion to the time spent in calls from that caller."""
+        children = defaultdict(dict)
+        for callee, (_, _, _, _, callers) in stats.items():
+            for caller, edge in callers.items():
+                children[caller][callee] = edge
+        collapsed = defaultdict(int)
+
+        def walk(func, stack, ct):
+            _, _, tt, total_ct, _ = stats[func]
+            fraction = ct / total_ct if total_ct else 0
+            labels = stack + (_func_label(func),)
+            collapsed[labels] += round(tt * fraction * 1e6)
+            if len(labels) >= MAX_COLLAPSED_DEPTH:
+                return
+            for child, edge in children[func].items():
+                if _func_label(child) not in labels:
+                    walk(child, labels, edge[3] * fraction)
+
+        for func, (_, _, _, ct, callers) in stats.items():
+            if not callers:
+                walk(func, (), ct)
+        return collapsed
@@ -0,0 +1,32 @@
+import os
+
+
+class _Screen:
+    r"""Terminal control sequences produced locally (colours, cursor shapes, redraws), waiting to be written.
+
+    They are merged into the next chunk of output from IRIS, so that both reach the terminal in a single write and in
+    order. When no output is expected, e.g. after a key that sends nothing to IRIS, `flush` writes them on their own.
+    """
+
+    def __init__(self, fd=1):
+        self.fd = fd
+        self._pending = []
+
+    @property
+    def pending(self):
+        return bool(self._pending)
+
+    def queue(self, data):
+        self._pending.append(data if isinstance(data, bytes) else data.encode())
+
+    def take(self) -> bytes:
+        data = b"".join(self._pending)
+        self._pending.clear()
+        return data
+
+    def flush(self):
+        if self._pending:
+            os.write(self.fd, self.take())
+
+
+screen = _Screen()
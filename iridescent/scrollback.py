@@ -0,0 +1,158 @@
+import os
+import re
+import mmap
+import shutil
+import bisect
+import tempfile
+from array import array
+
+# CSI sequences, OSC sequences and two-byte escapes
+ANSI_REGEX = re.compile(rb"\x1b(?:\[[0-?]*[ -/]*[@-~]|\][^\x07\x1b]*(?:\x07|\x1b\\)|[@-Z\\-_])")
+
+SEGMENT_SIZE = 16 << 20
+N_SEGMENTS = 4
+MAX_LINES = 1 << 20
+SEARCH_BLOCK = 1 << 20
+
+
+class ScrollbackStore:
+    r"""Searchable capture of session output with a fixed memory budget.
+
+    Output is stripped of ANSI escape sequences and carriage returns, then appended to a ring of memory-mapped segment
+    files; once the ring is full, the oldest output is overwritten. Alongside, the store keeps the offset of every line
+    start (at most `max_lines` of them) and the command each stretch of output followed.
+
+    Offsets and line numbers are logical: they keep growing over the session and are mapped into the ring on access.
+    """
+
+    def __init__(self, segment_size=SEGMENT_SIZE, n_segments=N_SEGMENTS, max_lines=MAX_LINES, directory=None):
+        self.segment_size = segment_size
+        self.capacity = segment_size * n_segments
+        self.max_lines = max_lines
+        self.directory = tempfile.mkdtemp(prefix="iridescent-scrollback-", dir=directory)
+        self._files, self._maps = [], []
+        for i in range(n_segments):
+            f = open(os.path.join(self.directory, f"segment-{i}"), "w+b")
+            f.truncate(segment_size)
+            self._files.append(f)
+            self._maps.append(mmap.mmap(f.fileno(), segment_size))
+
+        self.end = 0  # logical offset right after the last byte written
+        self.line_starts = array("Q", [0])
+        self.first_line = 0  # logical line number of line_starts[0]
+        self.commands = []  # list of (logical line number, command), in order
+        self._regex = None
+        self._search_offset = 0  # the next search looks for matches before this offset
+
+    def close(self):
+        for m in self._maps:
+            m.close()
+        for f in self._files:
+            f.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def valid_start(self):
+        return max(0, self.end - self.capacity)
+
+    @property
+    def n_lines(self):
+        return self.first_line + len(self.line_starts)
+
+    def _write(self, data):
+        view = memoryview(data)
+        while view:
+            segment, pos = divmod(self.end % self.capacity, self.segment_size)
+            n = min(len(view), self.segment_size - pos)
+            self._maps[segment][pos:pos + n] = view[:n]
+            view = view[n:]
+            self.end += n
+
+    def _read(self, start, stop):
+        pieces = []
+        while start < stop:
+            segment, pos = divmod(start % self.capacity, self.segment_size)
+            n = min(stop - start, self.segment_size - pos)
+            pieces.append(self._maps[segment][pos:pos + n])
+            start += n
+        return b"".join(pieces)
+
+    def _trim(self):
+        r"""Forget line starts that were overwritten or exceed `max_lines`, and the commands of the lines forgotten.
+        Done in batches to keep appends cheap."""
+        starts = self.line_starts
+        drop = max(bisect.bisect_left(starts, self.valid_start), len(starts) - self.max_lines)
+        if drop > min(4096, self.max_lines // 4):
+            del starts[:drop]
+            self.first_line += drop
+            # commands whose output is gone, except the one the first line left belongs to
+            last = bisect.bisect_right(self.commands, (self.first_line, chr(0x10FFFF))) - 1
+            if last > 0:
+                del self.commands[:last]
+
+    def append(self, content: bytes):
+        data = ANSI_REGEX.sub(b"", content)
+        if b"\r" in data:
+            data = data.replace(b"\r", b"")
+        if not data:
+            return
+
+        base, starts = self.end, self.line_starts
+        i = data.find(b"\n")
+        while i != -1:
+            starts.append(base + i + 1)
+            i = data.find(b"\n", i + 1)
+        self._write(data)
+        self._trim()
+
+    def mark_command(self, command: bytes):
+        r"""Tag the output that follows as produced by ``command``."""
+        self.commands.append((self.n_lines - 1, command.decode(errors="replace")))
+
+    def command_of(self, line_no):
+        i = bisect.bisect_right(self.commands, (line_no, chr(0x10FFFF))) - 1
+        return self.commands[i][1] if i >= 0 else None
+
+    def line(self, line_no):
+        i = line_no - self.first_line
+        stop = self.line_starts[i + 1] if i + 1 < len(self.line_starts) else self.end
+        return self._read(max(self.line_starts[i], self.valid_start), stop).rstrip(b"\n")
+
+    def _first_valid_index(self):
+        return min(bisect.bisect_left(self.line_starts, self.valid_start), len(self.line_starts) - 1)
+
+    def search(self, pattern=None):
+        r"""Find the closest line before the previous match (or the end of output, for a new pattern) that matches.
+
+        Passing no pattern continues the previous search. Returns ``(line_no, line, command)``, or None if there are no
+        more matches.
+        """
+        if pattern is not None:
+            self._regex = re.compile(pattern.encode(), re.MULTILINE)
+            self._search_offset = self.end
+        if self._regex is None:
+            return None
+
+        starts = self.line_starts
+        floor = starts[self._first_valid_index()]
+        hi = self._search_offset
+        while hi > floor:
+            # search blocks from the end, each aligned to a line start
+            i = max(self._first_valid_index(), bisect.bisect_right(starts, max(floor, hi - SEARCH_BLOCK)) - 1)
+            lo = starts[i]
+            match = None
+            for match in self._regex.finditer(self._read(lo, hi)):
+                pass
+            if match is not None:
+                line_no = self.first_line + bisect.bisect_right(starts, lo + match.start()) - 1
+                self._search_offset = starts[line_no - self.first_line]
+                return line_no, self.line(line_no), self.command_of(line_no)
+            hi = lo
+        self._search_offset = floor
+        return None
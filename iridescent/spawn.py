@@ -0,0 +1,42 @@
+import os
+import warnings
+import pexpect as pe
+
+READ_SIZE = 1 << 16  # bytes read from the child per chunk during interact(); pexpect reads 1000
+# `pexpect.spawn.interact` reads through this private, name-mangled method, which is overridden below
+_INTERACT_READ = "_spawn__interact_read"
+
+
+class IrisSpawn(pe.spawn):
+    r"""`pexpect.spawn` that reads the child's output in larger chunks during `interact`.
+
+    Bulk output (e.g. `zwrite ^Global` or SQL result sets) then reaches the output filter and the terminal in fewer,
+    larger chunks. Keystrokes are still read from stdin in small chunks.
+    """
+
+    def __init__(self, *args, read_size=READ_SIZE, **kwargs):
+        kwargs.setdefault("encoding", "utf-8")
+        super().__init__(*args, **kwargs)
+        self.interact_read_size = read_size
+
+
+def _interact_read(self, fd):
+    return os.read(fd, self.interact_read_size if fd == self.child_fd else 1000)
+
+
+# import-time check, as pexpect may rename its private method: fall back to its own reads rather than silently
+# defining a method nothing calls
+if hasattr(pe.spawn, _INTERACT_READ):
+    setattr(IrisSpawn, _INTERACT_READ, _interact_read)
+else:
+    warnings.warn(f"pexpect {pe.__version__} has no `spawn.__interact_read`, output is read in chunks of its own size")
+
+
+def login(child, username=None, password=None):
+    r"""Answer the login prompts of `iris terminal` if credentials are given"""
+    if username and password:
+        child.expect("Username:")
+        child.sendline(username)
+
+        child.expect("Password:")
+        child.send(f"{password}\r")
@@ -0,0 +1,50 @@
+class Autosuggester:
+    r"""Fish-style suggestions: the history entry that extends the current line, most recent (or most frecent) first.
+
+    The result for the previous line is cached. When a character is typed, the cached entry is still the best candidate
+    if it starts with the new line, because no better-ranked entry could start with the longer line without starting
+    with the shorter one. Otherwise, only the entries the prefix index has for the new line are considered.
+    """
+
+    def __init__(self, history_manager):
+        self.hm = history_manager
+        self._line = None
+        self._entry = None
+        self._history_len = -1
+
+    def _invalidate(self):
+        self._line, self._entry = None, None
+
+    def _lookup_recent(self, line):
+        hm = self.hm
+        index = hm.prefix_index.prev(line, len(hm.history), hm.history, skip=line)
+        return hm.history[index] if index >= 0 else None
+
+    def _lookup_frecent(self, line):
+        hm = self.hm
+        slots, scores = hm.metadata.slots, hm.metadata.scores
+        candidates = {hm.history[index] for index in hm.prefix_index.indices(line)}
+        candidates = [slots[entry] for entry in candidates if entry != line and entry.startswith(line)]
+        # in the order of `HistoryMetadata.ranked`
+        return hm.metadata.entries[min(candidates, key=lambda slot: (-scores[slot], slot))] if candidates else None
+
+    def suggest(self, line: bytes) -> bytes:
+        r"""Return the suffix that completes ``line`` into a history entry, or an empty bytes string."""
+        if not line:
+            self._invalidate()
+            return b""
+        if len(self.hm.history) != self._history_len:
+            self._history_len = len(self.hm.history)
+            self._invalidate()
+
+        text = line.decode(errors="replace")
+        narrowing = self._line is not None and text.startswith(self._line)
+        if narrowing and (self._entry is None or (self._entry.startswith(text) and self._entry != text)):
+            entry = self._entry
+        elif self.hm.ranking == "frecency":
+            entry = self._lookup_frecent(text)
+        else:
+            entry = self._lookup_recent(text)
+
+        self._line, self._entry = text, entry
+        return entry[len(text):].encode() if entry else b""
@@ -0,0 +1,112 @@
+from bisect import bisect_right
+from functools import lru_cache
+from .utils import _get_group, _ByteGroup
+
+OPENING = b"([{<"
+CLOSING = b")]}>"
+QUOTE = ord('"')
+
+
+def _group(byte, capital):
+    try:
+        return _get_group(byte, capital)
+    except ValueError:  # e.g. UTF-8 encoded letters
+        return _ByteGroup.ALPHANUMERIC
+
+
+class TextObjects:
+    r"""Structure of a line: matching brackets, string literals and words.
+
+    The line is parsed once, and text objects (`i(`, `a"`, `iw`, ...) and `%` are then answered with a binary search
+    over the brackets, strings and words, rather than by scanning the line. Brackets are matched per kind and with
+    nesting, and brackets within string literals are ignored. As in ObjectScript, `""` within a string literal is an
+    escaped quote.
+    """
+
+    def __init__(self, line: bytes):
+        self.line = line
+        self.matches = {}  # position of a bracket -> position of its matching bracket
+        self.strings = []  # (open, close) positions of the quotes of each string literal, in order
+        self._string_starts = []
+        self._segments = {}  # opening bracket -> (positions where the innermost pair changes, innermost pair)
+        self._parents = {}  # pair -> the pair of the same kind it is nested in, or None
+        self._words = {}  # capital -> positions where a run of bytes of the same group starts
+        self._parse()
+
+    def _parse(self):
+        line = self.line
+        stacks = {opening: [] for opening in OPENING}
+        i = 0
+        while i < len(line):
+            ch = line[i]
+            if ch == QUOTE:
+                close = i + 1
+                while close < len(line) and (line[close] != QUOTE or line[close + 1: close + 2] == b'"'):
+                    close += 2 if line[close] == QUOTE else 1
+                if close < len(line):  # an unterminated string runs to the end of the line
+                    self.strings.append((i, close))
+                    self._string_starts.append(i)
+                i = close + 1
+                continue
+            if ch in OPENING:
+                stacks[ch].append(i)
+            elif ch in CLOSING:
+                stack = stacks[OPENING[CLOSING.index(ch)]]
+                if stack:  # unmatched closing brackets are ignored
+                    begin = stack.pop()
+                    self.matches[begin], self.matches[i] = i, begin
+            i += 1
+
+        for opening, closing in zip(OPENING, CLOSING):
+            starts, pairs, enclosing = [0], [None], []
+            for pos in sorted(pos for pos in self.matches if line[pos] in (opening, closing)):
+                if line[pos] == opening:
+                    self._parents[pos, self.matches[pos]] = enclosing[-1] if enclosing else None
+                    enclosing.append((pos, self.matches[pos]))
+                    starts.append(pos)
+                    pairs.append(enclosing[-1])
+                else:  # the closing bracket still belongs to its pair
+                    enclosing.pop()
+                    starts.append(pos + 1)
+                    pairs.append(enclosing[-1] if enclosing else None)
+            self._segments[opening] = starts, pairs
+
+    def match(self, pos):
+        r"""Return the position of the bracket matching the one at ``pos``, or ``pos`` if there is none"""
+        return self.matches.get(pos, pos)
+
+    def pair(self, pos, bracket, count=1):
+        r"""Return the positions of the ``count``-th innermost pair of ``bracket`` (either side) around ``pos``, or
+        None. The brackets themselves count as being within the pair."""
+        opening = OPENING[(OPENING + CLOSING).index(bracket) % len(OPENING)]
+        starts, pairs = self._segments[opening]
+        span = pairs[bisect_right(starts, pos) - 1]
+        for _ in range(count - 1):
+            if span is None:
+                return None
+            span = self._parents[span]
+        return span
+
+    def string(self, pos):
+        r"""Return the positions of the quotes of the string literal around ``pos``, or None"""
+        index = bisect_right(self._string_starts, pos) - 1
+        if index >= 0 and self.strings[index][1] >= pos:
+            return self.strings[index]
+        return None
+
+    def word(self, pos, capital=False):
+        r"""Return the first and last positions of the word (or run of whitespace) at ``pos``"""
+        if capital not in self._words:
+            line = self.line
+            self._words[capital] = [i for i in range(len(line))
+                                    if i == 0 or _group(line[i], capital) != _group(line[i - 1], capital)]
+        starts = self._words[capital]
+        index = bisect_right(starts, pos) - 1
+        end = starts[index + 1] - 1 if index + 1 < len(starts) else len(self.line) - 1
+        return starts[index], end
+
+
+@lru_cache(maxsize=8)
+def text_objects(line: bytes) -> TextObjects:
+    r"""Return the parsed structure of ``line``, which is cached, as the line is queried again until it is edited"""
+    return TextObjects(line)
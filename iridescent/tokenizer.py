@@ -0,0 +1,101 @@
+import os
+import select
+
+ESCAPE_TIMEOUT = 0.025  # seconds to wait for the rest of a key whose first bytes arrived, e.g. after a lone ESC
+_ESC = 0x1b
+_COMPLETE = None  # trie node entry marking the end of a key
+
+
+def _utf8_length(lead):
+    if lead >= 0xf0:
+        return 4
+    if lead >= 0xe0:
+        return 3
+    if lead >= 0xc0:
+        return 2
+    return 1
+
+
+def _sequence_length(data, i):
+    r"""Return the length of the CSI (`ESC [ ... final`) or SS3 (`ESC O x`) sequence at ``i``, 0 if it is not one, or
+    None if it is cut off by the end of ``data``"""
+    kind = data[i + 1: i + 2]
+    if kind == b"O":
+        return 3 if i + 2 < len(data) else None
+    if kind != b"[":
+        return 0
+    for j in range(i + 2, len(data)):
+        if 0x40 <= data[j] <= 0x7e:  # final byte
+            return j - i + 1
+        if not 0x20 <= data[j] <= 0x3f:  # neither a parameter nor an intermediate byte
+            return 0
+    return None
+
+
+class KeyTokenizer:
+    r"""Splits chunks of input into keys.
+
+    Fast typing, key repeat or a paste deliver several keys in one read, e.g. `ESC d w` as `b"\x1bdw"`. Known keys
+    (the keymap, e.g. arrows and <Option> combinations) are matched with a byte trie, longest first; other escape
+    sequences and UTF-8 characters are kept whole, and anything else is a key of its own.
+
+    When a chunk ends in the middle of a key that may be longer, e.g. with a lone ESC, the rest is waited for on ``fd``
+    for ``timeout`` seconds, as terminals send a key in one write. Without ``fd``, the key is taken as it is.
+    """
+
+    def __init__(self, keys, fd=None, timeout=ESCAPE_TIMEOUT):
+        self.fd = fd
+        self.timeout = timeout
+        self._trie = {}
+        for key in keys:
+            node = self._trie
+            for byte in key:
+                node = node.setdefault(byte, {})
+            node[_COMPLETE] = key
+
+    def _next(self, data, i, final):
+        r"""Return the end of the key starting at ``i``, or None if it may continue after ``data``"""
+        node, j, end = self._trie, i, None
+        while j < len(data) and data[j] in node:
+            node = node[data[j]]
+            j += 1
+            if _COMPLETE in node:
+                end = j
+        if j == len(data) and len(node) > (_COMPLETE in node) and not final:
+            return None
+        if end is not None and end - i > 1:
+            return end
+
+        if data[i] == _ESC:
+            length = _sequence_length(data, i)
+            if length is None and not final:
+                return None
+            if length:
+                return i + length
+        elif data[i] >= 0xc0:
+            length = _utf8_length(data[i])
+            if i + length > len(data) and not final:
+                return None
+            return min(i + length, len(data))
+        return i + 1
+
+    def tokenize(self, data, final=True):
+        r"""Return the keys in ``data``, and the bytes at the end that may be the beginning of a longer key"""
+        keys, i = [], 0
+        while i < len(data):
+            end = self._next(data, i, final)
+            if end is None:
+                break
+            keys.append(data[i:end])
+            i = end
+        return keys, data[i:]
+
+    def feed(self, data):
+        r"""Return the keys in ``data``, waiting for the rest of a key that is cut off at the end"""
+        keys, rest = self.tokenize(data, final=self.fd is None)
+        while rest:
+            ready, _, _ = select.select([self.fd], [], [], self.timeout)
+            more = os.read(self.fd, 1024) if ready else b""
+            tail, rest = self.tokenize(rest + more, final=not more)
+            keys += tail
+        return keys
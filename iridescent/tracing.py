@@ -0,0 +1,83 @@
+import json
+import time
+import threading
+
+CAPACITY = 1 << 16  # events kept in memory between two flushes
+FLUSH_INTERVAL = 0.5  # seconds
+
+
+def _jsonable(data):
+    if isinstance(data, bytes):
+        return data.decode(errors="backslashreplace")
+    if isinstance(data, dict):
+        return {k: _jsonable(v) for k, v in data.items()}
+    return data
+
+
+class Tracer:
+    r"""Structured event trace of a session, written as JSON lines.
+
+    Call sites check `enabled` before calling `record`, so a disabled tracer costs one attribute lookup. When enabled,
+    recording stores a tuple in a preallocated ring buffer; formatting and writing happen in a background thread. If
+    the writer falls behind by more than `capacity` events, the oldest unwritten events are dropped and a ``dropped``
+    event says how many.
+    """
+
+    def __init__(self, capacity=CAPACITY):
+        self.enabled = False
+        self.capacity = capacity
+        self._ring = [None] * capacity
+        self._head = 0  # number of events recorded so far; the next event goes to `_ring[_head % capacity]`
+        self._flushed = 0  # number of events written or dropped so far
+        self._file = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, event, data=None):
+        head = self._head
+        self._ring[head % self.capacity] = (time.monotonic_ns(), event, data)
+        self._head = head + 1
+
+    def start(self, path, flush_interval=FLUSH_INTERVAL):
+        self._file = open(path, "a")
+        self._stop.clear()
+        self.enabled = True
+        self._thread = threading.Thread(target=self._flush_periodically, args=(flush_interval,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        self._file.close()
+        self._file = None
+
+    def _flush_periodically(self, flush_interval):
+        while not self._stop.wait(flush_interval):
+            self.flush()
+
+    def flush(self):
+        head = self._head
+        start = max(self._flushed, head - self.capacity)
+        events = [self._ring[i % self.capacity] for i in range(start, head)]
+        # events that the session thread may have overwritten while they were copied
+        overwritten = max(0, self._head - self.capacity - start)
+        events = events[overwritten:]
+        dropped = start + overwritten - self._flushed
+
+        lines = []
+        if dropped:
+            lines.append(json.dumps({"t": events[0][0] if events else time.monotonic_ns(), "event": "dropped",
+                                     "data": dropped}))
+        for t, event, data in events:
+            lines.append(json.dumps({"t": t, "event": event, "data": _jsonable(data)}))
+        if lines:
+            self._file.write("\n".join(lines) + "\n")
+            self._file.flush()
+        self._flushed = head
+
+
+tracer = Tracer()
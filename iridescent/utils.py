@@ -1,3 +1,4 @@
+import re
 from string import ascii_letters, digits, punctuation, whitespace
 from enum import Enum
 
@@ -177,18 +178,79 @@ def vim_word_begin(content, npos, capital=False):  # emulate "b"/"B" in vim
         grp = newgrp
 
 
+def repeat_motion(vf, content, npos, capital=False, count=1):
+    r"""Apply the motion ``vf`` ``count`` times, e.g. for `3w`. Stop early at either end of ``content``."""
+    for _ in range(count):
+        if not 0 <= npos < len(content):
+            break
+        new = vf(content, npos, capital)
+        if new == npos:
+            break
+        npos = new
+    return npos
+
+
 def vim_line_end(content, npos, capital=False):
     r"""Return the position of end of line"""
     assert capital is False
     assert 0 <= npos < len(content)
-    return len(content) - 1
+    end = content.find(b"\n", npos)
+    return len(content) - 1 if end == -1 else max(npos, end - 1)
 
 
 def vim_line_begin(content, npos, capital=False):
     r"""Return the position of begin of line"""
     assert capital is False
     assert 0 <= npos < len(content)
-    return 0
+    return content.rfind(b"\n", 0, npos) + 1
+
+
+def row_col(content, pos):
+    r"""Return the row and the column of ``pos`` in a buffer of several lines"""
+    return content.count(b"\n", 0, pos), pos - content.rfind(b"\n", 0, pos) - 1
+
+
+def vertical_position(content, pos, rows):
+    r"""Return the position ``rows`` lines below (or above, if negative) ``pos``, in the same column if the line is
+    long enough. Return -1 if there is no such line."""
+    row, col = row_col(content, pos)
+    lines = content.split(b"\n")
+    if not 0 <= row + rows < len(lines):
+        return -1
+    start = sum(len(line) + 1 for line in lines[:row + rows])
+    return start + min(col, len(lines[row + rows]))
+
+
+_STRING_LITERAL = re.compile(rb'"[^"]*"')
+
+
+def strip_comment(line):
+    r"""Return ``line`` without its ObjectScript comment (`//` or `;` outside string literals)"""
+    in_string = False
+    for i, ch in enumerate(line):
+        if ch == ord('"'):
+            in_string = not in_string
+        elif not in_string and (ch == ord(";") or line.startswith(b"//", i)):
+            return line[:i]
+    return line
+
+
+def open_blocks(content):
+    r"""Return the number of `{` not closed by a `}` in ObjectScript code, ignoring strings and comments"""
+    depth = 0
+    for line in content.split(b"\n"):
+        code = _STRING_LITERAL.sub(b"", strip_comment(line))
+        depth += code.count(b"{") - code.count(b"}")
+    return depth
+
+
+def join_block(content):
+    r"""Join the lines of an ObjectScript block into one line that the terminal can execute.
+    Comments are dropped, and lines are separated by two spaces, which also ends commands without arguments."""
+    if b"\n" not in content:
+        return content
+    lines = (strip_comment(line).strip() for line in content.split(b"\n"))
+    return b"  ".join(line for line in lines if line)
 
 
 def vim_find(content: bytes, npos: int, ch: bytes, capital: bool = False):
@@ -222,32 +284,7 @@ def vim_pair(content: bytes, npos: int, capital: bool = False):
     r"""
     Return the matching position of the current char. If nonexistent, return the same npos.
     """
+    from .textobjects import text_objects
     assert 0 <= npos < len(content)
     assert capital is False
-    _lookup = {
-        b"(": (b")", 1),
-        b"<": (b">", 1),
-        b"{": (b"}", 1),
-        b"[": (b"]", 1),
-        b")": (b"(", -1),
-        b">": (b"<", -1),
-        b"}": (b"{", -1),
-        b"]": (b"[", -1),
-    }
-
-    epush = content[npos: npos + 1]
-    if epush not in _lookup:
-        return npos
-    epop, direction = _lookup[epush]
-
-    stack = []
-    end = len(content) if direction > 0 else -1
-    for i in range(npos, end, direction):
-        ch = content[i:i + 1]
-        if ch == epush:
-            stack.append(epush)
-        elif ch == epop:
-            stack.pop()
-        if not stack:
-            return i
-    return npos
+    return text_objects(content).match(npos)
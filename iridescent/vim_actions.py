@@ -1,13 +1,17 @@
+import re
 import warnings
 from enum import Enum
 from abc import ABC, abstractmethod
+from functools import lru_cache
 from string import ascii_lowercase, ascii_uppercase
-from typing import List, Union, Tuple
+from typing import List, Sequence, Union, Tuple
 from .keys import KEY, CTRL
 from .utils import printable
-from .utils import vim_word, vim_word_begin, vim_word_end, vim_word_boundary, vim_line_begin, vim_line_end
-from .utils import vim_find, vim_till
+from .utils import vim_word, vim_word_begin, vim_word_end, vim_line_begin, vim_line_end
+from .utils import vim_find, repeat_motion
+from .textobjects import text_objects
 from .clipboard import clipboard
+from .tracing import tracer
 
 ascii_lowercase = ascii_lowercase.encode()
 ascii_uppercase = ascii_uppercase.encode()
@@ -16,6 +20,8 @@ ascii_uppercase = ascii_uppercase.encode()
 _search_forward = True
 # Used by the @register_action decorator to store the mapping from ActionEnum to Action
 _action_lookup = {}
+# and the mapping back, from Action to ActionEnum
+_action_enums = {}
 # Last action and argument, to be used by the repeat (dot) command
 _last_action_arg = None
 # redo and undo stacks, used by the repeat and undo/redo commands
@@ -64,13 +70,20 @@ class StartHistorySearchOp(SpecialOp):
 
 
 class NavigateHistoryOp(SpecialOp):
-    def __init__(self, forward):
-        super().__init__(forward)
+    def __init__(self, forward, count=1):
+        super().__init__(forward, count)
 
     def control(self, editor_state_manager, ops):
         hm = editor_state_manager.filter_obj.history_manager
-        line, match = hm.search_next() if self.args[0] else hm.search_prev()
+        forward, count = self.args
+        line = None
+        for _ in range(min(count, len(hm.history))):
+            line, match = hm.search_next() if forward else hm.search_prev()
+            if not line:
+                break
         hm.skip_buffers()
+        if tracer.enabled:
+            tracer.record("history_search_step", {"forward": forward, "found": bool(line)})
 
         if not line:  # if the match_pattern is not found, don't delete anything
             ops.clear()
@@ -113,12 +126,69 @@ class ClipboardCopyOp(SpecialOp):
             clipboard.copy(content)
 
 
+class SearchScrollbackOp(SpecialOp):
+    def __init__(self, pattern, incremental=False):
+        super().__init__(pattern, incremental)
+
+    def control(self, editor_state_manager, ops):
+        pattern, incremental = self.args
+        filter_obj = editor_state_manager.filter_obj
+        filter_obj.history_manager.skip_buffers()
+        if filter_obj.scrollback is None:
+            return
+        try:
+            match = filter_obj.scrollback.search(pattern or None)  # an empty pattern continues the previous search
+        except re.error as e:
+            if not incremental:  # the pattern may not be typed in full yet, e.g. `\(`
+                filter_obj.show_message(f"Invalid pattern: {e}".encode(), replace=True)
+            return
+        if match is None:
+            filter_obj.show_message(b"Pattern not found in scrollback", replace=True)
+            return
+        line_no, line, command = match
+        # redrawn in place on every key of the pattern, rather than scrolling
+        filter_obj.show_message(f"[{line_no + 1}] {command or ''}> ".encode() + line, replace=True)
+
+
+class ShowLatencyOp(SpecialOp):
+    def control(self, editor_state_manager, ops):
+        filter_obj = editor_state_manager.filter_obj
+        filter_obj.history_manager.skip_buffers()
+        filter_obj.show_message(filter_obj.echo_tracker.summary())
+
+
+class ToggleHistoryScopeOp(SpecialOp):
+    def control(self, editor_state_manager, ops):
+        filter_obj = editor_state_manager.filter_obj
+        filter_obj.history_manager.skip_buffers()
+        scope = filter_obj.history_manager.toggle_scope()
+        filter_obj.show_message(b"History: " + (b"this namespace only" if scope == "namespace" else b"all namespaces"))
+
+
 ActionOutput = Union[
-    List[Union[Op, bytes]],
-    Tuple[List[Union[Op, bytes]], List[SpecialOp]]
+    Sequence[Union[Op, bytes]],
+    Tuple[Sequence[Union[Op, bytes]], List[SpecialOp]]
 ]
 
 
+class RecordMacroOp(SpecialOp):
+    def __init__(self, register):
+        super().__init__(register)
+
+    def control(self, editor_state_manager, ops):
+        register, = self.args
+        editor_state_manager.filter_obj.history_manager.skip_buffers()
+        editor_state_manager.start_recording(register)
+
+
+class ReplayMacroOp(SpecialOp):
+    def __init__(self, register, count):
+        super().__init__(register, count)
+
+    def control(self, editor_state_manager, ops):
+        editor_state_manager.request_replay(*self.args)
+
+
 class ActionEnum(Enum):  # vim-like actions
     f = b"f"  # find
     t = b"t"  # till
@@ -127,6 +197,7 @@ class ActionEnum(Enum):  # vim-like actions
 
     d = b"d"  # delete
     di = b"di"  # delete in-between
+    da = b"da"  # delete around
     dt = b"dt"  # delete till
     dT = b"dT"  # delete till (backwards)
     df = b"df"  # delete find
@@ -135,6 +206,7 @@ class ActionEnum(Enum):  # vim-like actions
 
     c = b"c"  # change
     ci = b"ci"  # change in-between
+    ca = b"ca"  # change around
     ct = b"ct"  # change till
     cT = b"cT"  # change till (backwards)
     cf = b"cf"  # change find
@@ -143,6 +215,7 @@ class ActionEnum(Enum):  # vim-like actions
 
     y = b"y"  # yank
     yi = b"yi"  # yank in-between
+    ya = b"ya"  # yank around
     yt = b"yt"  # yank till
     yT = b"yT"  # yank till (backwards)
     yf = b"yf"  # yank find
@@ -172,6 +245,19 @@ class ActionEnum(Enum):  # vim-like actions
     m = b"m"  # set mark
     backtick = b"`"  # retrieve mark
 
+    ctrl_f = CTRL.F  # search scrollback
+    ctrl_t = CTRL.T  # show echo round-trip time
+    ctrl_n = CTRL.N  # toggle namespace-scoped history
+
+    q = b"q"  # record macro
+    at = b"@"  # replay macro
+
+
+@lru_cache(maxsize=1024)
+def _repeat(op: Op, n: int) -> Tuple[Op, ...]:
+    r"""``op`` ``n`` times. The tuple is shared by every action that needs it, rather than built for each key."""
+    return (op,) * n
+
 
 def register_action(action: ActionEnum, transform_cls=None):
     if transform_cls is None:
@@ -179,6 +265,7 @@ def register_action(action: ActionEnum, transform_cls=None):
 
     def wrapper(cls):
         _action_lookup[action] = transform_cls(cls)
+        _action_enums[_action_lookup[action]] = action
         return cls
 
     return wrapper
@@ -216,19 +303,22 @@ class Action(ABC):
     UNDOABLE = True  # controls whether this action can be undone
     PRESERVE_REDO_STACK = False  # controls whether this action clears the redo stack
 
+    def __init__(self, count=1):
+        self.count = count  # e.g. 3 for `3x`, or 6 for `2d3w`; actions that don't take a count ignore it
+
     def left(self, n):
-        return [Op.LEFT] * n
+        return _repeat(Op.LEFT, n)
 
     def right(self, n):
-        return [Op.RIGHT] * n
+        return _repeat(Op.RIGHT, n)
 
     def delete(self, n):
-        return [Op.DELETE] * n
+        return _repeat(Op.DELETE, n)
 
     def act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
         if self.REPEATABLE:
             global _last_action_arg
-            _last_action_arg = (self.__class__, arg)
+            _last_action_arg = (self.__class__, arg, self.count)
         if self.UNDOABLE:
             if (not _undo_stack) or _undo_stack[-1] != (line, pos):
                 _undo_stack.append((line, pos))
@@ -240,11 +330,23 @@ class Action(ABC):
     def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
         pass
 
+    def on_partial_arg(self, arg: bytes) -> List[SpecialOp]:
+        r"""Special ops to run after each key of a variadic argument, before its terminator"""
+        return []
+
+    def find(self, line: bytes, pos: int, ch: bytes, capital: bool, till=False):
+        r"""Like `vim_find` (or `vim_till`), for the `count`-th occurrence of ``ch``"""
+        for _ in range(self.count):
+            pos = vim_find(line, pos, ch, capital)
+            if not 0 <= pos < len(line):
+                return pos
+        return pos + (1 if capital else -1) if till else pos
+
     def delete_line(self, line: bytes, pos: int):
         return self.right(len(line) - pos) + self.delete(len(line))
 
     def swap(self, line, pos, new_line, new_pos):
-        return self.delete_line(line, pos) + [new_line] + self.left(len(new_line) - new_pos)
+        return self.delete_line(line, pos) + (new_line,) + self.left(len(new_line) - new_pos)
 
 
 @register_action(ActionEnum.f)
@@ -252,7 +354,7 @@ class Find(Action):
     N_ARGS = 1
 
     def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
-        new = vim_find(line, pos, arg, capital=False)
+        new = self.find(line, pos, arg, capital=False)
         if not 0 <= new < len(line):
             return []
         return self.right(new - pos)
@@ -263,7 +365,7 @@ class Till(Action):
     N_ARGS = 1
 
     def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
-        new = vim_till(line, pos, arg, capital=False)
+        new = self.find(line, pos, arg, capital=False, till=True)
         if not 0 <= new < len(line):
             return []
         return self.right(new - pos)
@@ -274,7 +376,7 @@ class FindBackwards(Action):
     N_ARGS = 1
 
     def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
-        new = vim_find(line, pos, arg, capital=True)
+        new = self.find(line, pos, arg, capital=True)
         if not 0 <= new < len(line):
             return []
         return self.left(pos - new)
@@ -285,7 +387,7 @@ class TillBackwards(Action):
     N_ARGS = 1
 
     def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
-        new = vim_till(line, pos, arg, capital=True)
+        new = self.find(line, pos, arg, capital=True, till=True)
         if not 0 <= new < len(line):
             return []
         return self.left(pos - new)
@@ -320,7 +422,7 @@ class Delete(Action):
             return [], []
 
         vf, cap, offset = self._VF_CAP_OFFSET_LOOKUP[arg]
-        new = vf(line, pos, cap) + offset
+        new = repeat_motion(vf, line, pos, cap, self.count) + offset
         count = min(max(0, new), len(line)) - pos
         if count > 0:
             return self.right(count) + self.delete(count), [ClipboardCopyOp(line[pos: pos + count])]
@@ -333,26 +435,49 @@ class Delete(Action):
 @register_action(ActionEnum.di)
 class DeleteInBetween(Delete):
     N_ARGS = 1
+    AROUND = False  # whether the delimiters, or the whitespace after a word, are included
+
+    _SEPARATORS = [b'``', b"''", b',,', b'  ', b'__']  # pairs that do not nest, looked up around the cursor
+
+    def span(self, arg: bytes, line: bytes, pos: int):
+        r"""Return the positions of the delimiters of the text object, or None"""
+        objects = text_objects(line)
+        if arg in (b"(", b")", b"[", b"]", b"{", b"}", b"<", b">"):
+            return objects.pair(pos, arg, self.count)
+        if arg == b'"':
+            return objects.string(pos)
+        for l, r in self._SEPARATORS:
+            if arg[0] == l:
+                try:
+                    return line.rindex(l, 0, pos + 1), line.index(r, pos)
+                except ValueError:
+                    return None
+        return None
 
     def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
+        if len(line) == 0 or len(arg) != 1:
+            return [], []
         if arg == b'w' or arg == b'W':
-            begin, end = vim_word_boundary(line, pos, capital=(arg == b'W'))
-            return self.right(end - pos + 1) + self.delete(end - begin + 1), [ClipboardCopyOp(line[begin: end + 1])]
-
-        pairs = [b'()', b'[]', b'{}', b'<>', b'``', b"''", b'""', b',,', b'  ', b'__']
-        for pair in pairs:
-            if arg in pair:
-                l, r = pair
-                break
+            objects = text_objects(line)
+            begin, end = objects.word(pos, capital=(arg == b'W'))
+            if self.AROUND:
+                if end + 1 < len(line) and (line[end + 1] in b" \t" or line[pos] in b" \t"):
+                    end = objects.word(end + 1, capital=(arg == b'W'))[1]
+                elif begin > 0 and line[begin - 1] in b" \t":
+                    begin = objects.word(begin - 1, capital=(arg == b'W'))[0]
         else:
-            return [], []
+            span = self.span(arg, line, pos)
+            if span is None:
+                return [], []
+            begin, end = span if self.AROUND else (span[0] + 1, span[1] - 1)
+        return self.right(end - pos + 1) + self.delete(end - begin + 1), [ClipboardCopyOp(line[begin: end + 1])]
 
-        try:
-            left = line.rindex(l, 0, pos + 1)
-            right = line.index(r, pos)
-            return self.right(right - pos) + self.delete(right - left - 1), [ClipboardCopyOp(line[left + 1: right])]
-        except ValueError:
-            return [], []
+
+@register_action(ActionEnum.ya, transform_cls=__convert_delete_to_yank)
+@register_action(ActionEnum.ca, transform_cls=__convert_delete_to_change)
+@register_action(ActionEnum.da)
+class DeleteAround(DeleteInBetween):
+    AROUND = True
 
 
 @register_action(ActionEnum.yt, transform_cls=__convert_delete_to_yank)
@@ -362,7 +487,7 @@ class DeleteTill(Delete):
     N_ARGS = 1
 
     def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
-        new_pos = vim_till(line, pos, arg, False)
+        new_pos = self.find(line, pos, arg, False, till=True)
         if not 0 <= new_pos < len(line):
             return [], []
         count = new_pos - pos + 1
@@ -376,7 +501,7 @@ class DeleteTillBackwards(Delete):
     N_ARGS = 1
 
     def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
-        new_pos = vim_till(line, pos, arg, True)
+        new_pos = self.find(line, pos, arg, True, till=True)
         if not 0 <= new_pos < len(line):
             return [], []
         count = pos - new_pos + 1
@@ -390,7 +515,7 @@ class DeleteFind(Delete):
     N_ARGS = 1
 
     def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
-        new_pos = vim_find(line, pos, arg, False)
+        new_pos = self.find(line, pos, arg, False)
         if not 0 <= new_pos < len(line):
             return [], []
         count = new_pos - pos + 1
@@ -404,7 +529,7 @@ class DeleteFindBackwards(Delete):
     N_ARGS = 1
 
     def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
-        new_pos = vim_find(line, pos, arg, True)
+        new_pos = self.find(line, pos, arg, True)
         if not 0 <= new_pos < len(line):
             return [], []
         count = pos - new_pos + 1
@@ -418,7 +543,8 @@ class DeleteOneChar(Action):
 
     def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
         assert arg is None
-        return self.right(1) + self.delete(1), [ClipboardCopyOp(line[pos: pos + 1])]
+        n = min(self.count, len(line) - pos)
+        return self.right(n) + self.delete(n), [ClipboardCopyOp(line[pos: pos + n])]
 
 
 @register_action(ActionEnum.i)
@@ -463,7 +589,7 @@ class PasteBefore(Action):
 
     def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
         assert arg is None
-        return [clipboard.paste()]
+        return [clipboard.paste() * self.count]
 
 
 @register_action(ActionEnum.p)
@@ -472,7 +598,7 @@ class PasteAfter(Action):
 
     def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
         assert arg is None
-        return [Op.RIGHT, clipboard.paste(), Op.LEFT]
+        return [Op.RIGHT, clipboard.paste() * self.count, Op.LEFT]
 
 
 @register_action(ActionEnum.r)
@@ -480,10 +606,10 @@ class ReplaceCharacter(Action):
     N_ARGS = 1
 
     def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
-        if arg not in printable or arg == "\n":
+        if arg not in printable or arg == "\n" or pos + self.count > len(line):
             return []
 
-        return self.right(1) + self.delete(1) + [arg]
+        return self.right(self.count) + self.delete(self.count) + (arg * self.count,)
 
 
 @register_action(ActionEnum.R)
@@ -508,10 +634,10 @@ class SwitchCasing(Action):
 
     def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
         assert arg is None
-        ch = line[pos]
-        if ch not in self.CASE_MAP:
+        chars = line[pos: pos + self.count]
+        if not any(ch in self.CASE_MAP for ch in chars):
             return []
-        return self.right(1) + self.delete(1) + [self.CASE_MAP[ch]]
+        return self.right(len(chars)) + self.delete(len(chars)) + (bytes(self.CASE_MAP.get(ch, ch) for ch in chars),)
 
 
 class StartSearchAbstract(Action):
@@ -522,7 +648,7 @@ class StartSearchAbstract(Action):
     def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
         assert arg.endswith(b"\r") and isinstance(self.IS_FORWARD, bool)
         pattern = arg[:-1].decode()
-        ops = self.delete_line(line, pos)
+        ops = list(self.delete_line(line, pos))  # NavigateHistoryOp adds the match to it
         special_ops = [
             StartHistorySearchOp(self.IS_FORWARD, pattern),
             NavigateHistoryOp(self.IS_FORWARD)
@@ -546,9 +672,9 @@ class SearchNavigate(Action):
 
     def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
         assert arg is None and isinstance(self.SEARCH_FORWARD, bool)
-        ops = self.delete_line(line, pos)
+        ops = list(self.delete_line(line, pos))  # NavigateHistoryOp adds the match to it
         global _search_forward
-        return ops, [NavigateHistoryOp(not self.SEARCH_FORWARD ^ _search_forward)]
+        return ops, [NavigateHistoryOp(not self.SEARCH_FORWARD ^ _search_forward, self.count)]
 
 
 @register_action(ActionEnum.n)
@@ -571,8 +697,9 @@ class SingleRepeat(Action):
         global _last_action_arg
         if _last_action_arg is None:
             return []
-        action, arg = _last_action_arg
-        return action().act(arg, line, pos)
+        action, arg, count = _last_action_arg
+        command = get_command(_action_enums[action], count if self.count == 1 else self.count)  # `3.` overrides it
+        return command.act(arg, line, pos)
 
 
 @register_action(ActionEnum.u)
@@ -621,13 +748,110 @@ class RetrieveMark(Action):
     def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
         if arg not in ascii_lowercase + ascii_uppercase:
             return []
-        return self.delete_line(line, pos), [RetrieveHistoryMarkOp(arg)]
+        return list(self.delete_line(line, pos)), [RetrieveHistoryMarkOp(arg)]  # the op adds the entry to it
+
+
+@register_action(ActionEnum.ctrl_f)
+class SearchScrollback(Action):
+    N_ARGS = -1
+    VARIADIC_ARG_TERMINATORS = [b"\r"]
+    REPEATABLE = False
+    UNDOABLE = False
+    PRESERVE_REDO_STACK = True
+
+    def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
+        assert arg.endswith(b"\r")
+        return [], [SearchScrollbackOp(arg[:-1].decode())]
+
+    def on_partial_arg(self, arg: bytes):
+        # the latest match of the pattern typed so far, searched again from the end on each key
+        return [SearchScrollbackOp(arg.decode(errors="replace"), incremental=True)] if arg else []
+
+
+@register_action(ActionEnum.ctrl_t)
+class ShowLatency(Action):
+    N_ARGS = 0
+    REPEATABLE = False
+    UNDOABLE = False
+    PRESERVE_REDO_STACK = True
+
+    def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
+        assert arg is None
+        return [], [ShowLatencyOp()]
+
+
+@register_action(ActionEnum.ctrl_n)
+class ToggleHistoryScope(Action):
+    N_ARGS = 0
+    REPEATABLE = False
+    UNDOABLE = False
+    PRESERVE_REDO_STACK = True
+
+    def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
+        assert arg is None
+        return [], [ToggleHistoryScopeOp()]
+
+
+@register_action(ActionEnum.q)
+class RecordMacro(Action):
+    N_ARGS = 1
+    REPEATABLE = False
+    UNDOABLE = False
+    PRESERVE_REDO_STACK = True
+
+    def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
+        if arg not in ascii_lowercase + ascii_uppercase + b"0123456789":
+            return []
+        return [], [RecordMacroOp(arg)]
+
+
+@register_action(ActionEnum.at)
+class ReplayMacro(Action):
+    N_ARGS = 1
+    REPEATABLE = False
+    UNDOABLE = False  # the replayed actions are undoable one by one
+    PRESERVE_REDO_STACK = True
+
+    def on_act(self, arg: bytes, line: bytes, pos: int) -> ActionOutput:
+        return [], [ReplayMacroOp(arg, self.count)]
 
 
 def get_action(action: ActionEnum):
     return _action_lookup[action]
 
 
+@lru_cache(maxsize=1024)
+def get_command(action: ActionEnum, count: int = 1):
+    r"""Return the instance of ``action`` taking ``count``. Actions keep no state besides their count, so an instance is
+    shared by every use of the command."""
+    return _action_lookup[action](count)
+
+
+class CommandNode:
+    r"""Node of the trie of normal-mode commands: the command spelled by the keys leading to it, if any, and the nodes
+    of the keys that extend it, e.g. `i` after `d`."""
+    __slots__ = ("action", "command", "children")
+
+    def __init__(self):
+        self.action = None  # ActionEnum
+        self.command = None  # shared instance of the action, taking a count of 1
+        self.children = {}  # key -> CommandNode
+
+
+def build_command_trie():
+    r"""Return the root of the command trie of the registered actions, as a dict of key -> CommandNode"""
+    root = {}
+    for action in _action_lookup:
+        children, node = root, None
+        for i in range(len(action.value)):
+            node = children.get(action.value[i:i + 1])
+            if node is None:
+                node = children[action.value[i:i + 1]] = CommandNode()
+            children = node.children
+        node.action, node.command = action, get_command(action)
+    return root
+
+
 # import-time checks
 for action in ActionEnum:
     if action not in _action_lookup:
@@ -644,3 +868,5 @@ for action in ActionEnum:
             assert isinstance(term, bytes), error_msg
     else:
         assert cls.VARIADIC_ARG_TERMINATORS is ...
+
+COMMAND_TRIE = build_command_trie()
@@ -26,12 +26,13 @@ setup(
         "Programming Language :: Python :: 3",
         "Operating System :: OS Independent",
     ],
-    python_requires=">=3.6",
+    python_requires=">=3.7",
     install_requires=install_requires,
     # license="MIT",
     entry_points={
         "console_scripts": [
             "iridescent = iridescent.iridescent:main",
+            "iridescent-history = iridescent.history_tools:main",
         ]
     }
 )
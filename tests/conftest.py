@@ -0,0 +1,16 @@
+import os
+import sys
+import stat
+import pytest
+
+FAKE_IRIS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_iris.py")
+
+
+@pytest.fixture
+def fake_iris(tmp_path, monkeypatch):
+    r"""Put a fake `iris` executable (see fake_iris.py) first on $PATH."""
+    iris = tmp_path / "iris"
+    iris.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_IRIS}" "$@"\n')
+    iris.chmod(iris.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", str(tmp_path) + os.pathsep + os.environ["PATH"])
+    return iris
@@ -0,0 +1,72 @@
+r"""A stand-in for `iris terminal <instance> [-U <namespace>]`, used by tests that spawn an IRIS session.
+
+It prints a namespace prompt and echoes each command like IRIS does. It answers the metadata queries issued by
+iridescent.completion, and understands a few commands:
+
+- `write <literal>` / `w <literal>` writes a string or number literal, and fails with `<UNDEFINED>` on anything else
+- `hang <seconds>` sleeps
+- `halt` / `h` ends the session
+
+Any other non-empty command fails with `<SYNTAX>`. The instance `MISSING` does not exist, and with
+`$FAKE_IRIS_LOGIN` set, the session starts with `Username:` and `Password:` prompts.
+"""
+import os
+import re
+import sys
+import time
+
+ROUTINES = ["MyRoutine", "MyOther", "Util"]
+CLASSES = ["%Library.String", "%Library.Integer", "User.Person"]
+GLOBALS = ["^MyGlobal", "^Other"]
+
+METADATA = {"^rINDEX": ROUTINES, "^oddDEF": CLASSES, "^$GLOBAL": GLOBALS}
+
+
+def execute(command):
+    for name, items in METADATA.items():
+        if f"$order({name}(x))" in command:
+            return "<<<IRIDESCENT:BEGIN>>>\n" + "".join(item + "\n" for item in items) + "<<<IRIDESCENT:END>>>\n"
+
+    verb, _, arg = command.partition(" ")
+    verb = verb.lower()
+    if not verb:
+        return ""
+    if verb in ("w", "write"):
+        if re.fullmatch(r'"[^"]*"', arg):
+            return arg[1:-1]
+        if re.fullmatch(r"-?\d+(\.\d+)?", arg):
+            return arg
+        return f"\n<UNDEFINED> *{arg}"
+    if verb in ("hang", "ha"):
+        time.sleep(float(arg))
+        return ""
+    return "\n<SYNTAX>"
+
+
+def main(argv):
+    namespace = argv[argv.index("-U") + 1] if "-U" in argv else "USER"
+    write = sys.stdout.write
+    if argv[1:2] == ["MISSING"]:
+        write("IRIS instance 'MISSING' not found\n")
+        sys.exit(1)
+    if os.environ.get("FAKE_IRIS_LOGIN"):
+        for prompt in ["Username: ", "Password: "]:
+            write(prompt)
+            sys.stdout.flush()
+            sys.stdin.readline()
+    write(f"\nNode: fake, Instance: {argv[1] if len(argv) > 1 else ''}\n\n{namespace}>")
+    sys.stdout.flush()
+    for line in sys.stdin:
+        command = line.strip()
+        write(command + "\n")
+        if command.lower() in ("h", "halt"):
+            break
+        output = execute(command)
+        if output and not output.endswith("\n"):
+            output += "\n"
+        write(f"{output}{namespace}>")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
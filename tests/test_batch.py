@@ -0,0 +1,47 @@
+import io
+import pytest
+from iridescent.batch import BatchSession, run_script, read_commands
+
+
+def test_batch_session(fake_iris):
+    out = io.BytesIO()
+    with BatchSession("IRIS", timeout=10) as session:
+        assert not session.run('write "hello"', out)
+        assert not session.run("hang 0", out)
+        assert not session.run("w 42", out)
+    assert out.getvalue() == b"hello\n42\n"
+
+
+@pytest.mark.parametrize("keep_going, status, output", [
+    (False, 1, b"1\n\n<UNDEFINED> *x\n"),
+    (True, 1, b"1\n\n<UNDEFINED> *x\n3\n"),
+])
+def test_run_script(fake_iris, keep_going, status, output):
+    script = io.StringIO("w 1\n\nw x\nw 3\n")
+    out = io.BytesIO()
+    assert run_script("IRIS", read_commands(script), out, timeout=10, keep_going=keep_going) == status
+    assert out.getvalue() == output
+
+
+def test_run_script_success(fake_iris):
+    out = io.BytesIO()
+    assert run_script("IRIS", ['w "a"', 'w "b"'], out, timeout=10) == 0
+    assert out.getvalue() == b"a\nb\n"
+
+
+@pytest.mark.parametrize("credentials", [(None, None), ("_SYSTEM", "SYS")])
+def test_run_script_login_failure(fake_iris, monkeypatch, capsys, credentials):
+    monkeypatch.setenv("FAKE_IRIS_LOGIN", "1")
+    assert run_script("MISSING", ["w 1"], io.BytesIO(), *credentials, timeout=10) == 2
+    assert "MISSING" in capsys.readouterr().err
+
+    out = io.BytesIO()  # the login prompts are answered
+    assert run_script("IRIS", ["w 1"], out, "_SYSTEM", "SYS", timeout=10) == 0
+    assert out.getvalue() == b"1\n"
+
+
+def test_interact_read_overridden():
+    import pexpect as pe
+    from iridescent.spawn import IrisSpawn, _INTERACT_READ
+    # fails when pexpect no longer reads through the private method IrisSpawn overrides
+    assert getattr(IrisSpawn, _INTERACT_READ) is not getattr(pe.spawn, _INTERACT_READ)
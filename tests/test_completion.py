@@ -0,0 +1,89 @@
+import time
+import pytest
+from iridescent.completion import Completer, CompletionTrie
+
+
+def test_completion_trie():
+    trie = CompletionTrie(["^MyRoutine", "^MyOther", "^Util"])
+    assert trie.complete("^My") == ["^MyOther", "^MyRoutine"]
+    assert trie.complete("^X") == []
+    assert trie.common_extension("^U") == "til"
+    assert trie.common_extension("^M") == "y"
+
+    trie = CompletionTrie(["write", "while"], case_sensitive=False)
+    assert trie.complete("WR") == ["write"]
+
+
+@pytest.mark.parametrize(
+    argnames=["line", "insertion", "candidates"],
+    argvalues=[
+        (b"se", b"t", ["set"]),
+        (b"SE", b"T", ["SET"]),
+        (b"w", b"", ["while", "write"]),
+        (b"write $zdat", b"e", ["$zdate", "$zdateh", "$zdatetime", "$zdatetimeh"]),
+        (b"write ", b"", []),
+    ]
+)
+def test_complete_builtin(tmp_path, line, insertion, candidates):
+    completer = Completer("IRIS", cache_dir=tmp_path)
+    assert completer.complete(line, len(line)) == (insertion, candidates, len(line))
+
+
+def test_complete_metadata(tmp_path, fake_iris):
+    completer = Completer("IRIS", cache_dir=tmp_path)
+    completer.refresh("USER", block=True)
+    assert (tmp_path / "IRIS" / "USER.json").exists()
+
+    # a new completer picks the metadata up from the cache, without spawning IRIS
+    completer = Completer("IRIS", cache_dir=tmp_path)
+    completer.set_namespace("USER")
+    assert not completer._fetching
+
+    line = b"do ^My"
+    assert completer.complete(line, len(line)) == (b"", ["^MyGlobal", "^MyOther", "^MyRoutine"], len(line))
+    line = b"set x = ##class(%Library.S"
+    assert completer.complete(line, len(line)) == (b"tring", ["%Library.String"], len(line))
+    line = b"set x = ##class(Us).New()"
+    assert completer.complete(line, 17) == (b"ser.Person", ["User.Person"], 18)  # "U|s"
+
+    # in the middle of a token, the completion replaces the rest of it
+    from iridescent.keys import KEY
+    from iridescent.filters import IOFilter, DebugLogger
+    from iridescent.history import HistoryManager
+    io_filter = IOFilter(None, DebugLogger(None), history_manager=HistoryManager(None), completer=completer)
+    for key in line:
+        io_filter.filter_input(bytes([key]))
+    for _ in range(len(line) - 17):
+        io_filter.filter_input(KEY.LEFT)
+    assert io_filter.filter_input(KEY.TAB) == KEY.RIGHT + KEY.DELETE + b"ser.Person"
+    assert io_filter.current_line == b"set x = ##class(User.Person).New()"
+    assert io_filter.cursor_pos == len(b"set x = ##class(User.Person")
+
+
+@pytest.mark.parametrize("content", ['{"routines": ["MyRoutine"', "[]", None])
+def test_corrupted_cache(tmp_path, monkeypatch, content):
+    completer = Completer("IRIS", cache_dir=tmp_path)
+    cache_file = tmp_path / "IRIS" / "USER.json"
+    if content is None:  # unreadable
+        cache_file.mkdir(parents=True)
+    else:
+        cache_file.parent.mkdir(parents=True)
+        cache_file.write_text(content)
+    refreshed = []
+    monkeypatch.setattr(completer, "refresh", refreshed.append)
+    completer.set_namespace("USER")
+    assert refreshed == ["USER"]
+    assert completer.complete(b"do ^My", 6) == (b"", [], 6)
+
+
+def test_complete_speed(tmp_path):
+    completer = Completer("IRIS", cache_dir=tmp_path)
+    completer._load({"routines": [f"Routine{i}" for i in range(50000)]})
+    line = b"do ^Routine4999"
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        insertion, candidates, _ = completer.complete(line, len(line))
+        timings.append(time.perf_counter() - start)
+    assert min(timings) < 1e-3
+    assert len(candidates) == 11
@@ -0,0 +1,35 @@
+import time
+from iridescent.fanout import fan_out
+
+
+def test_fan_out(fake_iris):
+    instances = ["IRIS1", "IRIS2", "IRIS3", "IRIS4"]
+    seen = []
+    start = time.perf_counter()
+    results = fan_out(instances, ["hang 0.5", 'w "done"'], jobs=4, timeout=10, on_result=seen.append)
+    elapsed = time.perf_counter() - start
+
+    assert [result.instance for result in results] == instances
+    assert sorted(result.instance for result in seen) == instances
+    assert all(result.status == 0 and result.output == b"done\n" for result in results)
+    assert all(result.elapsed >= 0.5 for result in results)
+    assert elapsed < 0.5 * len(instances)
+
+
+def test_fan_out_errors(fake_iris, monkeypatch):
+    results = fan_out(["IRIS1", "IRIS2"], ["w x", "w 1"], jobs=2, timeout=10)
+    assert [result.status for result in results] == [1, 1]
+    assert results[0].output == b"\n<UNDEFINED> *x\n"
+
+    monkeypatch.setenv("PATH", "")
+    result, = fan_out(["IRIS1"], ["w 1"], jobs=1, timeout=10)
+    assert result.status == 2 and result.error
+
+
+def test_fan_out_login_failure(fake_iris, monkeypatch):
+    monkeypatch.setenv("FAKE_IRIS_LOGIN", "1")
+    results = fan_out(["IRIS1", "MISSING", "IRIS2"], ['w "done"'], jobs=3, username="_SYSTEM", password="SYS",
+                      timeout=10)
+    assert [result.status for result in results] == [0, 2, 0]
+    assert results[0].output == results[2].output == b"done\n"
+    assert "MISSING" in results[1].error
@@ -11,8 +11,9 @@ def history_file():
     with open(FILENAME, "w") as f:
         f.write(INIT_CONTENT)
     yield
-    if os.path.exists(FILENAME):
-        os.remove(FILENAME)
+    for path in [FILENAME, FILENAME + ".lock", FILENAME + ".meta"]:
+        if os.path.exists(path):
+            os.remove(path)
 
 
 def test_history_manager(history_file):
@@ -54,8 +55,9 @@ def search_file():
     with open(SEARCH_FILE, "w") as f:
         f.write(SEARCH_CONTENT)
     yield
-    if os.path.exists(SEARCH_FILE):
-        os.remove(SEARCH_FILE)
+    for path in [SEARCH_FILE, SEARCH_FILE + ".lock", SEARCH_FILE + ".meta"]:
+        if os.path.exists(path):
+            os.remove(path)
 
 
 def test_history_search_next(search_file):
@@ -96,3 +98,420 @@ def test_history_search_next(search_file):
 
         line, match = hm.search_prev()
         assert line is None
+
+
+COMPACT_FILE = "compact-history.txt"
+COMPACT_CONTENT = """:a
+:b
+:h
+junk
+:a
+:c
+:halt
+:b
+:d
+"""
+
+
+@pytest.fixture
+def compact_file():
+    with open(COMPACT_FILE, "w") as f:
+        f.write(COMPACT_CONTENT)
+    yield
+    for path in [COMPACT_FILE, COMPACT_FILE + ".lock", COMPACT_FILE + ".meta"]:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+@pytest.mark.parametrize(argnames="block_size", argvalues=[1, 3, 1 << 20])
+def test_compact(compact_file, block_size):
+    from iridescent.history_tools import compact
+    n_read, n_kept = compact(COMPACT_FILE, max_size=0, block_size=block_size)
+    assert (n_read, n_kept) == (8, 4)
+    with open(COMPACT_FILE) as f:
+        assert f.read() == ":a\n:c\n:b\n:d\n"
+
+
+def test_compact_max_size(compact_file):
+    from iridescent.history_tools import compact
+    compact(COMPACT_FILE, max_size=2)
+    with open(COMPACT_FILE) as f:
+        assert f.read() == ":b\n:d\n"
+
+
+def test_compact_applies_rules(compact_file):
+    from iridescent.history_tools import compact
+    from iridescent.ingest import IngestRules
+    rules = IngestRules(reject=["[bc]"], rewrite=[{"pattern": "(h)(alt)?", "replace": r"\1*"}])
+    assert compact(COMPACT_FILE, max_size=0, rules=rules) == (8, 3)
+    with open(COMPACT_FILE) as f:
+        assert f.read() == ":a\n:h*\n:d\n"
+
+
+def test_compact_no_reject_keeps_rewrites(compact_file, tmp_path):
+    import json
+    from iridescent.history_tools import main
+    rules = tmp_path / "ingest.json"
+    rules.write_text(json.dumps({"rewrite": [{"pattern": "b", "replace": "*"}]}))
+    with pytest.raises(SystemExit) as e:
+        main(["compact", "-H", COMPACT_FILE, "-n", "0", "--no-reject", "--rules", str(rules)])
+    assert e.value.code == 0
+    with open(COMPACT_FILE) as f:
+        assert f.read() == ":h\n:a\n:c\n:halt\n:*\n:d\n"
+
+
+@pytest.mark.parametrize(argnames=["content", "error"], argvalues=[
+    ("{", "is not valid JSON"),
+    ('{"reject": ["("]}', "Invalid pattern in reject rule"),
+    ('{"rewrite": [{"pattern": "x"}]}', "has no replace"),
+    ('{"reject": [{"ignore_case": true}]}', "has no pattern"),
+    ('{"dedupe": "sometimes"}', "Invalid dedupe mode"),
+    ('{"rejects": ["h"]}', "Unknown keys 'rejects'"),
+])
+def test_load_rules_errors(tmp_path, content, error):
+    from iridescent.ingest import load_rules, IngestRulesError
+    file = tmp_path / "ingest.json"
+    file.write_text(content)
+    with pytest.raises(IngestRulesError) as e:
+        load_rules(file)
+    assert str(e.value).startswith(str(file)) and error in str(e.value)
+
+
+def test_load_rules_missing(tmp_path, monkeypatch):
+    from iridescent import ingest
+    file = tmp_path / "ingest.json"
+    with pytest.raises(ingest.IngestRulesError) as e:
+        ingest.load_rules(file)
+    assert str(e.value) == f"{file} does not exist"
+
+    monkeypatch.setattr(ingest, "ingest_config_file", file)
+    assert ingest.load_rules() is ingest.DEFAULT_RULES
+
+
+def test_ingest_rules():
+    from iridescent.ingest import IngestRules, DEFAULT_RULES
+    assert DEFAULT_RULES.apply("HALT") is None
+    assert DEFAULT_RULES.apply("halting") == "halting"
+
+    rules = IngestRules.from_config({
+        "rewrite": [
+            {"pattern": r'(\$system\.Security\.Login\([^,]*,\s*)"[^"]*"', "replace": r'\1"***"', "ignore_case": True},
+            {"pattern": r"secret", "replace": "***"},
+        ],
+        "dedupe": "all",
+    })
+    assert rules.apply("h") is None  # the default reject rules are kept
+    assert rules.apply('w $SYSTEM.Security.Login("me", "pw"), secret') == 'w $SYSTEM.Security.Login("me", "***"), ***'
+
+    hm = HistoryManager(None, rules=rules)
+    for line in [b"a", b"b", b"a"]:
+        hm.set_buffer(line)
+        hm.ingest()
+    assert hm.history == ["a", "b"]
+    assert hm.metadata.last_index[hm.metadata.slots["a"]] == 0
+
+    with pytest.raises(ValueError):
+        IngestRules(dedupe="sometimes")
+
+
+BINARY_FILE = "history_file.irhb"
+
+
+@pytest.fixture
+def binary_file():
+    yield
+    for path in [BINARY_FILE, BINARY_FILE + ".lock", BINARY_FILE + ".meta", BINARY_FILE + ".tail", FILENAME + ".txt"]:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+@pytest.mark.parametrize(argnames="entries_per_block", argvalues=[1, 2, 256])
+def test_binary_history_roundtrip(history_file, binary_file, entries_per_block):
+    from iridescent.history_binary import text_to_binary, binary_to_text, append_binary, BinaryHistoryReader
+    text_to_binary(FILENAME, BINARY_FILE, entries_per_block)
+    append_binary(BINARY_FILE, ["dd", "é"])
+
+    with BinaryHistoryReader(BINARY_FILE) as reader:
+        assert len(reader) == 5
+        assert reader[0] == b"aaa"
+        assert reader[-1] == "é".encode()
+        assert reader.tail(2) == [b"dd", "é".encode()]
+        assert reader.verify() == []
+
+    binary_to_text(BINARY_FILE, FILENAME + ".txt")
+    with open(FILENAME + ".txt", encoding="utf-8") as f:
+        assert f.read() == INIT_CONTENT + ":dd\n:é\n"
+
+
+def test_binary_history_corruption(history_file, binary_file):
+    from iridescent.history_binary import text_to_binary, BinaryHistoryReader
+    text_to_binary(FILENAME, BINARY_FILE, entries_per_block=2)
+    with open(BINARY_FILE, "r+b") as f:
+        content = f.read()
+        f.seek(content.index(b"ccc"))
+        f.write(b"x")
+
+    with BinaryHistoryReader(BINARY_FILE) as reader:
+        assert reader.verify() == [1]
+        assert reader.verify(0, 2) == []
+
+
+def test_binary_history_append_in_place(history_file, binary_file):
+    from iridescent.history_binary import text_to_binary, append_binary
+    text_to_binary(FILENAME, BINARY_FILE)
+    inode = os.stat(BINARY_FILE).st_ino
+    append_binary(BINARY_FILE, ["dd"])
+    assert os.stat(BINARY_FILE).st_ino == inode
+    assert not os.path.exists(BINARY_FILE + ".tail")
+
+
+def test_binary_history_append_interrupted(history_file, binary_file, monkeypatch):
+    from iridescent import history_binary
+    history_binary.text_to_binary(FILENAME, BINARY_FILE)
+    with open(BINARY_FILE, "rb") as f:
+        content = f.read()
+
+    def crash(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(history_binary, "_write_tables", crash)
+    with pytest.raises(OSError):
+        history_binary.append_binary(BINARY_FILE, ["dd"])
+    with open(BINARY_FILE, "rb") as f:  # the previous version is put back
+        assert f.read() == content
+    assert not os.path.exists(BINARY_FILE + ".tail")
+
+    # killed halfway, the previous version is put back when the file is next opened
+    monkeypatch.setattr(history_binary, "_restore", lambda file: None)
+    with pytest.raises(OSError):
+        history_binary.append_binary(BINARY_FILE, ["dd"])
+    monkeypatch.undo()
+    with history_binary.BinaryHistoryReader(BINARY_FILE) as reader:
+        assert reader.entries() == [b"aaa", b"bbb", b"ccc"]
+    history_binary.append_binary(BINARY_FILE, ["dd"])
+    with history_binary.BinaryHistoryReader(BINARY_FILE) as reader:
+        assert reader.entries() == [b"aaa", b"bbb", b"ccc", b"dd"]
+        assert reader.verify() == []
+
+
+@pytest.mark.parametrize(argnames="content", argvalues=[b"IRH", b"IRHB\x01\x00", b"IRHB" + bytes(20)])
+def test_binary_history_too_short(binary_file, content):
+    from iridescent.history_binary import BinaryHistoryReader, HistoryFormatError
+    with open(BINARY_FILE, "wb") as f:
+        f.write(content)
+    with pytest.raises(HistoryFormatError):
+        BinaryHistoryReader(BINARY_FILE)
+
+
+def test_binary_history_manager(history_file, binary_file):
+    from iridescent.history_binary import text_to_binary, BinaryHistoryReader
+    text_to_binary(FILENAME, BINARY_FILE)
+    with HistoryManager(BINARY_FILE, 2) as hm:
+        assert hm.retrieve_buffer() == b""
+        assert hm.go_prev() == b"ccc"
+        assert hm.go_prev() == b"bbb"
+        hm.set_buffer(b"dd")
+        hm.ingest()
+
+    with BinaryHistoryReader(BINARY_FILE) as reader:
+        assert reader.entries() == [b"aaa", b"bbb", b"ccc", b"dd"]
+
+
+def test_frecency_ranking(history_file):
+    with HistoryManager(FILENAME, ranking="frecency") as hm:
+        hm.set_namespace("%SYS")
+        for line in [b"bbb", b"aaa", b"bbb"]:
+            hm.set_buffer(line)
+            hm.ingest()
+
+        assert [hm.metadata.entries[slot] for _, slot in hm.metadata.ranked] == ["bbb", "aaa", "ccc"]
+        assert hm.metadata.namespace("aaa") == "%SYS"
+        assert hm.metadata.counts[hm.metadata.slots["bbb"]] == 3
+
+        assert hm.go_prev() == b"bbb"
+        assert hm.go_prev() == b"aaa"
+        assert hm.go_prev() == b"ccc"
+        assert hm.go_prev() == b""
+        assert hm.go_next() == b"ccc"
+
+        hm.start_search("a|c")
+        assert hm.search_next()[0] == b"aaa"
+        assert hm.search_next()[0] == b"ccc"
+        assert hm.search_next()[0] == b"aaa"
+
+    with HistoryManager(FILENAME) as hm:
+        assert hm.metadata.namespace("bbb") == "%SYS"
+        assert hm.metadata.counts[hm.metadata.slots["bbb"]] == 3
+
+
+def test_frecency_without_metadata(history_file):
+    with HistoryManager(FILENAME, ranking="frecency") as hm:
+        assert hm.go_prev() == b"ccc"  # ties are broken by recency
+        assert hm.go_prev() == b"bbb"
+
+
+def test_metadata_saved(tmp_path, monkeypatch, binary_file, history_file):
+    from iridescent.history_binary import text_to_binary
+    monkeypatch.setenv("HOME", str(tmp_path))
+    default = tmp_path / ".iris_history"
+    default.write_text(INIT_CONTENT)
+    text_to_binary(FILENAME, BINARY_FILE)
+    for file in [str(default), BINARY_FILE]:
+        with HistoryManager(file) as hm:
+            hm.set_namespace("USER")
+            hm.set_buffer(b"aaa")
+            hm.ingest()
+        assert HistoryManager(file).metadata.namespace("aaa") == "USER"
+    assert default.read_text() == INIT_CONTENT  # IRIS writes ~/.iris_history itself
+
+
+@pytest.mark.parametrize(argnames="ranking", argvalues=["recency", "frecency"])
+def test_namespace_scope(ranking):
+    hm = HistoryManager(None, ranking=ranking, scope="namespace")
+    for namespace, line in [("USER", b"do ^App"), ("%SYS", b"do ^SECURITY"), ("USER", b"set x = 1"),
+                            ("%SYS", b"do ^JOBEXAM"), ("USER", b"do ^App")]:
+        hm.set_namespace(namespace)
+        hm.set_buffer(line)
+        hm.ingest()
+    assert list(hm.namespace_indices["%SYS"]) == [1, 3]
+
+    hm.set_namespace("%SYS")
+    hm.skip_buffers(100)
+    assert hm.go_prev() == b"do ^JOBEXAM"
+    assert hm.go_prev() == b"do ^SECURITY"
+    assert hm.go_prev() == b""
+    assert hm.go_next() == b"do ^SECURITY"
+
+    hm.start_search("do")
+    assert [i for i, _ in hm.search_matches] == [1, 3]
+    assert hm.toggle_scope() == "global"
+    assert [i for i, _ in hm.search_matches] == [0, 1, 3, 4]
+    hm.retrieve_buffer()
+    assert hm.go_prev() == b"do ^App"
+
+
+@pytest.mark.parametrize(argnames="default", argvalues=[False, True])
+def test_namespace_scope_persists(tmp_path, monkeypatch, default):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    file = str(tmp_path / (".iris_history" if default else "history.txt"))
+    lines = [("USER", b"do ^App"), ("%SYS", b"do ^SECURITY"), ("USER", b"set x = 1")]
+    if default:
+        with open(file, "wb") as f:
+            f.write(b":w 1\n")
+    with HistoryManager(file, scope="namespace") as hm:
+        for namespace, line in lines:
+            hm.set_namespace(namespace)
+            hm.set_buffer(line)
+            hm.ingest()
+    if default:  # IRIS writes the entries of ~/.iris_history itself
+        with open(file, "ab") as f:
+            f.writelines(b":" + line + b"\n" for _, line in lines)
+
+    hm = HistoryManager(file, scope="namespace")
+    hm.set_namespace("USER")
+    assert hm.retrieve_buffer() == b""
+    hm.skip_buffers(100)
+    assert hm.go_prev() == b"set x = 1"
+    assert hm.go_prev() == b"do ^App"
+    assert hm.go_prev() == b""
+    hm.set_namespace("%SYS")
+    hm.start_search("do")
+    assert hm.search_next()[0] == b"do ^SECURITY"
+
+
+PREFIX_FILE = "prefix-history.txt"
+PREFIX_CONTENT = """:do ^MyRoutine
+:set x = 1
+:do ^Other
+:do ^MyRoutine
+:set y = 2
+"""
+
+
+@pytest.fixture
+def prefix_file():
+    with open(PREFIX_FILE, "w") as f:
+        f.write(PREFIX_CONTENT)
+    yield
+    for path in [PREFIX_FILE, PREFIX_FILE + ".lock", PREFIX_FILE + ".meta"]:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def test_prefix_search(prefix_file):
+    with HistoryManager(PREFIX_FILE, prefix_search=True) as hm:
+        assert hm.retrieve_buffer() == b""
+        hm.set_buffer(b"do ^")
+        hm.skip_buffers(100)
+
+        assert hm.go_prev() == b"do ^MyRoutine"
+        assert hm.go_prev() == b"do ^Other"
+        assert hm.go_prev() == b"do ^MyRoutine"
+        assert hm.go_prev() == b"do ^MyRoutine"  # no more matches, stay put
+        assert hm.go_next() == b"do ^Other"
+        assert hm.go_next() == b"do ^MyRoutine"
+        assert hm.go_next() == b"do ^"
+
+        hm.skip_buffers(0)
+        hm.set_buffer(b"")
+        assert hm.go_prev() == b"set y = 2"
+        assert hm.go_prev() == b"do ^MyRoutine"
+
+
+def test_prefix_index_long_prefix():
+    from iridescent.history import PrefixIndex
+    history = ["x" * 20 + "a", "x" * 20 + "b", "x" * 20 + "a"]
+    index = PrefixIndex()
+    for i, entry in enumerate(history):
+        index.add(entry, i)
+    assert index.prev("x" * 20 + "b", 3, history) == 1
+    assert index.prev("x" * 20 + "a", 2, history) == 0
+    assert index.next("x" * 20 + "a", 0, history) == 2
+    assert index.next("x" * 20 + "c", 0, history) == -1
+
+
+@pytest.mark.parametrize(argnames="ranking", argvalues=["recency", "frecency"])
+def test_autosuggest(prefix_file, ranking):
+    from iridescent.suggest import Autosuggester
+    with HistoryManager(PREFIX_FILE, ranking=ranking) as hm:
+        suggester = Autosuggester(hm)
+        assert suggester.suggest(b"") == b""
+        assert suggester.suggest(b"do") == b" ^MyRoutine"
+        assert suggester.suggest(b"do ^O") == b"ther"
+        assert suggester.suggest(b"do ^Other") == b""
+        assert suggester.suggest(b"s") == b"et y = 2"
+        assert suggester.suggest(b"set x") == b" = 1"
+
+        hm.set_buffer(b"set xyz")
+        hm.ingest()
+        hm.set_buffer(b"set xyz")
+        hm.ingest()
+        assert suggester.suggest(b"set x") == b"yz"
+
+
+def test_autosuggest_frecency():
+    from iridescent.suggest import Autosuggester
+    hm = HistoryManager(None, ranking="frecency")
+    long = "write $zversion, ! write $horolog"
+    for line in [long, long + ", !", long, "write 1", "write 2"]:
+        hm.set_buffer(line.encode())
+        hm.ingest()
+    suggester = Autosuggester(hm)
+    assert suggester.suggest(b"write") == long[5:].encode()  # used twice, rather than the most recent
+    assert suggester.suggest(b"write 1") == b""
+    assert suggester.suggest(long[:20].encode()) == long[20:].encode()
+    assert suggester.suggest(long.encode()) == b", !"
+
+
+def test_multi_line_entries(history_file):
+    from iridescent.history_tools import compact
+    block = "for i=1:3 {\n  write i\n}"
+    with HistoryManager(FILENAME) as hm:
+        hm.set_buffer(block.encode())
+        hm.ingest()
+    with open(FILENAME) as f:
+        assert f.read() == INIT_CONTENT + ":for i=1:3 {\n+  write i\n+}\n"
+    assert HistoryManager(FILENAME).history == ["aaa", "bbb", "ccc", block]
+
+    compact(FILENAME, max_size=0, block_size=3)
+    assert HistoryManager(FILENAME).history == ["aaa", "bbb", "ccc", block]
@@ -0,0 +1,39 @@
+import time
+from iridescent.latency import EchoTracker
+from iridescent.filters import IOFilter, DebugLogger
+from iridescent.history import HistoryManager
+
+
+def test_echo_tracker():
+    tracker = EchoTracker()
+    tracker.sent(b"a")
+    tracker.sent(b"\x1b[D")  # not tracked
+    tracker.sent(b"b")
+    time.sleep(0.01)
+    tracker.received(b"a")
+    assert len(tracker.samples) == 1 and tracker.samples[0] >= 10 ** 7
+    tracker.received(b"\x1b[1mb")
+    assert len(tracker.samples) == 2 and not tracker.pending
+    assert tracker.percentile(0.5) >= 10 ** 7
+    assert tracker.summary().startswith(b"Echo round trip: p50")
+
+
+def test_echo_tracker_timeout(monkeypatch):
+    tracker = EchoTracker()
+    tracker.sent(b"secret")  # e.g. typed at a password prompt, never echoed
+    tracker.sent(b"w")
+    tracker.received(b"w")
+    assert len(tracker.samples) == 0 and len(tracker.pending) == 2
+
+    monkeypatch.setattr("iridescent.latency.ECHO_TIMEOUT", 0)
+    tracker.received(b"w")
+    assert len(tracker.samples) == 1 and not tracker.pending
+
+
+def test_io_filter_echo():
+    io_filter = IOFilter(None, DebugLogger(None), history_manager=HistoryManager(None))
+    for key in b"set":
+        io_filter.filter_input(bytes([key]))
+    io_filter.filter_output(b"se")
+    io_filter.filter_output(b"t")
+    assert len(io_filter.echo_tracker.samples) == 3
@@ -0,0 +1,77 @@
+from iridescent.screen import screen
+from iridescent.keys import KEY
+from iridescent.filters import IOFilter, DebugLogger
+from iridescent.history import HistoryManager
+
+
+def make_filter(**kwargs):
+    io_filter = IOFilter(None, DebugLogger(None), history_manager=HistoryManager(None), local_edit=True, **kwargs)
+    io_filter.filter_output(b"\r\nUSER>")
+    screen.take()
+    return io_filter
+
+
+def test_edits_are_drawn_locally(capfd):
+    io_filter = make_filter()
+    for key in b"write 1":
+        assert io_filter.filter_input(bytes([key])) == b""
+    assert capfd.readouterr().out.endswith("\x1b[6Dwrite 1\x1b[K")
+
+    assert io_filter.filter_input(KEY.LEFT) == b""
+    assert capfd.readouterr().out == "\x1b[7Dwrite 1\x1b[K\x1b[1D"
+    assert (io_filter.current_line, io_filter.cursor_pos) == (b"write 1", 6)
+
+
+def test_vim_commands_are_not_sent():
+    io_filter = make_filter()
+    for key in b"write 1":
+        io_filter.filter_input(bytes([key]))
+    for key in [KEY.ESCAPE, b"0", b"d", b"w"]:
+        assert io_filter.filter_input(key) == b""
+    assert io_filter.current_line == b"1"
+
+
+def test_line_sent_on_enter():
+    io_filter = make_filter()
+    for key in b"write 1":
+        io_filter.filter_input(bytes([key]))
+    screen.take()
+    assert io_filter.filter_input(KEY.ENTER) == b"write 1\r"
+    assert io_filter.current_line == b""
+    # the local copy is erased along with the echo of IRIS
+    assert b"\x1b[7D\x1b[Jwrite 1\r\n" in io_filter.filter_output(b"write 1\r\n1\r\nUSER>")
+
+
+def test_escape_sequence_passed_through():
+    from iridescent.keys import ESCAPE_SEQUENCE
+    io_filter = make_filter()
+    assert io_filter.filter_input(ESCAPE_SEQUENCE) == ESCAPE_SEQUENCE
+
+
+def test_multi_line_block(capfd):
+    io_filter = make_filter()
+    for key in [*b"for i=1:2 {", KEY.ENTER, *b"write i", KEY.ENTER, b"}"]:
+        assert io_filter.filter_input(key if isinstance(key, bytes) else bytes([key])) == b""
+    assert io_filter.current_line == b"for i=1:2 {\nwrite i\n}"
+    # the continuation lines are lined up with the first one, after the prompt
+    assert capfd.readouterr().out.endswith("\x1b[2Afor i=1:2 {\x1b[K\r\n     write i\x1b[K\r\n     }\x1b[K")
+
+    io_filter.filter_input(KEY.ESCAPE)
+    io_filter.filter_input(b"k")
+    assert io_filter.cursor_pos == len(b"for i=1:2 {\n")
+
+    screen.take()
+    assert io_filter.filter_input(KEY.ENTER) == b"for i=1:2 {  write i  }\r"
+    assert screen.take().endswith(b"\x1b[1A\x1b[J")
+    assert io_filter.history_manager.history[-1] == "for i=1:2 {\nwrite i\n}"
+
+
+def test_password_prompt_not_drawn(capfd):
+    io_filter = IOFilter(None, DebugLogger(None), history_manager=HistoryManager(None), local_edit=True)
+    io_filter.filter_output(b"Password: ")
+    screen.take()
+    capfd.readouterr()
+    for key in b"s{cr":
+        assert io_filter.filter_input(bytes([key])) == bytes([key])
+    assert io_filter.filter_input(KEY.ENTER) == b"\r"
+    assert capfd.readouterr().out == "" and b"s{cr" not in screen.take()
@@ -0,0 +1,94 @@
+import json
+import os
+import sys
+import signal
+import importlib
+import pytest
+
+
+@pytest.fixture
+def main(monkeypatch):
+    r"""Return a function that runs iridescent.main() with the given command line and module attributes patched,
+    and returns its exit status."""
+    def run(*argv, **patches):
+        monkeypatch.setattr(sys, "argv", ["iridescent", *argv])
+        for name in ("iridescent.cli", "iridescent.iridescent"):  # cli parses sys.argv on import
+            monkeypatch.delitem(sys.modules, name, raising=False)
+        module = importlib.import_module("iridescent.iridescent")
+        for name, value in patches.items():
+            monkeypatch.setattr(module, name, value)
+        try:
+            module.main()
+        except SystemExit as e:
+            return e.code
+        return 0
+
+    handler = signal.getsignal(signal.SIGWINCH)
+    yield run
+    signal.signal(signal.SIGWINCH, handler)
+
+
+def test_main_run(fake_iris, main, tmp_path):
+    script = tmp_path / "script"
+    script.write_text('w "a"\nw x\n')
+    output = tmp_path / "output"
+    assert main("IRIS", "--run", str(script), "--run-output", str(output), "--timeout", "10") == 1
+    assert output.read_bytes() == b"a\n\n<UNDEFINED> *x\n"
+
+
+class FakeSpawn:
+    r"""Stands in for IrisSpawn: types `w 1` at a USER> prompt and disconnects."""
+    spawned = []
+
+    def __init__(self, command):
+        self.command = command
+        self.closed = False
+        self.spawned.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.closed = True
+
+    def setecho(self, state):
+        pass
+
+    def setwinsize(self, rows, cols):
+        pass
+
+    def interact(self, escape_character, input_filter, output_filter):
+        output_filter(b"\r\nUSER>")
+        self.sent = input_filter(b"w 1\r")
+
+
+def test_main_interactive(main, monkeypatch, tmp_path):
+    read_fd, write_fd = os.pipe()
+    with open(read_fd) as stdin, open(write_fd):
+        monkeypatch.setattr(sys, "stdin", stdin)
+        keys = tmp_path / "keys.json"
+        keys.write_text("{}")
+        history = tmp_path / "history"
+        assert main("IRIS", "--history-path", str(history), IrisSpawn=FakeSpawn, login=lambda *args: None,
+                    key_config_file=keys, set_keys=lambda: None) == 0
+
+    spawn, = FakeSpawn.spawned
+    assert spawn.command == "iris terminal IRIS" and spawn.closed
+    assert spawn.sent.endswith(b"\r")
+    assert "w 1" in history.read_text()
+
+
+def test_main_fanout(fake_iris, main, tmp_path, capsys):
+    report = tmp_path / "report.json"
+    assert main("--fanout", "IRIS1,IRIS2", "-c", 'w "done"', "--report", str(report), "--timeout", "10") == 0
+    assert "2 of 2 instances succeeded" in capsys.readouterr().out
+    results = json.loads(report.read_text())["results"]
+    assert [(result["instance"], result["status"]) for result in results] == [("IRIS1", 0), ("IRIS2", 0)]
+
+
+def test_main_invalid_ingest_rules(main, tmp_path):
+    rules = tmp_path / "ingest.json"
+    rules.write_text('{"rejects": ["h"]}')
+    status = main("IRIS", "--ingest-rules", str(rules))
+    assert status.startswith("Invalid ingest rules: ") and "'rejects'" in status
+    assert main("IRIS", "--ingest-rules", str(tmp_path / "missing.json")).endswith("missing.json does not exist")
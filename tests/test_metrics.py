@@ -0,0 +1,39 @@
+import pytest
+from iridescent.metrics import Histogram, Metrics, instrument, _bucket_index, _bucket_value
+from iridescent.filters import IOFilter, DebugLogger
+from iridescent.history import HistoryManager
+
+
+@pytest.mark.parametrize("value", [0, 1, 31, 32, 33, 1000, 123456, 10 ** 9, 10 ** 12])
+def test_bucket_precision(value):
+    low = _bucket_value(_bucket_index(value))
+    assert low <= value
+    assert value - low <= value / 16
+
+
+def test_histogram_percentile():
+    h = Histogram()
+    for value in range(1, 1001):
+        h.record(value * 1000)
+    assert h.count == 1000
+    assert abs(h.percentile(0.5) - 500_000) <= 500_000 / 16
+    assert abs(h.percentile(0.99) - 990_000) <= 990_000 / 16
+
+
+def test_instrument(tmp_path):
+    hm = HistoryManager(None)
+    io_filter = IOFilter(None, DebugLogger(None), history_manager=hm)
+    metrics = Metrics(str(tmp_path / "iridescent.prom"))
+    instrument(io_filter, metrics)
+
+    for key in [b"w", b" ", b"1", b"\r"]:
+        io_filter.filter_input(key)
+    io_filter.filter_output(b"1\r\nUSER>")
+
+    metrics.dump()
+    text = (tmp_path / "iridescent.prom").read_text()
+    assert 'iridescent_filter_input_seconds_count{handler="PrintableHandler"} 3' in text
+    assert 'iridescent_filter_input_seconds_count{handler="LineEndHandler"} 1' in text
+    assert "iridescent_filter_output_seconds_count 1" in text
+    assert "iridescent_input_bytes_total 4" in text
+    assert "iridescent_output_bytes_total 8" in text
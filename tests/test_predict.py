@@ -0,0 +1,94 @@
+from iridescent.screen import screen
+from iridescent.keys import KEY
+from iridescent.predict import Predictor
+from iridescent.color_utils import TextStyle
+from iridescent.latency import EchoTracker
+from iridescent.filters import IOFilter, DebugLogger
+from iridescent.history import HistoryManager
+
+UNDERLINE, NO_UNDERLINE = TextStyle.UNDERLINE.bvalue, TextStyle.NO_UNDERLINE.bvalue
+
+
+def make_filter(predict="always"):
+    io_filter = IOFilter(None, DebugLogger(None), history_manager=HistoryManager(None), predict=predict)
+    io_filter.filter_output(b"\r\nUSER>")
+    screen.take()
+    return io_filter
+
+
+def type_keys(io_filter, keys):
+    return [io_filter.filter_input(bytes([key])) for key in keys]
+
+
+def test_nothing_predicted_before_first_echo(capfd):
+    io_filter = make_filter()
+    assert type_keys(io_filter, b"w") == [b"w"]
+    assert capfd.readouterr().out == ""
+    assert io_filter.filter_output(b"w") == b"w"
+    assert io_filter.predictor.confirmed
+
+
+def test_predictions_drawn_and_confirmed(capfd):
+    io_filter = make_filter()
+    io_filter.filter_output(io_filter.filter_input(b"w"))
+    capfd.readouterr()
+
+    type_keys(io_filter, b"ri")
+    assert capfd.readouterr().out.encode() == UNDERLINE + b"r" + NO_UNDERLINE + UNDERLINE + b"i" + NO_UNDERLINE
+    assert io_filter.predictor.offset == 2
+
+    # only "r" is echoed so far: the cursor is put back, and "i" is drawn again after the echo
+    assert io_filter.filter_output(b"r") == b"\x1b[2Dr" + UNDERLINE + b"i" + NO_UNDERLINE
+    assert io_filter.filter_output(b"i") == b"\x1b[1Di"
+    assert io_filter.predictor.offset == 0 and not io_filter.predictor.predictions
+
+
+def test_motion_predicted(capfd):
+    io_filter = make_filter()
+    io_filter.filter_output(io_filter.filter_input(b"w"))
+    capfd.readouterr()
+    assert io_filter.filter_input(KEY.LEFT) == KEY.LEFT
+    assert capfd.readouterr().out == "\x1b[1D"
+    assert io_filter.filter_output(b"\x1b[D") == b"\x1b[1C\x1b[D"
+
+
+def test_line_end_requires_new_confirmation(capfd):
+    io_filter = make_filter()
+    io_filter.filter_output(io_filter.filter_input(b"w"))
+    assert io_filter.filter_input(KEY.ENTER) == KEY.ENTER
+    assert not io_filter.predictor.confirmed
+    type_keys(io_filter, b"secret")  # e.g. at a password prompt
+    assert UNDERLINE not in capfd.readouterr().out.encode()
+
+
+def test_type_ahead_into_password_prompt(capfd):
+    io_filter = make_filter()
+    io_filter.filter_output(io_filter.filter_input(b"w"))
+    io_filter.filter_input(KEY.ENTER)
+    type_keys(io_filter, b"s")  # typed before the prompt shows up
+    io_filter.filter_output(b"\r\nPassword: ")  # contains an "s", but is no echo
+    assert not io_filter.predictor.confirmed
+    type_keys(io_filter, b"ecret")
+    assert UNDERLINE not in capfd.readouterr().out.encode()
+
+
+def test_type_ahead_echoed_after_prompt():
+    io_filter = make_filter()
+    io_filter.filter_output(io_filter.filter_input(b"w"))
+    io_filter.filter_input(KEY.ENTER)
+    type_keys(io_filter, b"s")
+    io_filter.filter_output(b"\r\nUSER>\x1b[0ms")
+    assert io_filter.predictor.confirmed
+
+
+def test_auto_mode_follows_round_trip_time():
+    tracker = EchoTracker()
+    predictor = Predictor(tracker, "auto")
+    assert not predictor.enabled
+    tracker.samples.extend([50 * 10 ** 6] * 3)
+    predictor.unpredicted(line_end=True)
+    assert predictor.enabled
+    tracker.samples.clear()
+    tracker.samples.extend([10 ** 6] * 3)
+    predictor.unpredicted(line_end=True)
+    assert not predictor.enabled
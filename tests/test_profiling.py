@@ -0,0 +1,31 @@
+import pstats
+import pytest
+from iridescent.profiling import Profiler
+from iridescent.filters import IOFilter, DebugLogger
+from iridescent.history import HistoryManager
+
+
+@pytest.mark.parametrize("mode", ["sample", "cprofile"])
+def test_profiler(tmp_path, mode):
+    io_filter = IOFilter(None, DebugLogger(None), history_manager=HistoryManager(None))
+    profiler = Profiler(mode, interval=0.0001)
+    profiler.instrument(io_filter)
+    profiler.start()
+    for _ in range(20):  # until a sample lands in filter_input, with coarse profiling timers
+        for _ in range(500):
+            for key in [b"w", b" ", b"1", b"\r"]:
+                io_filter.filter_input(key)
+            io_filter.filter_output(b"1\r\nUSER>")
+        if mode == "cprofile" or any(name == "filter_input" for stack in profiler.samples for _, _, name in stack):
+            break
+    assert profiler.depth == 0
+
+    out = tmp_path / "session"
+    profiler.stop(out)
+    collapsed = (tmp_path / "session.collapsed").read_text().splitlines()
+    stats = pstats.Stats(str(tmp_path / "session.pstats")).stats
+    assert any(name == "filter_input" for _, _, name in stats)
+    assert any(frame.startswith("filter_input (") for line in collapsed for frame in line.rsplit(" ", 1)[0].split(";"))
+    for line in collapsed:
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0
@@ -0,0 +1,28 @@
+from iridescent.screen import screen
+from iridescent.keys import KEY, CTRL
+from iridescent.color_utils import FgColor
+from iridescent.filters import IOFilter, DebugLogger
+from iridescent.history import HistoryManager
+
+
+def test_escapes_merged_into_output(capfd):
+    io_filter = IOFilter(None, DebugLogger(None), history_manager=HistoryManager(None))
+    screen.take()
+    assert io_filter.filter_input(b"w") == b"w"
+    assert io_filter.filter_input(KEY.ENTER) == b"\r"
+    assert screen.pending
+    output = io_filter.filter_output(b"w\r\n")
+    assert output == FgColor.RED.bvalue + b"w\r\n"
+    assert not screen.pending
+    assert capfd.readouterr().out == ""
+
+
+def test_escapes_flushed_without_output(capfd):
+    io_filter = IOFilter(None, DebugLogger(None), history_manager=HistoryManager(None))
+    screen.take()
+    for key in [b"a", b"b", KEY.ESCAPE]:
+        io_filter.filter_output(io_filter.filter_input(key))
+    capfd.readouterr()
+    assert io_filter.filter_input(CTRL.T) == b""  # shows the echo latency, sends nothing to IRIS
+    assert not screen.pending
+    assert b"Echo round trip" in capfd.readouterr().out.encode()
@@ -0,0 +1,73 @@
+import pytest
+from iridescent.scrollback import ScrollbackStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    with ScrollbackStore(segment_size=64, n_segments=4, directory=tmp_path) as s:
+        yield s
+
+
+def test_scrollback_strips_escapes(store):
+    store.append(b"\x1b[31mred\x1b[0m line\r\n\x1b]0;title\x07next")
+    store.append(b" line\r\n")
+    assert store.line(0) == b"red line"
+    assert store.line(1) == b"next line"
+
+
+def test_scrollback_search(store):
+    store.append(b"USER>")
+    store.mark_command(b"zw ^a")
+    store.append(b'^a(1)="x"\r\n^a(2)="y"\r\nUSER>')
+    store.mark_command(b"w 1")
+    store.append(b"1\r\nUSER>")
+
+    assert store.search(r"\^a\(\d") == (1, b'^a(2)="y"', "zw ^a")
+    assert store.search() == (0, b'USER>^a(1)="x"', "zw ^a")
+    assert store.search() is None
+    assert store.search("1$") == (2, b"USER>1", "w 1")
+
+
+@pytest.mark.parametrize("n_lines", [10, 100, 1000])
+def test_scrollback_fixed_budget(tmp_path, n_lines):
+    with ScrollbackStore(segment_size=64, n_segments=4, max_lines=16, directory=tmp_path) as store:
+        for i in range(n_lines):
+            store.mark_command(b"w %d" % i)
+            store.append(b"line %d\r\n" % i)
+        assert len(store.line_starts) <= 20
+        assert len(store.commands) <= 21
+        assert store.command_of(store.first_line) == "w %d" % store.first_line
+        assert store.search(r"line \d+") == (n_lines - 1, b"line %d" % (n_lines - 1), "w %d" % (n_lines - 1))
+        # everything that can still be found lies within the last `capacity` bytes
+        found = []
+        match = store.search()
+        while match is not None:
+            found.append(match[1])
+            match = store.search()
+        assert sum(len(line) + 1 for line in found) <= store.capacity
+        assert found == [b"line %d" % i for i in range(n_lines - 2, n_lines - 2 - len(found), -1)]
+
+
+def test_incremental_search(store, capfdbinary):
+    from iridescent.keys import KEY, CTRL
+    from iridescent.filters import IOFilter, DebugLogger
+    from iridescent.history import HistoryManager
+
+    io_filter = IOFilter(None, DebugLogger(None), history_manager=HistoryManager(None), scrollback=store)
+    io_filter.filter_output(b"apple\r\nbanana\r\napricot\r\nUSER>")
+    io_filter.filter_input(KEY.ESCAPE)
+    capfdbinary.readouterr()
+
+    io_filter.filter_input(CTRL.F)
+    io_filter.filter_input(b"a")  # nothing is sent to IRIS, so the status is drawn right away
+    assert capfdbinary.readouterr().out == b"\r\n[3] > apricot\r\nUSER>\x1b[K"
+    # then the status is redrawn in place rather than below
+    for key, shown in [(b"n", b"[2] > banana"), (KEY.DELETE, b"[3] > apricot"), (b"p", b"[3] > apricot"),
+                       (b"p", b"[1] > apple"), (b"(", None)]:  # `ap(` is not a valid pattern yet
+        io_filter.filter_input(key)
+        message = capfdbinary.readouterr().out
+        assert message == (b"\x1b[1A\r" + shown + b"\x1b[K\r\nUSER>\x1b[K" if shown else b"")
+    io_filter.filter_input(KEY.DELETE)
+    io_filter.filter_input(KEY.ENTER)
+    assert capfdbinary.readouterr().out.startswith(b"\x1b[1A\r[1] > apple\x1b[K\r\n")
+    assert not io_filter.state_manager.command_pending
@@ -0,0 +1,52 @@
+import pytest
+from iridescent.textobjects import TextObjects, text_objects
+
+
+@pytest.mark.parametrize(
+    argnames=["line", "pos", "bracket", "count", "expected"],
+    argvalues=[
+        [b"f(a(b)c)", 0, b"(", 1, None],  # "|f(a(b)c)"
+        [b"f(a(b)c)", 1, b"(", 1, (1, 7)],  # "f|(a(b)c)"
+        [b"f(a(b)c)", 2, b")", 1, (1, 7)],  # "f(|a(b)c)"
+        [b"f(a(b)c)", 5, b"(", 1, (3, 5)],  # "f(a(b|)c)"
+        [b"f(a(b)c)", 6, b"(", 1, (1, 7)],  # "f(a(b)|c)"
+        [b"f(a(b)c)", 4, b"(", 2, (1, 7)],  # "f(a(|b)c)"
+        [b"f(a(b)c)", 4, b"(", 3, None],  # "f(a(|b)c)"
+        [b"f(a(b)c)", 4, b"[", 1, None],  # "f(a(|b)c)"
+        [b"((a)(b))", 5, b"(", 2, (0, 7)],  # "((a)(|b))", the pair before is a sibling
+        [b"((a)(b))", 5, b"(", 3, None],  # "((a)(|b))"
+    ]
+)
+def test_pair(line, pos, bracket, count, expected):
+    assert TextObjects(line).pair(pos, bracket, count) == expected
+
+
+def test_strings_hide_brackets():
+    line = b'w "a("")", f(x)'
+    objects = TextObjects(line)
+    assert objects.strings == [(2, 8)]
+    assert objects.string(5) == (2, 8)
+    assert objects.string(9) is None
+    assert objects.pair(4, b"(") is None
+    assert objects.match(12) == 14
+    assert objects.match(4) == 4  # the bracket is within a string
+
+
+def test_unmatched_brackets():
+    objects = TextObjects(b"(a)) ((b)")
+    assert objects.match(0) == 2
+    assert objects.match(3) == 3
+    assert objects.match(5) == 5
+    assert objects.pair(7, b"(") == (6, 8)
+
+
+def test_word():
+    objects = TextObjects(b"set x=1  ")
+    assert objects.word(1) == (0, 2)
+    assert objects.word(5) == (5, 5)
+    assert objects.word(5, capital=True) == (4, 6)
+    assert objects.word(8) == (7, 8)
+
+
+def test_cached_per_line():
+    assert text_objects(b"(a)") is text_objects(b"(a)")
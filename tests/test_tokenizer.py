@@ -0,0 +1,49 @@
+import os
+import time
+import pytest
+from iridescent.keys import KEY, OPTION, keymap
+from iridescent.tokenizer import KeyTokenizer
+from iridescent.filters import IOFilter, DebugLogger
+from iridescent.history import HistoryManager
+
+
+@pytest.mark.parametrize(
+    argnames=["data", "expected"],
+    argvalues=[
+        [b"\x1bdw", [b"\x1b", b"d", b"w"]],
+        [b"ab\x1b[D\x1b[Dc", [b"a", b"b", KEY.LEFT, KEY.LEFT, b"c"]],
+        [b"\x1bb\x1b\x7f", [OPTION.LEFT, OPTION.DELETE]],
+        [b"\x1b[1;9A\r", [OPTION.UP, b"\r"]],
+        [b"\x1b[15~x", [b"\x1b[15~", b"x"]],  # not in the keymap, but kept whole
+        [b"\xc3\xa9a", [b"\xc3\xa9", b"a"]],
+        [b"\x1b", [b"\x1b"]],
+        [b"\x1b[", [b"\x1b", b"["]],
+    ]
+)
+def test_split_into_keys(data, expected):
+    assert KeyTokenizer(keymap()).feed(data) == expected
+
+
+def test_waits_for_the_rest_of_a_key():
+    read_fd, write_fd = os.pipe()
+    try:
+        tokenizer = KeyTokenizer(keymap(), fd=read_fd, timeout=1)
+        os.write(write_fd, b"[Dx")
+        assert tokenizer.feed(b"a\x1b") == [b"a", KEY.LEFT, b"x"]
+
+        tokenizer.timeout = 0.01
+        start = time.monotonic()
+        assert tokenizer.feed(b"\x1b") == [KEY.ESCAPE]
+        assert time.monotonic() - start < 1
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
+
+
+def test_burst_applied_in_order():
+    io_filter = IOFilter(None, DebugLogger(None), history_manager=HistoryManager(None))
+    io_filter.filter_output(b"\r\nUSER>")
+    # typed characters are sent together, as a paste; the escape and `dw` are applied as keys
+    assert io_filter.filter_input(b"write 1") == b"write 1"
+    assert io_filter.filter_input(b"\x1b0dw") == KEY.LEFT + KEY.LEFT * 6 + KEY.RIGHT * 6 + KEY.DELETE * 6
+    assert (io_filter.current_line, io_filter.cursor_pos) == (b"1", 0)
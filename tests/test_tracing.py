@@ -0,0 +1,52 @@
+import json
+from iridescent.tracing import Tracer, tracer
+from iridescent.filters import IOFilter, DebugLogger
+from iridescent.history import HistoryManager
+
+
+def test_tracer_ring_overflow(tmp_path):
+    t = Tracer(capacity=8)
+    t.start(tmp_path / "trace.jsonl", flush_interval=3600)
+    for i in range(20):
+        t.record("key", b"%d" % i)
+    t.stop()
+    events = [json.loads(line) for line in (tmp_path / "trace.jsonl").read_text().splitlines()]
+    assert events[0]["event"] == "dropped" and events[0]["data"] == 12
+    assert [e["data"] for e in events[1:]] == [str(i) for i in range(12, 20)]
+    assert all(a["t"] <= b["t"] for a, b in zip(events[1:], events[2:]))
+
+
+def test_tracer_session(tmp_path):
+    io_filter = IOFilter(None, DebugLogger(None), history_manager=HistoryManager(None))
+    tracer.start(tmp_path / "trace.jsonl")
+    try:
+        io_filter.filter_input(b"w")
+        io_filter.filter_output(b"w")
+        io_filter.filter_input(b"\r")
+        io_filter.filter_output(b"\r\nUSER>")
+    finally:
+        tracer.stop()
+    events = [json.loads(line) for line in (tmp_path / "trace.jsonl").read_text().splitlines()]
+    assert [e["event"] for e in events] == [
+        "key", "handler", "send", "output", "key", "handler", "send", "output", "prompt",
+    ]
+    assert events[1]["data"] == "PrintableHandler"
+    assert events[-1]["data"] == "USER"
+
+
+def test_tracer_redacts_away_from_prompts(tmp_path):
+    io_filter = IOFilter(None, DebugLogger(None), history_manager=HistoryManager(None))
+    tracer.start(tmp_path / "trace.jsonl")
+    try:
+        io_filter.filter_output(b"\r\nUSER>")
+        io_filter.filter_input(b"w")
+        io_filter.filter_input(b"\r")
+        io_filter.filter_output(b"w\r\nPassword: ")
+        io_filter.filter_input(b"secret")
+        io_filter.filter_input(b"\r")
+    finally:
+        tracer.stop()
+    text = (tmp_path / "trace.jsonl").read_text()
+    events = [json.loads(line) for line in text.splitlines()]
+    assert [e["data"] for e in events if e["event"] in ("key", "send")] == ["w", "w", "\r", "\r", 6, 6, 1, 1]
+    assert "secret" not in text
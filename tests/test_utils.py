@@ -330,3 +330,35 @@ def test_vim_pair(npos, expected, replace):
             vim_pair(content, npos, False)
     else:
         assert vim_pair(content, npos, False) == expected
+
+
+def test_multi_line_helpers():
+    from iridescent.utils import row_col, vertical_position, vim_line_begin, vim_line_end
+    content = b"for {\n  w 1\n}"
+    assert row_col(content, 9) == (1, 3)
+    assert vertical_position(content, 9, -1) == 3
+    assert vertical_position(content, 3, 2) == 13
+    assert vertical_position(content, 3, -1) == -1
+    assert (vim_line_begin(content, 9), vim_line_end(content, 9)) == (6, 10)
+
+
+@pytest.mark.parametrize(
+    argnames=["content", "depth"],
+    argvalues=[
+        [b"for i=1:3 {", 1],
+        [b"for i=1:3 { write i }", 0],
+        [b'try { write "{"', 1],
+        [b"if x { // }", 1],
+        [b"if x {\n  if y {\n  }", 1],
+    ]
+)
+def test_open_blocks(content, depth):
+    from iridescent.utils import open_blocks
+    assert open_blocks(content) == depth
+
+
+def test_join_block():
+    from iridescent.utils import join_block
+    assert join_block(b"write 1") == b"write 1"
+    assert join_block(b'for i=1:3 {  ; loop\n  write i, "//"  // print\n\n  quit\n}') == \
+           b'for i=1:3 {  write i, "//"  quit  }'
@@ -137,7 +137,7 @@ def test_delete(arg, pos, exp_right, exp_delete, exp_clipboard):
     line = b"I'm p.name !"
     action = Delete()
     output, (clp,) = action.act(arg, line, pos)
-    assert output == [Op.RIGHT] * exp_right + [Op.DELETE] * exp_delete
+    assert list(output) == [Op.RIGHT] * exp_right + [Op.DELETE] * exp_delete
     assert clp.args == (exp_clipboard.encode(),)
 
 
@@ -188,7 +188,7 @@ def test_delete_in_between(arg, pos, exp_right, exp_delete, exp_clipboard):
     line = b"(hey)"
     action = DeleteInBetween()
     output, side_effects = action.act(arg, line, pos)
-    assert output == exp_right * [Op.RIGHT] + exp_delete * [Op.DELETE]
+    assert list(output) == exp_right * [Op.RIGHT] + exp_delete * [Op.DELETE]
     if exp_clipboard is None:
         assert side_effects == []
     else:
@@ -196,6 +196,29 @@ def test_delete_in_between(arg, pos, exp_right, exp_delete, exp_clipboard):
         assert clp.args == (exp_clipboard.encode(),)
 
 
+@pytest.mark.parametrize(
+    argnames=["action", "arg", "pos", "exp_right", "exp_delete", "exp_clipboard"],
+    argvalues=[
+        (b"di", b"(", 6, 1, 5, "a(b)c"),  # "f(a(b)|c)"
+        (b"di", b"(", 4, 1, 1, "b"),  # "f(a(|b)c)"
+        (b"da", b"(", 4, 2, 3, "(b)"),  # "f(a(|b)c)"
+        (b"da", b")", 6, 2, 7, "(a(b)c)"),  # "f(a(b)|c)"
+        (b"di", b'"', 12, 3, 4, 'x""y'),  # 'f(a(b)c), "x|""y"'
+        (b"da", b'"', 12, 4, 6, '"x""y"'),  # 'f(a(b)c), "x|""y"'
+        (b"da", b"w", 0, 1, 1, "f"),  # "|f(a(b)c)"
+        (b"da", b"w", 10, 1, 2, ' "'),  # 'f(a(b)c), |"x""y"'
+        (b"da", b"w", 9, 2, 2, ' "'),  # 'f(a(b)c),| "x""y"'
+    ]
+)
+def test_text_objects_nest(action, arg, pos, exp_right, exp_delete, exp_clipboard):
+    from iridescent.vim_actions import get_action, ActionEnum
+    line = b'f(a(b)c), "x""y"'
+    output, side_effects = get_action(ActionEnum(action))().act(arg, line, pos)
+    assert list(output) == exp_right * [Op.RIGHT] + exp_delete * [Op.DELETE]
+    clp, = side_effects
+    assert clp.args == (exp_clipboard.encode(),)
+
+
 @pytest.mark.parametrize(
     argnames=['arg', 'pos', 'exp_count', 'exp_clipboard'],
     argvalues=[
@@ -223,9 +246,136 @@ def test_delete_till(arg, pos, exp_count, exp_clipboard):
     line = b"ABCDBCD"
     action = DeleteTill()
     output, side_effects = action.act(arg, line, pos)
-    assert output == [Op.RIGHT] * exp_count + [Op.DELETE] * exp_count
+    assert list(output) == [Op.RIGHT] * exp_count + [Op.DELETE] * exp_count
+    if exp_clipboard is None:
+        assert side_effects == []
+    else:
+        clp, = side_effects
+        assert clp.args == (exp_clipboard.encode(),)
+
+
+@pytest.mark.parametrize(
+    argnames=['action_name', 'arg', 'count', 'pos', 'exp_right', 'exp_delete', 'exp_clipboard'],
+    argvalues=[
+        ['Delete', b'w', 3, 0, 4, 4, "I'm "],  # "|I'm p.name !"
+        ['Delete', b'W', 2, 0, 11, 11, "I'm p.name "],
+        ['Delete', b'W', 9, 0, 12, 12, "I'm p.name !"],  # stops at the end of the line
+        ['Delete', b'b', 2, 6, 0, 2, "p."],  # "I'm p.|name !"
+        ['DeleteFind', b'm', 2, 0, 9, 9, "I'm p.nam"],
+        ['DeleteFind', b'm', 3, 0, 0, 0, None],  # there is no third `m`
+        ['DeleteTill', b'm', 2, 0, 8, 8, "I'm p.na"],
+        ['DeleteOneChar', None, 4, 9, 3, 3, "e !"],  # `4x` near the end of the line
+    ]
+)
+def test_counts(action_name, arg, count, pos, exp_right, exp_delete, exp_clipboard):
+    from iridescent import vim_actions
+    line = b"I'm p.name !"
+    output, side_effects = getattr(vim_actions, action_name)(count).act(arg, line, pos)
+    assert list(output) == [Op.RIGHT] * exp_right + [Op.DELETE] * exp_delete
     if exp_clipboard is None:
         assert side_effects == []
     else:
         clp, = side_effects
         assert clp.args == (exp_clipboard.encode(),)
+
+
+def test_counts_in_normal_mode():
+    from iridescent.keys import KEY
+    from iridescent.filters import IOFilter, DebugLogger
+    from iridescent.history import HistoryManager
+    from iridescent.screen import screen
+
+    io_filter = IOFilter(None, DebugLogger(None), history_manager=HistoryManager(None))
+    for key in b"set a = 1, b = 2, c = 3":
+        io_filter.filter_input(bytes([key]))
+    io_filter.filter_input(KEY.ESCAPE)
+    screen.take()
+
+    assert io_filter.filter_input(b"0") == KEY.LEFT * 22
+    io_filter.filter_input(b"3")
+    assert io_filter.filter_input(b"w") == KEY.RIGHT * 8  # to "1"
+    for key in b"2d3w":  # 6 words: "1, b = 2, "
+        io_filter.filter_input(bytes([key]))
+    assert io_filter.current_line == b"set a = c = 3"
+    for key in b"10x":  # one send, not ten
+        output = io_filter.filter_input(bytes([key]))
+    assert output == KEY.RIGHT * 5 + KEY.DELETE * 5 + KEY.LEFT
+    assert io_filter.current_line == b"set a = "
+    screen.take()
+
+
+def test_macros():
+    from iridescent.keys import KEY
+    from iridescent.filters import IOFilter, DebugLogger
+    from iridescent.history import HistoryManager
+    from iridescent.screen import screen
+
+    io_filter = IOFilter(None, DebugLogger(None), history_manager=HistoryManager(None))
+    for key in [*b"abcdefgh", KEY.ESCAPE, b"0"]:
+        io_filter.filter_input(key if isinstance(key, bytes) else bytes([key]))
+
+    for key in b"qa~lq":
+        io_filter.filter_input(bytes([key]))
+    assert io_filter.state_manager.registers[b"a"] == [b"~", b"l"]
+    assert io_filter.current_line == b"Abcdefgh" and io_filter.cursor_pos == 2
+
+    io_filter.filter_input(b"2")
+    io_filter.filter_input(b"@")
+    output = io_filter.filter_input(b"a")  # the whole replay is sent at once
+    assert output.count(KEY.DELETE) == 2 and b"C" in output and b"E" in output
+    assert io_filter.current_line == b"AbCdEfgh" and io_filter.cursor_pos == 6
+
+    io_filter.filter_input(b"@")
+    io_filter.filter_input(b"@")
+    assert io_filter.current_line == b"AbCdEfGh"
+
+    # insert mode keys are recorded too
+    for key in [b"q", b"b", b"A", b";", KEY.ESCAPE, b"q", b"@", b"b"]:
+        io_filter.filter_input(key)
+    assert io_filter.current_line == b"AbCdEfGh;;"
+    screen.take()
+
+
+def test_command_trie():
+    from iridescent.vim_actions import ActionEnum, COMMAND_TRIE, get_command
+    from iridescent.editor import EditorStateManger
+
+    node = COMMAND_TRIE[b"d"]
+    assert node.action == ActionEnum.d and node.command.N_ARGS == 1
+    assert node.children[b"i"].action == ActionEnum.di and node.children[b"i"].command is not None
+    assert b"z" not in COMMAND_TRIE
+    # commands are shared, per count
+    assert get_command(ActionEnum.x) is get_command(ActionEnum.x) is COMMAND_TRIE[b"x"].command
+    assert get_command(ActionEnum.x, 3).count == 3
+
+    class _Filter:
+        pass
+
+    esm = EditorStateManger(_Filter())
+    esm.set_normal()
+    line = b"foo(bar, baz)"
+    for key in [b"d", b"i"]:
+        assert esm.normal_buffer(key, line, 5) is None
+        assert esm.command_pending
+    assert esm.normal_buffer(b"(", line, 5)
+    assert not esm.command_pending
+    assert esm.normal_buffer(b"z", line, 5) is None and not esm.command_pending  # not a command
+
+
+def test_repeat_shares_commands(monkeypatch):
+    from iridescent import vim_actions
+    from iridescent.vim_actions import ActionEnum
+    calls, shared = [], vim_actions.get_command
+
+    def get_command(action, count=1):
+        calls.append((action, count))
+        return shared(action, count)
+
+    line = b"abcdef"
+    vim_actions.get_command(ActionEnum.x, 2).act(None, line, 0)
+    monkeypatch.setattr(vim_actions, "get_command", get_command)
+    output, _ = vim_actions.get_command(ActionEnum.dot).act(None, line, 0)
+    assert list(output) == [Op.RIGHT] * 2 + [Op.DELETE] * 2
+    output, _ = vim_actions.get_command(ActionEnum.dot, 3).act(None, line, 0)
+    assert list(output) == [Op.RIGHT] * 3 + [Op.DELETE] * 3
+    assert calls == [(ActionEnum.dot, 1), (ActionEnum.x, 2), (ActionEnum.dot, 3), (ActionEnum.x, 3)]